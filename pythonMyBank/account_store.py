@@ -0,0 +1,311 @@
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import gc
+import json
+import os
+import threading
+import zlib
+import metrics
+from backends import StorageBackend
+from journal import Journal
+from locking import FileLock
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+CHECKPOINT_EVERY = 1000
+# transactions of more operations than this are applied with the garbage
+# collector paused
+LARGE_TRANSACTION = 10000
+
+
+# ─── ACCOUNT STORE ──────────────────────────────────────────────────────────────
+
+
+class AccountStore(StorageBackend):
+    """
+    Keeps the accounts of the data file in memory so every operation
+    does not have to parse the whole file again.
+
+    The data file is a snapshot of all the accounts. Changes are not
+    written into it directly: they are appended to a journal next to it
+    (bank.json.journal) and folded back into the snapshot by a checkpoint
+    every CHECKPOINT_EVERY transactions. So the cost of a transfer grows
+    with the size of the change, not with the number of accounts.
+
+    A data file named *.snap (or any with binary=True) is kept in the binary snapshot format of
+    snapshot.py instead of JSON: smaller, and quicker to read.
+
+    The files are only read again when they changed on disk, i.e. when
+    someone else wrote them. If only the journal grew, just the new
+    entries are read. Writes go through the store, which keeps the
+    in-memory copy as the current state, so a read after a write never
+    parses the file.
+
+    Writers from several threads and processes are serialized with a lock
+    file next to the data file (bank.json.lock): a writer first catches up
+    with the journal entries of the others, then appends its own.
+
+    Records are never changed in place: a change replaces the record of
+    that account with a new dictionary. The dictionary handed out by
+    load() is the cached one and must be treated as read-only; changes go
+    through put(), delete(), transfer() or save().
+    """
+
+    def __init__(self, path, checkpoint_every=CHECKPOINT_EVERY, binary=None):
+        """
+        Creates the store for a data file. Nothing is read until the
+        accounts are requested for the first time. The format of the file
+        follows its extension unless binary says otherwise.
+        """
+        super().__init__()
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        self.journal = Journal(path + ".journal")
+        self.binary = path.endswith(".snap") if binary is None else binary
+        self.version = 0
+        self._users = None
+        self._signature = None
+        self._journal_offset = 0
+        self._journal_entries = 0
+        self._lock = threading.RLock()
+        self._writer_lock = None
+
+    # ─── READING ────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _stat(path):
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _file_signature(self):
+        """
+        What is used to notice that the files changed on disk
+        """
+        return self._stat(self.path), self._stat(self.journal.path)
+
+    @metrics.timed("store.read_snapshot")
+    def _read_snapshot(self):
+        """
+        Parses the data file and returns it with its checksum.
+        A none existent file is an empty bank.
+        """
+        if not os.path.exists(self.path):
+            return {}, 0
+        with open(self.path, "rb") as f:
+            data = f.read()
+        if self.binary:
+            import snapshot
+            users = snapshot.loads(data)
+        else:
+            users = json.loads(data)
+        metrics.count("bytes_read", len(data))
+        metrics.count("records_read", len(users))
+        return users, zlib.crc32(data)
+
+    @metrics.timed("store.replay_journal")
+    def _replay(self, notify=True):
+        """
+        Applies the journal entries written since the last read
+        """
+        transactions, self._journal_offset = self.journal.read(self.journal.base, self._journal_offset)
+        for ops in transactions:
+            changes = self._apply(ops)
+            if notify and self._listeners:
+                self._notify(changes)
+        self._journal_entries += len(transactions)
+        metrics.count("journal_entries_read", len(transactions))
+
+    def load(self):
+        """
+        Returns all the accounts, keyed by account number
+        """
+        signature = self._file_signature()
+        if self._users is not None and signature == self._signature:
+            return self._users
+        with self._lock:
+            return self._reload(self._file_signature())
+
+    def _reload(self, signature):
+        """
+        Brings the cached accounts up to date with the files
+        """
+        if self._users is not None and signature == self._signature:
+            return self._users
+        journal_grew = (self._users is not None and signature[0] == self._signature[0]
+                        and signature[1] is not None and self._signature[1] is not None
+                        and signature[1][0] == self._signature[1][0])
+        if not journal_grew:
+            self.journal.close()
+            self._users, self.journal.base = self._read_snapshot()
+            self._journal_offset = 0
+            self._journal_entries = 0
+            self._replay(notify=False)
+            self._notify_reset(self._users)
+        else:
+            self._replay()
+        self._signature = signature
+        self.version += 1
+        return self._users
+
+    # ─── WRITING ────────────────────────────────────────────────────────────
+
+    def writing(self):
+        """
+        The lock every writer holds, across threads and processes
+        """
+        with self._lock:
+            if self._writer_lock is None:
+                self._writer_lock = FileLock(self.path + ".lock")
+        return self._writer_lock
+
+    def _apply(self, ops):
+        """
+        Applies the operations of one transaction to the cached accounts
+        and returns the changes as (account_number, old, new) tuples
+        """
+        users = self._users
+        changes = []
+        # the records are flat dictionaries, which the collector has nothing
+        # to find in, but while a large transaction creates them it would go
+        # through all the accounts again and again
+        paused = len(ops) > LARGE_TRANSACTION and gc.isenabled()
+        if paused:
+            gc.disable()
+        try:
+            self._apply_ops(users, ops, changes)
+        finally:
+            if paused:
+                gc.enable()
+        return changes
+
+    @staticmethod
+    def _apply_ops(users, ops, changes):
+        for op in ops:
+            kind, account_number = op[0], op[1]
+            old = users.get(account_number)
+            if kind == "delta":
+                record = dict(old)
+                record["balance"] += op[2]
+                users[account_number] = record
+            elif kind == "put":
+                record = users[account_number] = op[2]
+            else:
+                users.pop(account_number, None)
+                record = None
+            changes.append((account_number, old, record))
+        return changes
+
+    @metrics.timed("store.commit")
+    def commit_ops(self, ops, durable=True):
+        """
+        Applies a transaction to the accounts and appends it to the
+        journal. With durable=False the fsync is left to a later commit(),
+        which lets a batch of transactions share one.
+        """
+        with self._lock, self.writing():
+            self.load()
+            if self._journal_offset == 0:
+                # no journal yet, or a stale one left by an interrupted checkpoint
+                self.journal.reset(self.journal.base)
+            elif self._signature[1][1] != self._journal_offset:
+                self.journal.truncate(self._journal_offset)
+            changes = self._apply(ops)
+            metrics.count("records_written", len(changes))
+            if self._listeners:
+                self._notify(changes)
+            seq, self._journal_offset = self.journal.append(ops)
+            self._journal_entries += 1
+            self._signature = self._file_signature()
+            self.version += 1
+            if self._journal_entries >= self.checkpoint_every:
+                self.checkpoint()
+        if durable:
+            self.journal.commit(seq)
+
+    def commit(self):
+        """
+        Makes every transaction appended so far durable
+        """
+        self.journal.commit()
+
+    def put(self, account_number, record, durable=True):
+        """
+        Creates or replaces an account
+        """
+        self.commit_ops([["put", account_number, record]], durable)
+
+    def put_many(self, records, durable=True):
+        """
+        Creates or replaces many accounts as one journal transaction
+        """
+        self.commit_ops([["put", number, record] for number, record in records.items()], durable)
+
+    def delete(self, account_number, durable=True):
+        """
+        Removes an account
+        """
+        self.commit_ops([["del", account_number]], durable)
+
+    def transfer(self, sender_number, receiver_number, amount, durable=True):
+        """
+        Moves money between two accounts as one transaction. The checks
+        (existing accounts, enough balance) are up to the caller.
+        """
+        self.commit_ops([["delta", sender_number, -amount], ["delta", receiver_number, amount]], durable)
+
+    def apply_deltas(self, deltas, durable=True):
+        """
+        Adds to the balance of many accounts as one journal transaction
+        """
+        self.commit_ops([["delta", number, amount] for number, amount in deltas.items()], durable)
+
+    def save(self, users):
+        """
+        Replaces all the accounts, writing them as a new snapshot
+        """
+        with self._lock, self.writing():
+            self._write_snapshot(users)
+            self._users = users
+            self._signature = self._file_signature()
+            self.version += 1
+            self._notify_reset(users)
+
+    def checkpoint(self):
+        """
+        Writes the current accounts as a new snapshot and starts an
+        empty journal on top of it.
+        """
+        with self._lock, self.writing():
+            self._write_snapshot(self.load())
+            self._signature = self._file_signature()
+
+    @metrics.timed("store.write_snapshot")
+    def _write_snapshot(self, users):
+        """
+        Writes the snapshot into a temporary file that then replaces the
+        data file, so a crash never leaves half a file behind. The journal
+        is reset afterwards; a crash in between leaves a journal whose
+        header does not match the new snapshot, which is then ignored.
+        """
+        self.journal.close()
+        if self.binary:
+            import snapshot
+            data = snapshot.dumps(users)
+        else:
+            data = json.dumps(users).encode()
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self.path)
+        metrics.count("bytes_written", len(data))
+        metrics.count("records_written", len(users))
+        self.journal.reset(zlib.crc32(data))
+        self._journal_offset = 0
+        self._journal_entries = 0
+
+    def close(self):
+        self.journal.close()
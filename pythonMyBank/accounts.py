@@ -0,0 +1,180 @@
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+from datetime import datetime
+import metrics
+from allocator import AccountNumberAllocator
+from listing import PAGE_SIZE, top_by_balance
+from sort_engine import sort_records, text_binary_search
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+_ALLOCATORS = {}
+
+
+# ─── ACCOUNT NUMBER ─────────────────────────────────────────────────────────────
+
+
+def allocator_for(store):
+    """
+    The account number allocator of a bank, shared by everything in
+    the process that opens accounts in it
+    """
+    if store.path not in _ALLOCATORS:
+        _ALLOCATORS[store.path] = AccountNumberAllocator(store)
+    return _ALLOCATORS[store.path]
+
+
+def generate_account_number(store):
+    """
+    Generates a new unique account number. The bank
+    prefix number is 6060 5498, the 8 other digits come
+    from the allocator and were never handed out before
+    """
+    return allocator_for(store).allocate()
+
+
+# ─── OPENING ACCOUNTS ───────────────────────────────────────────────────────────
+
+
+def make_account_record(full_name, balance, gender, city, phone_number, age, country):
+    """
+    Builds the record of a new account, created today
+    """
+    return {
+        "full_name": full_name,
+        "gender": gender,
+        "balance": balance,
+        "account_creation_date": datetime.today().strftime('%Y-%m-%d'),
+        "city": city,
+        "phone_number": phone_number,
+        "age": age,
+        "country": country
+    }
+
+
+def open_account(engine, full_name, balance, gender, city, phone_number, age, country):
+    """
+    Opens a new account through the transaction engine and returns
+    its account number
+    """
+    account_number = generate_account_number(engine.store)
+    record = make_account_record(full_name, balance, gender, city, phone_number, age, country)
+    engine.create(account_number, record)
+    return account_number
+
+
+def create_users_bulk(engine, users):
+    """
+    Opens many accounts at once. users is a list of dictionaries with
+    the arguments of open_account (full_name, balance, gender, city,
+    phone_number, age, country). The account numbers are allocated in
+    one go and all the accounts are persisted as a single change.
+    Returns the new account numbers, in the order of users.
+    """
+    numbers = allocator_for(engine.store).allocate_many(len(users))
+    records = {}
+    for number, user in zip(numbers, users):
+        records[number] = make_account_record(user["full_name"], user["balance"], user["gender"], user["city"],
+                                              user["phone_number"], user["age"], user["country"])
+    engine.create_many(records)
+    return numbers
+
+
+# ─── LISTING AND SEARCH ─────────────────────────────────────────────────────────
+
+
+@metrics.timed("accounts.users_as_list")
+def users_as_list(store):
+    """
+    Returns the accounts as a list of records that carry their
+    account_number. The records are copies, the cached accounts of the
+    store are not touched.
+    """
+    result = []
+    # dict() copies the accounts in one step, so a writer thread adding
+    # an account meanwhile cannot break the iteration
+    users = dict(store.load())
+    for user_account_number in users:
+        user_data = dict(users[user_account_number])
+        user_data["account_number"] = user_account_number
+        result.append(user_data)
+    return result
+
+
+def accounts_sorted_by(store, field):
+    """
+    All the accounts, sorted by a field
+    """
+    return sort_records(users_as_list(store), field)
+
+
+def find_accounts(store, indexes, conditions):
+    """
+    All the accounts matching the search conditions (see
+    SecondaryIndexes.search), as records that carry their account_number,
+    in account number order
+    """
+    result = []
+    for account_number in indexes.search(conditions):
+        user = store.get(account_number)
+        if user is not None:
+            result.append(dict(user, account_number=account_number))
+    return result
+
+
+def find_similar_accounts(store, fuzzy_index, query, k=10):
+    """
+    The k accounts whose name is the most similar to the query (see
+    FuzzyNameIndex), as records that carry their account_number and
+    similarity, the best match first
+    """
+    result = []
+    for score, account_number in fuzzy_index.search(query, k):
+        user = store.get(account_number)
+        if user is not None:
+            result.append(dict(user, account_number=account_number, similarity=score))
+    return result
+
+
+def accounts_page(store, listing, field, offset=0, limit=PAGE_SIZE, descending=False, after=None):
+    """
+    One page of the accounts sorted by a field (see SortedListing.page),
+    as records that carry their account_number. Only the accounts of the
+    page are read.
+    """
+    return accounts_of_entries(store, listing.page(field, offset, limit, descending, after))
+
+
+def accounts_of_entries(store, entries):
+    """
+    The accounts of (value, account number) listing entries, as records
+    that carry their account_number, leaving out those closed since
+    """
+    result = []
+    for _, account_number in entries:
+        user = store.get(account_number)
+        if user is not None:
+            result.append(dict(user, account_number=account_number))
+    return result
+
+
+def top_accounts_by_balance(store, count, largest=True):
+    """
+    The count accounts with the highest (or lowest) balance, as records
+    that carry their account_number
+    """
+    try:
+        pairs = top_by_balance(store.load(), count, largest)
+    except RuntimeError:
+        # an account was opened or closed meanwhile, go over a copy
+        pairs = top_by_balance(dict(store.load()), count, largest)
+    return [dict(user, account_number=account_number) for account_number, user in pairs]
+
+
+def search_by(store, field, query):
+    """
+    Searches the "query" in the "field" of the accounts, ignoring case and
+    spaces. Returns the matching account or None.
+    """
+    users = accounts_sorted_by(store, field)
+    index = text_binary_search(users, field, query)
+    return None if index == -1 else users[index]
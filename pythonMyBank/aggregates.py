@@ -0,0 +1,120 @@
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import heapq
+import math
+from collections import Counter
+
+
+# ─── RUNNING AGGREGATES ─────────────────────────────────────────────────────────
+
+
+class BalanceAggregates:
+    """
+    Statistics of the account balances kept up to date change by change,
+    so asking for them does not look at the accounts at all.
+
+    Subscribed to a storage backend, it gets every created, removed or
+    changed account. It keeps the count and the sum, the mean and the
+    sum of squared differences from the mean with Welford's method (which
+    also works backwards when a balance is removed), and the smallest
+    and largest balance with a min-heap and a max-heap. Removed balances
+    stay in the heaps until they reach the top and are then skipped.
+    """
+
+    def __init__(self):
+        self.reset({})
+
+    # ─── LISTENER ───────────────────────────────────────────────────────────
+
+    def reset(self, users):
+        """
+        Recomputes everything from all the accounts
+        """
+        self.count = 0
+        self.total = 0.0
+        self._mean = 0.0
+        self._squares = 0.0
+        self._live = Counter()
+        self._min_heap = []
+        self._max_heap = []
+        for user in users.values():
+            self._add(user["balance"])
+
+    def apply_changes(self, changes):
+        for _, old, new in changes:
+            if old is not None:
+                self._remove(old["balance"])
+            if new is not None:
+                self._add(new["balance"])
+
+    # ─── UPDATES ────────────────────────────────────────────────────────────
+
+    def _add(self, balance):
+        self.count += 1
+        self.total += balance
+        delta = balance - self._mean
+        self._mean += delta / self.count
+        self._squares += delta * (balance - self._mean)
+        self._live[balance] += 1
+        heapq.heappush(self._min_heap, balance)
+        heapq.heappush(self._max_heap, -balance)
+        if len(self._min_heap) > 2 * self.count + 64:
+            self._compact()
+
+    def _remove(self, balance):
+        if self.count <= 1:
+            self.reset({})
+            return
+        old_mean = self._mean
+        self.count -= 1
+        self.total -= balance
+        self._mean = (old_mean * (self.count + 1) - balance) / self.count
+        self._squares = max(0.0, self._squares - (balance - old_mean) * (balance - self._mean))
+        self._live[balance] -= 1
+        if self._live[balance] == 0:
+            del self._live[balance]
+
+    def _compact(self):
+        """
+        Rebuilds the heaps from the live balances, dropping the removed
+        ones that piled up
+        """
+        self._min_heap = list(self._live)
+        heapq.heapify(self._min_heap)
+        self._max_heap = [-balance for balance in self._live]
+        heapq.heapify(self._max_heap)
+
+    # ─── QUERIES ────────────────────────────────────────────────────────────
+
+    def maximum(self):
+        while self._max_heap and -self._max_heap[0] not in self._live:
+            heapq.heappop(self._max_heap)
+        return -self._max_heap[0] if self._max_heap else None
+
+    def minimum(self):
+        while self._min_heap and self._min_heap[0] not in self._live:
+            heapq.heappop(self._min_heap)
+        return self._min_heap[0] if self._min_heap else None
+
+    def mean(self):
+        return self._mean if self.count else None
+
+    def variance(self):
+        """
+        The sample variance (divided by count - 1, like pandas)
+        """
+        return self._squares / (self.count - 1) if self.count > 1 else None
+
+    def std(self):
+        variance = self.variance()
+        return None if variance is None else math.sqrt(variance)
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.mean(),
+            "min": self.minimum(),
+            "max": self.maximum(),
+            "variance": self.variance(),
+            "std": self.std(),
+        }
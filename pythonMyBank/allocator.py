@@ -0,0 +1,98 @@
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import json
+import os
+import random
+from locking import FileLock
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+PREFIX = "60605498"
+HALF = 10 ** 4
+SPACE = HALF * HALF
+ROUNDS = 4
+
+
+# ─── FEISTEL PERMUTATION ────────────────────────────────────────────────────────
+
+
+def feistel(index, keys):
+    """
+    Maps a number of the 8-digit space onto another one, one-to-one.
+    The number is split into two 4-digit halves that are mixed over a
+    few rounds; every round can be undone, so two different inputs can
+    never give the same output.
+    """
+    left, right = divmod(index, HALF)
+    for key in keys:
+        left, right = right, (left + ((right * 2654435761 + key) >> 7)) % HALF
+    return left * HALF + right
+
+
+# ─── ALLOCATOR ──────────────────────────────────────────────────────────────────
+
+
+class AccountNumberAllocator:
+    """
+    Hands out account numbers that are guaranteed to be unique.
+
+    The numbers are the bank prefix followed by a Feistel permutation of
+    a counter, so they look random but the same counter value can never
+    come out twice. The counter and the permutation keys are kept in a
+    small state file next to the data (bank.json.seq), updated under a
+    lock file, so several processes share the sequence. Numbers already
+    taken by accounts opened before the allocator existed are skipped.
+    """
+
+    def __init__(self, store, state_path=None):
+        self.store = store
+        self.state_path = state_path or store.path + ".seq"
+        self._lock = FileLock(self.state_path + ".lock")
+
+    def _read_state(self):
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r") as f:
+                return json.loads(f.read())
+        rng = random.SystemRandom()
+        return {"next": 0, "keys": [rng.randrange(1 << 30) for _ in range(ROUNDS)]}
+
+    def _write_state(self, state):
+        temporary_path = self.state_path + ".tmp"
+        with open(temporary_path, "w") as f:
+            f.write(json.dumps(state))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self.state_path)
+
+    def _reserve(self, count):
+        """
+        Reserves the next count positions of the sequence and returns
+        the first one and the permutation keys
+        """
+        with self._lock:
+            state = self._read_state()
+            start = state["next"]
+            if start + count > SPACE:
+                raise RuntimeError("The account number space is exhausted")
+            state["next"] = start + count
+            self._write_state(state)
+        return start, state["keys"]
+
+    def allocate_many(self, count):
+        """
+        Returns count new account numbers with a single update of the
+        state file
+        """
+        numbers = []
+        while len(numbers) < count:
+            missing = count - len(numbers)
+            start, keys = self._reserve(missing)
+            candidates = [PREFIX + "%08d" % feistel(index, keys) for index in range(start, start + missing)]
+            taken = self.store.existing(candidates)
+            numbers.extend(number for number in candidates if number not in taken)
+        return numbers
+
+    def allocate(self):
+        """
+        Returns one new account number
+        """
+        return self.allocate_many(1)[0]
@@ -0,0 +1,20 @@
+"""
+The analyses that need pandas. It takes hundreds of milliseconds to
+import, so it is imported by the functions that use it, the first time
+an analysis is asked for, not when the bank starts. The charts are in
+charts.py.
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import metrics
+
+
+# ─── NUMERICAL ANALYSIS ─────────────────────────────────────────────────────────
+
+
+@metrics.timed("analysis.describe")
+def describe(users):
+    """
+    The descriptive statistics of the accounts, as a pandas DataFrame
+    """
+    import pandas as pd
+    return pd.DataFrame.from_dict(users, orient="index").describe()
@@ -0,0 +1,347 @@
+"""
+Anomaly detection on the transfer path: every transfer the engine is
+about to make is looked at, as it comes, for
+    burst           an account sending more than burst_limit transfers
+                    within burst_window seconds
+    large amount    an amount far above what the sender usually sends:
+                    more than `deviations` decayed standard deviations
+                    above the decayed mean of its (log) amounts, once
+                    the account has sent warm_up transfers
+    back and forth  money bouncing between two accounts: A to B, B to
+                    A, A to B... back_and_forth_legs times, each leg
+                    within back_and_forth_window seconds of the last
+A suspicious transfer is flagged (made, and reported as an alert), or
+held (not made) when one of its reasons is in the "hold" list of the
+rules. The rules (see DEFAULT_RULES) can be given as a JSON file.
+
+The state of an account is a few numbers of constant size: the counts
+of its current and previous burst windows (the count over the last
+window is estimated from both, weighting the previous one by how much
+of it the window still covers), the exponentially decayed mean and
+variance of the logarithms of its amounts, and its last receiver. The
+states of at most max_accounts accounts are kept, the least recently
+active ones being forgotten first, about 250 bytes per account. Looking
+at a transfer takes a few microseconds.
+
+Each process keeps its own state, for the transfers it makes. The
+alerts are appended to bank.json.alerts, one JSON object per line.
+
+The replay tool runs the detection over historical transfers, without
+changing any account, to see what rules would have flagged:
+
+    python anomaly.py bank.json.ledger --report alerts.csv
+    python anomaly.py transfers.csv --rules rules.json
+
+Ledgers (.ledger) give the time of every transfer. Transfer files (CSV
+or .jsonl, as for batch.py) may have a timestamp column (seconds since
+the epoch or ISO 8601); without it their transfers are taken to be
+--interval seconds apart.
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import csv
+import json
+import os
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from math import log
+import metrics
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+BURST = "burst"
+LARGE_AMOUNT = "large amount"
+BACK_AND_FORTH = "back and forth"
+DEFAULT_RULES = {
+    "burst_window": 60,
+    "burst_limit": 20,
+    # the weight of a new amount in the decayed mean and variance
+    "decay": 0.05,
+    "warm_up": 10,
+    "deviations": 4.0,
+    # the smallest standard deviation of the log amounts an account is
+    # judged with, so one that always sent the same amount may send a
+    # little more (exp(0.5) is about 1.65 times the usual amount)
+    "minimum_spread": 0.5,
+    "back_and_forth_window": 600,
+    "back_and_forth_legs": 4,
+    "max_accounts": 1000000,
+    # the reasons that hold a transfer; the others only flag it
+    "hold": [],
+}
+# the alerts kept in memory, the latest ones
+RECENT_ALERTS = 1000
+REPORT_FIELDS = ["time", "sender", "receiver", "amount", "reasons", "held"]
+
+
+# ─── ACCOUNT STATE ──────────────────────────────────────────────────────────────
+
+
+class AccountState:
+    """
+    What is kept of the transfers an account sent
+    """
+
+    __slots__ = ("window", "current", "previous", "sent", "mean", "variance", "peer", "peer_at", "legs")
+
+    def __init__(self):
+        # the burst window of the last transfer, and the transfers sent in
+        # it and in the window before
+        self.window = 0.0
+        self.current = 0
+        self.previous = 0
+        # the transfers whose amount went into the mean and variance
+        self.sent = 0
+        self.mean = 0.0
+        self.variance = 0.0
+        # the last receiver, when it was sent to, and how many legs of
+        # back and forth with it that transfer was
+        self.peer = None
+        self.peer_at = 0.0
+        self.legs = 0
+
+
+# ─── DETECTOR ───────────────────────────────────────────────────────────────────
+
+
+def load_rules(path=None):
+    """
+    The rules of a JSON file, completed with DEFAULT_RULES, or the
+    default rules without a path
+    """
+    if path is None:
+        return DEFAULT_RULES
+    with open(path) as f:
+        rules = json.load(f)
+    unknown = set(rules) - set(DEFAULT_RULES)
+    if unknown:
+        raise ValueError("Unknown anomaly rule %s" % sorted(unknown)[0])
+    return dict(DEFAULT_RULES, **rules)
+
+
+class AnomalyDetector:
+    """
+    Looks at transfers one at a time (see the top of this file). Safe to
+    use from several threads.
+    """
+
+    def __init__(self, rules=None, alerts_path=None):
+        rules = dict(DEFAULT_RULES, **(rules or {}))
+        self.rules = rules
+        unknown = set(rules["hold"]) - {BURST, LARGE_AMOUNT, BACK_AND_FORTH}
+        if unknown:
+            raise ValueError("Unknown anomaly to hold: %s" % sorted(unknown)[0])
+        # what inspect() reads, in one tuple as it is quicker to unpack
+        # than to read attribute by attribute
+        self._settings = (float(rules["burst_window"]), rules["burst_limit"], rules["warm_up"],
+                          float(rules["deviations"]) ** 2, float(rules["minimum_spread"]) ** 2,
+                          float(rules["back_and_forth_window"]), rules["back_and_forth_legs"])
+        self._decay = float(rules["decay"])
+        self._max_accounts = rules["max_accounts"]
+        self._hold = frozenset(rules["hold"])
+        # account number -> AccountState, least recently active first
+        self.states = OrderedDict()
+        self.alerts = deque(maxlen=RECENT_ALERTS)
+        self.flagged = Counter()
+        self.held = 0
+        self.alerts_path = alerts_path
+        self._alerts_file = None
+        self._lock = threading.Lock()
+
+    def inspect(self, sender_number, receiver_number, amount, now=None):
+        """
+        Looks at a transfer about to be made. It counts in the burst
+        window of the sender; unless it is held, its amount and receiver
+        also go into the state of the sender. Returns None when nothing
+        is suspicious, else the alert: a dictionary with the transfer,
+        the reasons and whether it is held.
+        """
+        if now is None:
+            now = time.time()
+        burst_window, burst_limit, warm_up, squared_deviations, minimum_variance, bounce_window, legs_flagged \
+            = self._settings
+        with self._lock:
+            states = self.states
+            state = states.get(sender_number)
+            if state is None:
+                state = states[sender_number] = AccountState()
+                if len(states) > self._max_accounts:
+                    states.popitem(last=False)
+            else:
+                states.move_to_end(sender_number)
+            reasons = None
+
+            # burst: the count over the last window, from the counts of
+            # the current and the previous window
+            window = now // burst_window
+            if window != state.window:
+                state.previous = state.current if window == state.window + 1 else 0
+                state.current = 0
+                state.window = window
+            state.current += 1
+            if state.current + state.previous > burst_limit and \
+                    state.current + state.previous * (1.0 + window - now / burst_window) > burst_limit:
+                reasons = [BURST]
+
+            # large amount, against the decayed mean and variance of the
+            # log amounts sent before (compared squared, without a root)
+            logarithm = log(amount) if amount > 0 else None
+            if logarithm is not None and state.sent >= warm_up:
+                above = logarithm - state.mean
+                if above > 0 and above * above > squared_deviations * max(state.variance, minimum_variance):
+                    reasons = (reasons or []) + [LARGE_AMOUNT]
+
+            # back and forth: the receiver sent to the sender lately
+            receiver = states.get(receiver_number)
+            if receiver is not None and receiver.peer == sender_number and now - receiver.peer_at <= bounce_window:
+                legs = receiver.legs + 1
+                if legs >= legs_flagged:
+                    reasons = (reasons or []) + [BACK_AND_FORTH]
+            else:
+                legs = 1
+
+            held = reasons is not None and not self._hold.isdisjoint(reasons)
+            if not held:
+                if logarithm is not None:
+                    if state.sent:
+                        decay = self._decay
+                        delta = logarithm - state.mean
+                        state.mean += decay * delta
+                        state.variance = (1.0 - decay) * (state.variance + decay * delta * delta)
+                    else:
+                        state.mean = logarithm
+                    state.sent += 1
+                state.peer = receiver_number
+                state.peer_at = now
+                state.legs = legs
+            if reasons is None:
+                return None
+            alert = {"time": now, "sender": sender_number, "receiver": receiver_number, "amount": amount,
+                     "reasons": reasons, "held": held}
+            self._report(alert)
+            return alert
+
+    def _report(self, alert):
+        self.alerts.append(alert)
+        self.flagged.update(alert["reasons"])
+        if alert["held"]:
+            self.held += 1
+            metrics.count("transfers_held")
+        else:
+            metrics.count("transfers_flagged")
+        if self.alerts_path is not None:
+            if self._alerts_file is None:
+                self._alerts_file = open(self.alerts_path, "a", buffering=1)
+            self._alerts_file.write(json.dumps(alert) + "\n")
+
+    def close(self):
+        with self._lock:
+            if self._alerts_file is not None:
+                self._alerts_file.close()
+                self._alerts_file = None
+
+
+def open_detector(store):
+    """
+    The detector of the transfers of a storage backend, with the rules
+    of the JSON file named by MYBANK_ANOMALY_RULES (the default rules
+    without it) and its alerts appended next to the data
+    """
+    return AnomalyDetector(load_rules(os.environ.get("MYBANK_ANOMALY_RULES")), store.path + ".alerts")
+
+
+# ─── REPLAY ─────────────────────────────────────────────────────────────────────
+
+
+def read_history(path, interval=1.0):
+    """
+    Streams the transfers of a ledger or of a transfer file as
+    (time, sender, receiver, amount) tuples, oldest first
+    """
+    if path.endswith(".ledger"):
+        from ledger import Ledger
+        ledger = Ledger(path)
+        try:
+            for entry in ledger.scan():
+                yield entry["timestamp"], entry["sender"], entry["receiver"], entry["amount"]
+        finally:
+            ledger.close()
+        return
+    from ledger import to_micros
+    with open(path, "r", newline="") as f:
+        if path.endswith(".jsonl"):
+            records = (json.loads(line) for line in f if line.strip())
+        else:
+            records = csv.DictReader(f)
+        start = time.time()
+        for position, record in enumerate(records):
+            moment = record.get("timestamp")
+            if moment in (None, ""):
+                moment = start + position * interval
+            elif isinstance(moment, str):
+                try:
+                    moment = float(moment)
+                except ValueError:
+                    moment = to_micros(moment) / 1000000
+            yield moment, str(record["sender"]), str(record["receiver"]), float(record["amount"])
+
+
+@metrics.timed("anomaly.replay")
+def replay(detector, transfers, report=None):
+    """
+    Runs the detector over (time, sender, receiver, amount) transfers.
+    report, if given, is a csv.writer that gets one row per alert.
+    Returns a summary with the counts of every reason.
+    """
+    start = time.perf_counter()
+    count = 0
+    alerts = 0
+    for moment, sender_number, receiver_number, amount in transfers:
+        alert = detector.inspect(sender_number, receiver_number, amount, moment)
+        count += 1
+        if alert is not None:
+            alerts += 1
+            if report is not None:
+                report.writerow([moment, sender_number, receiver_number, amount, "; ".join(alert["reasons"]),
+                                 alert["held"]])
+    seconds = time.perf_counter() - start
+    return {
+        "transfers": count,
+        "alerts": alerts,
+        "held": detector.held,
+        "reasons": dict(detector.flagged),
+        "accounts": len(detector.states),
+        "seconds": seconds,
+        "microseconds_per_transfer": seconds / count * 1000000 if count else 0.0,
+    }
+
+
+# ─── MAIN ───────────────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay historical transfers through the anomaly detection.")
+    parser.add_argument("transfers", help="a ledger (.ledger), or a CSV or .jsonl file of transfers")
+    parser.add_argument("--rules", help="JSON file of rules (default: the DEFAULT_RULES of anomaly.py)")
+    parser.add_argument("--report", help="where to write the alerts (CSV)")
+    parser.add_argument("--interval", type=float, default=1.0,
+                        help="seconds between the transfers of a file without timestamps")
+    arguments = parser.parse_args()
+
+    try:
+        detector = AnomalyDetector(load_rules(arguments.rules))
+    except (OSError, ValueError) as error:
+        parser.exit(1, "%s\n" % error)
+    history = read_history(arguments.transfers, arguments.interval)
+    if arguments.report is None:
+        summary = replay(detector, history)
+    else:
+        with open(arguments.report, "w", newline="") as f:
+            report = csv.writer(f)
+            report.writerow(REPORT_FIELDS)
+            summary = replay(detector, history, report)
+    print("Transfers:", summary["transfers"], " alerts:", summary["alerts"], " held:", summary["held"])
+    for reason, count in sorted(summary["reasons"].items()):
+        print("  %-16s %d" % (reason, count))
+    print("Accounts followed:", summary["accounts"])
+    print("Took %.3f s, %.2f µs per transfer" % (summary["seconds"], summary["microseconds_per_transfer"]))
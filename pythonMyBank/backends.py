@@ -0,0 +1,177 @@
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import os
+import threading
+from abc import ABC, abstractmethod
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+ACCOUNT_FIELDS = ["full_name", "gender", "balance", "account_creation_date",
+                  "city", "phone_number", "age", "country"]
+
+DEFAULT_PATHS = {
+    "json": "bank.json",
+    "sqlite": "bank.db",
+    "sharded": "bank.shards",
+    "snapshot": "bank.snap",
+}
+
+
+# ─── STORAGE BACKEND ────────────────────────────────────────────────────────────
+
+
+class StorageBackend(ABC):
+    """
+    What the bank needs from a place that keeps the accounts. Accounts
+    are dictionaries with the ACCOUNT_FIELDS keys, identified by their
+    account number.
+
+    The checks of an operation (does the account exist, is there enough
+    balance) are up to the caller; a backend only stores the result.
+    Writes given durable=False may wait for the next commit() before
+    they survive a crash, so a batch can share one sync.
+
+    Every backend implements the abstract methods below (load, put,
+    put_many, delete, transfer, apply_deltas and save); the others have
+    defaults built on load().
+
+    Listeners can follow every change made through the backend, e.g. to
+    keep statistics or indexes up to date without reading all the
+    accounts again. A listener has two methods:
+        reset(users)             all the accounts were (re)loaded
+        apply_changes(changes)   one atomic change was made; changes is a
+                                 list of (account_number, old, new) with
+                                 old/new None for created/removed accounts
+    """
+
+    version = 0
+
+    def __init__(self):
+        self._listeners = []
+        self._listener_lock = threading.RLock()
+
+    def subscribe(self, listener):
+        """
+        Starts sending the changes to a listener, which first gets
+        the current accounts through reset()
+        """
+        with self._listener_lock:
+            listener.reset(self.load())
+            self._listeners.append(listener)
+
+    def _notify_reset(self, users):
+        with self._listener_lock:
+            for listener in self._listeners:
+                listener.reset(users)
+
+    def _notify(self, changes):
+        with self._listener_lock:
+            for listener in self._listeners:
+                listener.apply_changes(changes)
+
+    @abstractmethod
+    def load(self):
+        """
+        Returns all the accounts, keyed by account number. The result
+        must be treated as read-only.
+        """
+
+    def get(self, account_number):
+        """
+        Returns a single account, or None when it does not exist
+        """
+        return self.load().get(account_number)
+
+    def find(self, field, value):
+        """
+        Returns the accounts, keyed by account number, whose field
+        has exactly the given value
+        """
+        return {number: user for number, user in self.load().items() if user[field] == value}
+
+    def existing(self, account_numbers):
+        """
+        Returns the set of the given account numbers that are taken
+        """
+        users = self.load()
+        return set(number for number in account_numbers if number in users)
+
+    @abstractmethod
+    def put(self, account_number, record, durable=True):
+        """
+        Creates or replaces an account
+        """
+
+    @abstractmethod
+    def put_many(self, records, durable=True):
+        """
+        Creates or replaces many accounts as one atomic change. records
+        maps account numbers to accounts.
+        """
+
+    @abstractmethod
+    def delete(self, account_number, durable=True):
+        """
+        Removes an account
+        """
+
+    @abstractmethod
+    def transfer(self, sender_number, receiver_number, amount, durable=True):
+        """
+        Moves money between two accounts as one atomic change
+        """
+
+    @abstractmethod
+    def apply_deltas(self, deltas, durable=True):
+        """
+        Adds an amount to the balance of many accounts as one atomic
+        change. deltas maps account numbers to the amount to add.
+        """
+
+    @abstractmethod
+    def save(self, users):
+        """
+        Replaces all the accounts
+        """
+
+    def commit(self):
+        """
+        Makes every write done so far durable
+        """
+
+    def close(self):
+        """
+        Releases the files or connections of the backend
+        """
+
+
+# ─── FACTORY ────────────────────────────────────────────────────────────────────
+
+
+def open_backend(kind=None, path=None):
+    """
+    Opens the storage backend of the given kind ("json", "snapshot",
+    "sqlite" or "sharded"). The "snapshot" kind is the store of "json"
+    keeping its data in the binary format of snapshot.py.
+    Without arguments the MYBANK_STORAGE and MYBANK_DATA environment
+    variables decide, falling back to the bank.json file.
+    """
+    kind = kind or os.environ.get("MYBANK_STORAGE", "json")
+    path = path or os.environ.get("MYBANK_DATA") or DEFAULT_PATHS.get(kind)
+    if kind in ("json", "snapshot"):
+        from account_store import AccountStore
+        return AccountStore(path, binary=kind == "snapshot")
+    if kind == "sqlite":
+        from sqlite_backend import SqliteBackend
+        return SqliteBackend(path)
+    if kind == "sharded":
+        from sharded_store import ShardedStore
+        return ShardedStore(path)
+    raise ValueError("Unknown storage backend: " + str(kind))
+
+
+def copy_accounts(source, target):
+    """
+    Copies every account from one backend into another, e.g. to move
+    bank.json into a SQLite database.
+    """
+    target.save(dict(source.load()))
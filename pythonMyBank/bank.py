@@ -0,0 +1,148 @@
+"""
+The bank as a library: the storage backend, the transaction engine, the
+ledger of the transfers and the structures answering the read-only questions (statistics, search
+indexes, sorted listings), without the interactive menu.
+
+    from bank import Bank
+    bank = Bank()
+    bank.engine.transfer(sender, receiver, 10)
+    bank.ledger.statement(sender, "2024-01-01", "2024-02-01")
+    bank.indexes.search([("city", "=", "Mumbai"), ("age", "between", 25, 40)])
+    bank.aggregates.mean()
+    bank.report(["country", "age_band"])["country"]["India"]["p90"]
+    with bank.snapshot() as users:
+        total = sum(user["balance"] for user in users.values())
+
+The read-side structures are built the first time they are used, so a
+script that only makes a transfer does not index all the accounts
+first; their modules are imported then too. Importing this module
+imports neither pandas nor matplotlib (see analysis.py and charts.py
+for what needs them).
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+from anomaly import open_detector
+from backends import open_backend
+from ledger import open_ledger
+from transactions import TransactionEngine
+
+
+# ─── BANK ───────────────────────────────────────────────────────────────────────
+
+
+class Bank:
+    """
+    One bank: a storage backend, its transaction engine, the ledger the
+    engine records the transfers in, the anomaly detector that looks at
+    them (see anomaly.py), and the listeners that follow its changes. Without arguments the
+    MYBANK_STORAGE and MYBANK_DATA environment variables pick the
+    backend (see backends.open_backend).
+    """
+
+    def __init__(self, store=None):
+        self.store = store if store is not None else open_backend()
+        self.ledger = open_ledger(self.store)
+        self.detector = open_detector(self.store)
+        self.engine = TransactionEngine(self.store, ledger=self.ledger, detector=self.detector)
+        self._listeners = {}
+        self._charts = None
+
+    def _listener(self, name, factory):
+        """
+        The listener of the given name, created and subscribed to the
+        store on first use
+        """
+        listener = self._listeners.get(name)
+        if listener is None:
+            listener = factory()
+            self.store.subscribe(listener)
+            self._listeners[name] = listener
+        return listener
+
+    @property
+    def aggregates(self):
+        """
+        Running balance statistics: count, total, mean, variance, min, max
+        """
+        from aggregates import BalanceAggregates
+        return self._listener("aggregates", BalanceAggregates)
+
+    @property
+    def quantiles(self):
+        """
+        Balance quantile sketches, overall and per country/city (±1%)
+        """
+        from quantiles import SegmentedQuantiles
+        return self._listener("quantiles", SegmentedQuantiles)
+
+    @property
+    def indexes(self):
+        """
+        Search indexes on name, phone, city, country, age and creation date
+        """
+        from indexes import SecondaryIndexes
+        return self._listener("indexes", SecondaryIndexes)
+
+    @property
+    def fuzzy_names(self):
+        """
+        Trigram index of the names, for searches with typos
+        """
+        from fuzzy import FuzzyNameIndex
+        return self._listener("fuzzy_names", FuzzyNameIndex)
+
+    @property
+    def listing(self):
+        """
+        The accounts in the order of every listed field, for paged listings
+        """
+        from listing import SortedListing
+        return self._listener("listing", SortedListing)
+
+    @property
+    def snapshots(self):
+        """
+        Consistent read snapshots of the accounts (see snapshots.py)
+        """
+        from snapshots import SnapshotManager
+        return self._listener("snapshots", SnapshotManager)
+
+    def snapshot(self):
+        """
+        The accounts as they are now, unchanged by the writes that follow
+        until it is closed; use it in a with block
+        """
+        return self.snapshots.snapshot()
+
+    @property
+    def charts(self):
+        """
+        Renders the charts of the accounts to PNG/SVG files (see charts.py)
+        """
+        if self._charts is None:
+            from charts import ChartRenderer
+            self._charts = ChartRenderer(self.store, snapshots=self.snapshots)
+        return self._charts
+
+    def table(self):
+        """
+        A columnar copy of the current accounts, for bulk work over
+        millions of them (see columnar.AccountTable; needs NumPy)
+        """
+        from columnar import AccountTable
+        with self.snapshot() as users:
+            return AccountTable.from_users(users)
+
+    def report(self, dimensions=None, **options):
+        """
+        Balance statistics by country, city, gender, age band or
+        creation month, over a snapshot of the accounts, aggregated in
+        worker processes (see reports.build_report; needs NumPy)
+        """
+        from reports import DIMENSIONS, build_report
+        with self.snapshot() as users:
+            return build_report(users, dimensions or tuple(DIMENSIONS), **options)
+
+    def close(self):
+        self.detector.close()
+        self.ledger.close()
+        self.store.close()
@@ -0,0 +1,175 @@
+"""
+Applies a file of transfers in one go, e.g. the end-of-day settlement.
+
+    python batch.py transfers.csv --report report.csv
+
+The file is either a CSV with the columns sender, receiver and amount,
+or a JSON-lines file (.jsonl) with objects having the same keys. Every
+transfer gets a line in the report, saying whether it was applied or
+why it was rejected. Given a ledger, the applied transfers are recorded
+in it, a chunk at a time. Given an anomaly detector (see anomaly.py),
+every transfer that passes the checks is looked at first, and one the
+rules hold is rejected.
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import contextlib
+import csv
+import itertools
+import json
+import time
+import metrics
+from anomaly import open_detector
+from backends import open_backend
+from ledger import open_ledger
+from transactions import HELD, TransactionEngine, valid_amount
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+CHUNK_SIZE = 10000
+REPORT_FIELDS = ["line", "sender", "receiver", "amount", "status", "reason"]
+
+
+# ─── READING TRANSFERS ──────────────────────────────────────────────────────────
+
+
+def read_transfers(path):
+    """
+    Streams the transfers of a file as (line, sender, receiver, amount)
+    tuples. The amount is returned as written in the file.
+    """
+    with open(path, "r", newline="") as f:
+        if path.endswith(".jsonl"):
+            for line_number, line in enumerate(f, 1):
+                if line.strip():
+                    record = json.loads(line)
+                    yield line_number, str(record["sender"]), str(record["receiver"]), record["amount"]
+        else:
+            for line_number, record in enumerate(csv.DictReader(f), 2):
+                yield line_number, record["sender"], record["receiver"], record["amount"]
+
+
+# ─── BATCH PROCESSING ───────────────────────────────────────────────────────────
+
+
+def check_transfer(balances, sender_number, receiver_number, amount):
+    """
+    The checks of the transaction engine, amounts through the same
+    valid_amount, against the balances of the chunk (None for an
+    account that does not exist). Returns the parsed amount and the
+    reason of a rejection (None when the transfer can be applied).
+    """
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        return None, "invalid amount"
+    if not valid_amount(amount):
+        return amount, "invalid amount"
+    if sender_number == receiver_number:
+        return amount, "same sender and recipient account"
+    if balances[sender_number] is None:
+        return amount, "unknown sender account"
+    if balances[receiver_number] is None:
+        return amount, "unknown recipient account"
+    if balances[sender_number] < amount:
+        return amount, "insufficient balance"
+    return amount, None
+
+
+@metrics.timed("batch.chunk")
+def process_chunk(store, chunk, report, summary, ledger=None, detector=None):
+    """
+    Applies one chunk of transfers in order and persists the changed
+    balances as a single atomic change. Every account is read once
+    from the store, when the chunk first touches it.
+    """
+    balances = {}
+    deltas = {}
+    applied = []
+    for line_number, sender_number, receiver_number, amount in chunk:
+        for number in (sender_number, receiver_number):
+            if number not in balances:
+                user = store.get(number)
+                balances[number] = None if user is None else user["balance"]
+        amount, reason = check_transfer(balances, sender_number, receiver_number, amount)
+        if reason is None and detector is not None:
+            alert = detector.inspect(sender_number, receiver_number, amount)
+            if alert is not None and alert["held"]:
+                reason = HELD
+        if reason is None:
+            balances[sender_number] -= amount
+            balances[receiver_number] += amount
+            deltas[sender_number] = deltas.get(sender_number, 0) - amount
+            deltas[receiver_number] = deltas.get(receiver_number, 0) + amount
+            applied.append((sender_number, receiver_number, amount, balances[sender_number],
+                            balances[receiver_number]))
+            summary["applied"] += 1
+        else:
+            summary["rejected"] += 1
+        summary["transfers"] += 1
+        if report is not None:
+            report.writerow([line_number, sender_number, receiver_number, amount,
+                             "applied" if reason is None else "rejected", reason or ""])
+    if deltas:
+        store.apply_deltas(deltas)
+        if ledger is not None:
+            ledger.record_many(applied)
+        summary["chunks"] += 1
+
+
+def process_transfers(store, transfers, report=None, chunk_size=CHUNK_SIZE, locks=None, ledger=None,
+                      detector=None):
+    """
+    Applies the transfers in order, chunk by chunk. report, if given, is
+    a csv.writer that gets one row per transfer. locks, if given, is the
+    LockManager of the running transaction engine: every account is then
+    locked while a chunk is applied, so the batch can run next to
+    interactive sessions. ledger, if given, gets an entry per applied
+    transfer. detector, if given, is the AnomalyDetector the transfers
+    go through. Returns a summary with the throughput.
+    """
+    start = time.perf_counter()
+    summary = {"transfers": 0, "applied": 0, "rejected": 0, "chunks": 0}
+    transfers = iter(transfers)
+    while True:
+        chunk = list(itertools.islice(transfers, chunk_size))
+        if not chunk:
+            break
+        with locks.locked_all() if locks is not None else contextlib.nullcontext():
+            process_chunk(store, chunk, report, summary, ledger, detector)
+    summary["seconds"] = time.perf_counter() - start
+    summary["transfers_per_second"] = summary["transfers"] / summary["seconds"] if summary["seconds"] else 0.0
+    return summary
+
+
+def process_transfer_file(store, path, report_path=None, chunk_size=CHUNK_SIZE, locks=None, ledger=None,
+                          detector=None):
+    """
+    Applies the transfers of a file, writing the per-transfer report
+    into report_path when given
+    """
+    if report_path is None:
+        return process_transfers(store, read_transfers(path), None, chunk_size, locks, ledger, detector)
+    with open(report_path, "w", newline="") as f:
+        report = csv.writer(f)
+        report.writerow(REPORT_FIELDS)
+        return process_transfers(store, read_transfers(path), report, chunk_size, locks, ledger, detector)
+
+
+# ─── MAIN ───────────────────────────────────────────────────────────────────────
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply a file of transfers in one batch.")
+    parser.add_argument("transfers", help="CSV or .jsonl file with sender, receiver and amount")
+    parser.add_argument("--report", help="where to write the per-transfer results (CSV)")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE,
+                        help="number of transfers persisted together")
+    arguments = parser.parse_args()
+
+    store = open_backend()
+    engine = TransactionEngine(store, ledger=open_ledger(store), detector=open_detector(store))
+    result = process_transfer_file(engine.store, arguments.transfers, arguments.report, arguments.chunk_size,
+                                   engine.locks, engine.ledger, engine.detector)
+    print("Transfers:", result["transfers"], " applied:", result["applied"], " rejected:", result["rejected"])
+    print("Took %.3f s, %.0f transfers/second" % (result["seconds"], result["transfers_per_second"]))
@@ -0,0 +1,58 @@
+"""
+Benchmark of the account number allocator and of bulk account creation.
+Allocates millions of numbers against an empty bank and checks that they
+are all different, then opens accounts in bulk on both storage backends.
+
+    python benchmarks/bench_allocator.py --numbers 5000000 --accounts 100000
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from accounts import create_users_bulk  # noqa: E402
+from allocator import AccountNumberAllocator  # noqa: E402
+from backends import open_backend  # noqa: E402
+from datagen import make_accounts  # noqa: E402
+from transactions import TransactionEngine  # noqa: E402
+
+
+# ─── BENCHMARK ──────────────────────────────────────────────────────────────────
+
+
+def bench_allocation(count):
+    directory = tempfile.mkdtemp()
+    allocator = AccountNumberAllocator(open_backend("json", os.path.join(directory, "bank.json")))
+    start = time.perf_counter()
+    numbers = allocator.allocate_many(count)
+    elapsed = time.perf_counter() - start
+    print("allocated %d numbers in %.2f s (%.0f/s), all unique: %s" % (
+        count, elapsed, count / elapsed, len(set(numbers)) == count))
+    start = time.perf_counter()
+    for _ in range(1000):
+        allocator.allocate()
+    print("single allocations: %.1f us each" % ((time.perf_counter() - start) / 1000 * 1e6))
+
+
+def bench_bulk_creation(count):
+    users = make_accounts(count)
+    for kind, name in [("json", "bank.json"), ("sqlite", "bank.db")]:
+        engine = TransactionEngine(open_backend(kind, os.path.join(tempfile.mkdtemp(), name)))
+        start = time.perf_counter()
+        numbers = create_users_bulk(engine, users)
+        elapsed = time.perf_counter() - start
+        print("%-7s opened %d accounts in %.2f s (%.0f/s), stored: %d" % (
+            kind, count, elapsed, count / elapsed, len(engine.store.existing(numbers))))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--numbers", type=int, default=5000000)
+    parser.add_argument("--accounts", type=int, default=100000)
+    arguments = parser.parse_args()
+    bench_allocation(arguments.numbers)
+    bench_bulk_creation(arguments.accounts)
@@ -0,0 +1,54 @@
+"""
+Benchmark of the anomaly detection: the time it adds to a transfer and
+the memory of its per-account state, with more active accounts than
+the state keeps (max_accounts), so the oldest ones are forgotten.
+
+    python benchmarks/bench_anomaly.py --accounts 100000 1000000 3000000 --transfers 1000000
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from anomaly import AnomalyDetector  # noqa: E402
+from datagen import make_transfers  # noqa: E402
+
+# ─── BENCHMARK ──────────────────────────────────────────────────────────────────
+
+
+def run(accounts, count, max_accounts):
+    numbers = ["6060%012d" % number for number in range(accounts)]
+    transfers = [(sender, receiver, amount, 1700000000 + position * 0.01)
+                 for position, (sender, receiver, amount) in enumerate(make_transfers(numbers, count))]
+    rules = {"max_accounts": max_accounts}
+
+    detector = AnomalyDetector(rules)
+    inspect = detector.inspect
+    start = time.perf_counter()
+    for sender, receiver, amount, now in transfers:
+        inspect(sender, receiver, amount, now)
+    elapsed = time.perf_counter() - start
+
+    tracemalloc.start()
+    detector = AnomalyDetector(rules)
+    for sender, receiver, amount, now in transfers:
+        detector.inspect(sender, receiver, amount, now)
+    memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print("%8d accounts %9d transfers  %6.2f µs/transfer  %8d states  %7.1f MB (%d B/state)  alerts %s" % (
+        accounts, count, elapsed / count * 1e6, len(detector.states), memory / 1e6,
+        memory / len(detector.states), dict(detector.flagged)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, nargs="+", default=[100000, 1000000, 3000000])
+    parser.add_argument("--transfers", type=int, default=1000000)
+    parser.add_argument("--max-accounts", type=int, default=250000)
+    arguments = parser.parse_args()
+    for accounts in arguments.accounts:
+        run(accounts, arguments.transfers, arguments.max_accounts)
@@ -0,0 +1,50 @@
+"""
+Throughput of the batch transfer mode. Creates a bank with synthetic
+accounts in a temporary directory, writes a file of random transfers and
+applies it with batch.process_transfer_file, for every storage backend.
+
+    python benchmarks/bench_batch.py --accounts 100000 --transfers 500000
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import DEFAULT_PATHS, open_backend  # noqa: E402
+from batch import process_transfer_file  # noqa: E402
+from datagen import make_accounts, make_transfers, write_transfers  # noqa: E402
+
+
+# ─── BENCHMARK ──────────────────────────────────────────────────────────────────
+
+
+def run(account_count, transfer_count, chunk_size):
+    directory = tempfile.mkdtemp()
+    accounts = make_accounts(account_count)
+    users = {account.pop("account_number"): account for account in accounts}
+    transfers_path = os.path.join(directory, "transfers.csv")
+    write_transfers(transfers_path, make_transfers(list(users), transfer_count))
+
+    for kind in ["json", "snapshot", "sqlite", "sharded"]:
+        store = open_backend(kind, os.path.join(directory, DEFAULT_PATHS[kind]))
+        store.save(dict(users))
+        total_before = sum(user["balance"] for user in store.load().values())
+        result = process_transfer_file(store, transfers_path, os.path.join(directory, kind + ".report.csv"),
+                                       chunk_size)
+        total_after = sum(user["balance"] for user in store.load().values())
+        print("%-8s %d transfers in %.2f s  %10.0f transfers/s  applied %d  rejected %d  balance kept: %s" % (
+            kind, result["transfers"], result["seconds"], result["transfers_per_second"],
+            result["applied"], result["rejected"], abs(total_before - total_after) < 1e-3))
+        store.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=100000)
+    parser.add_argument("--transfers", type=int, default=500000)
+    parser.add_argument("--chunk-size", type=int, default=10000)
+    arguments = parser.parse_args()
+    run(arguments.accounts, arguments.transfers, arguments.chunk_size)
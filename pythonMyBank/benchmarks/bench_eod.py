@@ -0,0 +1,65 @@
+"""
+Benchmark of the end-of-day run: the vectorized computation of the
+interest, fees and penalties alone, on balance and country columns of
+up to 10M accounts, then whole runs on a JSON store, reading the
+accounts and persisting the changes included.
+
+    python benchmarks/bench_eod.py --accounts 1000000 10000000 --store-accounts 100000 1000000
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+from account_store import AccountStore  # noqa: E402
+from datagen import COUNTRIES, make_bank  # noqa: E402
+from eod import DEFAULT_RULES, compile_rules, compute, run_end_of_day  # noqa: E402
+
+# ─── BENCHMARK ──────────────────────────────────────────────────────────────────
+
+
+def run_columns(count):
+    """
+    The computation alone, on synthetic columns: balances in cents from
+    a log-normal spread and the countries of the data generator
+    """
+    rng = np.random.default_rng(7)
+    countries = sorted(COUNTRIES)
+    shares = np.array([COUNTRIES[country][0] for country in countries])
+    balances = np.rint(rng.lognormal(10, 1.5, count) * 100).astype(np.int64)
+    country_codes = rng.choice(len(countries), count, p=shares / shares.sum()).astype(np.uint8)
+    start = time.perf_counter()
+    interest, fees, penalties = compute(balances, country_codes, compile_rules(DEFAULT_RULES, countries))
+    changed = np.flatnonzero(interest - fees - penalties)
+    elapsed = time.perf_counter() - start
+    print("%9d accounts, columns only   %7.2f s  %12.0f accounts/s  changed %d" % (
+        count, elapsed, count / elapsed, len(changed)))
+
+
+def run_store(count):
+    directory = tempfile.mkdtemp()
+    store = AccountStore(os.path.join(directory, "bank.json"))
+    store.save(make_bank(count))
+    summary = run_end_of_day(store, DEFAULT_RULES, date(2024, 3, 29))
+    print("%9d accounts, JSON store     %7.2f s  %12.0f accounts/s  changed %d" % (
+        count, summary["seconds"], count / summary["seconds"], summary["changed"]))
+    store.close()
+    shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, nargs="+", default=[1000000, 10000000])
+    parser.add_argument("--store-accounts", type=int, nargs="+", default=[100000, 1000000])
+    arguments = parser.parse_args()
+    for accounts in arguments.accounts:
+        run_columns(accounts)
+    for accounts in arguments.store_accounts:
+        run_store(accounts)
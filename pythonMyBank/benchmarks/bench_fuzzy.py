@@ -0,0 +1,65 @@
+"""
+Benchmark of the fuzzy name search. Indexes the names of a synthetic
+bank, then searches them with a letter dropped (a typo) and checks an
+account with the right name comes first.
+
+    python benchmarks/bench_fuzzy.py --accounts 1000000
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datagen import make_bank  # noqa: E402
+from fuzzy import FuzzyNameIndex  # noqa: E402
+
+
+# ─── BENCHMARK ──────────────────────────────────────────────────────────────────
+
+
+def with_typo(rng, name):
+    position = rng.randrange(len(name))
+    return name[:position] + name[position + 1:]
+
+
+def run(count, queries):
+    users = make_bank(count)
+    start = time.perf_counter()
+    index = FuzzyNameIndex()
+    index.reset(users)
+    print("index build for %d accounts: %.2f s" % (count, time.perf_counter() - start))
+
+    rng = random.Random(11)
+    numbers = rng.sample(list(users), queries)
+    typed = [with_typo(rng, users[number]["full_name"]) for number in numbers]
+    found = 0
+    start = time.perf_counter()
+    for number, query in zip(numbers, typed):
+        matches = index.search(query)
+        found += any(users[match]["full_name"] == users[number]["full_name"] for _, match in matches[:1])
+    elapsed = time.perf_counter() - start
+    print("  %-40s %8.2f ms  (right name first for %d of %d)" % (
+        "name with a typo", elapsed / queries * 1000, found, queries))
+
+    start = time.perf_counter()
+    for number in numbers:
+        index.search(users[number]["full_name"].split()[0])
+    print("  %-40s %8.2f ms" % ("first name only", (time.perf_counter() - start) / queries * 1000))
+
+    start = time.perf_counter()
+    for number in numbers:
+        old = users[number]
+        index.apply_changes([(number, old, dict(old, full_name=old["full_name"] + "a"))])
+    print("  %-40s %8.2f us" % ("index update per renamed account", (time.perf_counter() - start) / queries * 1e6))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=200)
+    arguments = parser.parse_args()
+    run(arguments.accounts, arguments.queries)
@@ -0,0 +1,72 @@
+"""
+Benchmark of the account search. Compares the old search (sorting all
+the accounts, then a binary search) with the secondary indexes, and
+times the index updates that creating, changing and removing accounts
+cause.
+
+    python benchmarks/bench_indexes.py --accounts 100000
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datagen import make_accounts  # noqa: E402
+from indexes import SecondaryIndexes  # noqa: E402
+from sort_engine import sort_records, text_binary_search  # noqa: E402
+
+
+# ─── BENCHMARK ──────────────────────────────────────────────────────────────────
+
+
+def time_per_call(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - start) / repeat
+
+
+def run(count):
+    accounts = make_accounts(count)
+    users = {account.pop("account_number"): account for account in accounts}
+    records = [dict(user, account_number=number) for number, user in users.items()]
+    sample = next(iter(users.values()))
+
+    start = time.perf_counter()
+    indexes = SecondaryIndexes()
+    indexes.reset(users)
+    print("index build for %d accounts: %.3f s" % (count, time.perf_counter() - start))
+
+    def old_search():
+        by_name = sort_records(records, "full_name")
+        return text_binary_search(by_name, "full_name", sample["full_name"])
+
+    print("  %-45s %10.1f us" % ("old name search (sort + binary search)", time_per_call(old_search, 3) * 1e6))
+    queries = [
+        ("name, exact", [("full_name", "=", sample["full_name"])]),
+        ("name, prefix", [("full_name", "prefix", sample["full_name"][:3])]),
+        ("phone, exact", [("phone_number", "=", sample["phone_number"])]),
+        ("age 25-40 in one city", [("city", "=", sample["city"]), ("age", "between", 25, 40)]),
+        ("created in a date range", [("account_creation_date", "between", "2022-03-01", "2022-03-07")]),
+    ]
+    for label, conditions in queries:
+        matches = len(indexes.search(conditions))
+        elapsed = time_per_call(lambda: indexes.search(conditions), 100)
+        print("  %-45s %10.1f us  (%d matches)" % (label, elapsed * 1e6, matches))
+
+    numbers = list(users)[:1000]
+    changes = [(number, users[number], dict(users[number], city="Elsewhere")) for number in numbers]
+    start = time.perf_counter()
+    for change in changes:
+        indexes.apply_changes([change])
+    print("  %-45s %10.1f us" % ("index update per changed account", (time.perf_counter() - start) / len(changes) * 1e6))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=100000)
+    arguments = parser.parse_args()
+    run(arguments.accounts)
@@ -0,0 +1,78 @@
+"""
+Benchmark of the ledger: how fast transfers are recorded, and how long a
+statement and a past balance take as the ledger grows, against reading
+the whole ledger to find the entries of the account.
+
+    python benchmarks/bench_ledger.py --entries 100000 1000000
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datagen import make_transfers  # noqa: E402
+from ledger import Ledger  # noqa: E402
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+ACCOUNTS = 10000
+CHUNK = 10000
+QUERIES = 200
+
+
+# ─── BENCHMARK ──────────────────────────────────────────────────────────────────
+
+
+def run(count, directory):
+    numbers = ["60605498%08d" % i for i in range(ACCOUNTS)]
+    balances = dict.fromkeys(numbers, 1e6)
+    ledger = Ledger(os.path.join(directory, "bank-%d.ledger" % count))
+    start = time.perf_counter()
+    transfers = make_transfers(numbers, count)
+    for first in range(0, count, CHUNK):
+        entries = []
+        for sender, receiver, amount in transfers[first:first + CHUNK]:
+            balances[sender] -= amount
+            balances[receiver] += amount
+            entries.append((sender, receiver, amount, balances[sender], balances[receiver]))
+        ledger.record_many(entries, durable=False)
+    ledger.commit()
+    elapsed = time.perf_counter() - start
+    print("%d entries recorded in %.1f s (%.0f/s)" % (count, elapsed, count / elapsed))
+
+    ledger = Ledger(ledger.path)
+    middle = ledger.between(limit=count // 2 + 1)[-1]["timestamp"]
+    rng = random.Random(5)
+    queries = rng.sample(numbers, QUERIES)
+    start = time.perf_counter()
+    found = sum(len(ledger.statement(number)) for number in queries)
+    print("  statement, all dates            %8.2f ms  (%.0f entries each)" % (
+        (time.perf_counter() - start) * 1000 / QUERIES, found / QUERIES))
+    start = time.perf_counter()
+    for number in queries:
+        ledger.statement(number, middle, middle + 1)
+    print("  statement, one second           %8.2f ms" % ((time.perf_counter() - start) * 1000 / QUERIES))
+    start = time.perf_counter()
+    for number in queries:
+        ledger.balance_at(number, middle)
+    print("  balance at a moment             %8.2f ms" % ((time.perf_counter() - start) * 1000 / QUERIES))
+    start = time.perf_counter()
+    entries = ledger.between()
+    scanned = [entry for entry in entries if queries[0] in (entry["sender"], entry["receiver"])]
+    print("  statement by reading it all     %8.2f ms  (%d entries)" % (
+        (time.perf_counter() - start) * 1000, len(scanned)))
+    ledger.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--entries", type=int, nargs="+", default=[100000, 1000000])
+    arguments = parser.parse_args()
+    directory = tempfile.mkdtemp()
+    for entries in arguments.entries:
+        run(entries, directory)
@@ -0,0 +1,57 @@
+"""
+Benchmark of the sorted account listing. Compares showing the first
+page after sorting all the accounts with reading it from the sorted
+listing, at growing bank sizes, and times the top balances heap.
+
+    python benchmarks/bench_listing.py --accounts 10000 100000 1000000
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datagen import make_accounts  # noqa: E402
+from listing import PAGE_SIZE, SortedListing, top_by_balance  # noqa: E402
+from sort_engine import sort_records  # noqa: E402
+
+
+# ─── BENCHMARK ──────────────────────────────────────────────────────────────────
+
+
+def run(count):
+    accounts = make_accounts(count)
+    users = {account.pop("account_number"): account for account in accounts}
+    records = [dict(user, account_number=number) for number, user in users.items()]
+    listing = SortedListing()
+    listing.reset(users)
+    print("%d accounts" % count)
+
+    start = time.perf_counter()
+    sort_records(records, "full_name")[:PAGE_SIZE]
+    print("  %-40s %10.1f us" % ("first page, full sort", (time.perf_counter() - start) * 1e6))
+
+    start = time.perf_counter()
+    for _ in range(1000):
+        listing.page("full_name", 0, PAGE_SIZE)
+    print("  %-40s %10.1f us" % ("first page, sorted listing", (time.perf_counter() - start) / 1000 * 1e6))
+
+    cursor = listing.page("full_name", count // 2, 1)[0]
+    start = time.perf_counter()
+    for _ in range(1000):
+        listing.page("full_name", limit=PAGE_SIZE, after=cursor)
+    print("  %-40s %10.1f us" % ("page after a cursor", (time.perf_counter() - start) / 1000 * 1e6))
+
+    start = time.perf_counter()
+    top_by_balance(users, 10)
+    print("  %-40s %10.1f us" % ("top 10 balances, heap", (time.perf_counter() - start) * 1e6))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, nargs="+", default=[10000, 100000, 1000000])
+    arguments = parser.parse_args()
+    for accounts in arguments.accounts:
+        run(accounts)
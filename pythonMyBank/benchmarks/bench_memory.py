@@ -0,0 +1,109 @@
+"""
+Benchmark of the memory the accounts take in the different layouts:
+the dictionaries bank.json is loaded into, the copies users_as_list
+makes of them, Account objects with __slots__ and the columnar
+AccountTable. Each layout is built from the parsed JSON text and
+measured with tracemalloc once the parsed dictionaries are gone.
+
+    python benchmarks/bench_memory.py --accounts 100000 1000000
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from columnar import Account, AccountTable  # noqa: E402
+from datagen import make_bank  # noqa: E402
+
+
+# ─── LAYOUTS ────────────────────────────────────────────────────────────────────
+
+
+def as_dicts(users):
+    return users
+
+
+def as_dicts_and_list(users):
+    records = []
+    for number, user in users.items():
+        record = dict(user)
+        record["account_number"] = number
+        records.append(record)
+    return users, records
+
+
+def as_accounts(users):
+    return {number: Account.from_record(number, user) for number, user in users.items()}
+
+
+def as_table(users):
+    return AccountTable.from_users(users)
+
+
+LAYOUTS = [
+    ("dicts, as loaded", as_dicts),
+    ("dicts + users_as_list copies", as_dicts_and_list),
+    ("Account objects (__slots__)", as_accounts),
+    ("AccountTable (NumPy columns)", as_table),
+]
+
+
+# ─── BENCHMARK ──────────────────────────────────────────────────────────────────
+
+
+def measure(text, build):
+    """
+    The bytes still allocated once the layout is built from the JSON
+    text and the parsed dictionaries are dropped, and the build time
+    (measured apart, tracemalloc slows everything down)
+    """
+    users = json.loads(text)
+    start = time.perf_counter()
+    build(users)
+    elapsed = time.perf_counter() - start
+    del users
+    gc.collect()
+    tracemalloc.start()
+    users = json.loads(text)
+    layout = build(users)
+    del users
+    gc.collect()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return layout, size, elapsed
+
+
+def run(count):
+    text = json.dumps(make_bank(count))
+    print("%d accounts (%.1f MB of JSON)" % (count, len(text) / 1e6))
+    for label, build in LAYOUTS:
+        layout, size, elapsed = measure(text, build)
+        print("  %-32s %9.1f MB %7.0f bytes/account   built in %6.2f s" % (
+            label, size / 1e6, size / count, elapsed))
+        del layout
+
+    users = json.loads(text)
+    table = AccountTable.from_users(users)
+    start = time.perf_counter()
+    totals = Counter()
+    for user in users.values():
+        totals[user["country"]] += user["balance"]
+    print("  %-32s %9.1f ms" % ("balance by country, dicts", (time.perf_counter() - start) * 1000))
+    start = time.perf_counter()
+    table.total_balance_by("country")
+    print("  %-32s %9.1f ms" % ("balance by country, table", (time.perf_counter() - start) * 1000))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, nargs="+", default=[100000, 1000000])
+    arguments = parser.parse_args()
+    for accounts in arguments.accounts:
+        run(accounts)
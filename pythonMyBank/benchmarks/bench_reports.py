@@ -0,0 +1,63 @@
+"""
+Benchmark of the segment reports: the report by every dimension of a
+synthetic snapshot file, with 1, 2, 4... worker processes, and the
+speedup over one worker. The speedup is bounded by the number of CPUs
+of the machine, printed first.
+
+    python benchmarks/bench_reports.py --accounts 10000000 --workers 1 2 4 8
+    python benchmarks/bench_reports.py --file bank.snap
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import snapshot  # noqa: E402
+from datagen import iter_accounts  # noqa: E402
+from reports import build_report  # noqa: E402
+
+# ─── BENCHMARK ──────────────────────────────────────────────────────────────────
+
+
+def write_bank(path, count):
+    start = time.perf_counter()
+    with open(path, "wb") as f:
+        snapshot.write_records(f, ((account["account_number"], account) for account in iter_accounts(count)))
+    print("%d accounts written in %.1f s (%.0f MB)" % (count, time.perf_counter() - start,
+                                                       os.path.getsize(path) / 1e6))
+
+
+def run(path, workers):
+    print("%d CPUs" % os.cpu_count())
+    baseline = None
+    for count in workers:
+        start = time.perf_counter()
+        report = build_report(path, workers=count)
+        elapsed = time.perf_counter() - start
+        baseline = baseline or elapsed
+        accounts = sum(stats["count"] for stats in report["country"].values())
+        print("%3d workers %8.2f s  %12.0f accounts/s  speedup %5.2fx" % (count, elapsed, accounts / elapsed,
+                                                                        baseline / elapsed))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=10000000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--file", help="an existing snapshot file to report on, instead of a synthetic one")
+    arguments = parser.parse_args()
+    if arguments.file:
+        run(arguments.file, arguments.workers)
+    else:
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "bank.snap")
+            write_bank(path, arguments.accounts)
+            run(path, arguments.workers)
+        finally:
+            shutil.rmtree(directory)
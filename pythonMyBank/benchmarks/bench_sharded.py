@@ -0,0 +1,135 @@
+"""
+Latency of a single transfer (TransactionEngine.transfer, what the menu
+and the command line run) as the bank grows, on the sharded store and
+on the JSON store. The sharded store is filled straight from the data
+generator, so banks larger than the memory can be measured.
+
+    python benchmarks/bench_sharded.py --accounts 10000 100000 1000000 10000000
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from account_store import AccountStore  # noqa: E402
+from datagen import iter_accounts, make_bank  # noqa: E402
+from sharded_store import ShardedStore  # noqa: E402
+from transactions import TRANSFERRED, TransactionEngine  # noqa: E402
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+# the account numbers the transfers are made between
+SAMPLE = 10000
+# above this the JSON store is not measured, its file no longer fits in memory comfortably
+JSON_LIMIT = 1000000
+
+
+# ─── BENCHMARK ──────────────────────────────────────────────────────────────────
+
+
+def sampled(accounts, count, numbers):
+    """
+    Passes (account_number, record) pairs through, keeping about SAMPLE
+    of the account numbers spread over the whole bank
+    """
+    step = max(1, count // SAMPLE)
+    for i, account in enumerate(accounts):
+        number = account.pop("account_number")
+        if i % step == 0:
+            numbers.append(number)
+        yield number, account
+
+
+def disk_usage(path):
+    """
+    The bytes the files under path take on disk (the shards are sparse)
+    """
+    total = 0
+    for directory, _, names in os.walk(path):
+        for name in names:
+            total += os.stat(os.path.join(directory, name)).st_blocks * 512
+    return total
+
+
+def measure(store, numbers, transfers, durable):
+    """
+    Latencies in microseconds of transfers between random sampled accounts
+    """
+    engine = TransactionEngine(store)
+    rng = random.Random(3)
+    latencies = []
+    for i in range(transfers + transfers // 10):
+        sender, receiver = rng.sample(numbers, 2)
+        start = time.perf_counter()
+        status, _, _ = engine.transfer(sender, receiver, 1.0, durable)
+        elapsed = time.perf_counter() - start
+        if status != TRANSFERRED:
+            raise RuntimeError("Transfer refused: %s" % status)
+        # the first tenth warms the caches and is not counted
+        if i >= transfers // 10:
+            latencies.append(elapsed * 1e6)
+    store.commit()
+    latencies.sort()
+    return latencies
+
+
+def report(label, latencies, extra=""):
+    print("  %-14s p50 %8.0f us   p99 %8.0f us   max %9.0f us   mean %8.0f us %s" % (
+        label, latencies[len(latencies) // 2], latencies[int(len(latencies) * 0.99)], latencies[-1],
+        sum(latencies) / len(latencies), extra))
+
+
+def run(count, transfers, durable, directory):
+    print("%d accounts, %d transfers%s" % (count, transfers, "" if durable else " (not synced one by one)"))
+    path = os.path.join(directory, "bank-%d.shards" % count)
+    numbers = []
+    start = time.perf_counter()
+    store = ShardedStore(path)
+    store.bulk_load(sampled(iter_accounts(count), count, numbers), count)
+    built = time.perf_counter() - start
+    store.close()
+    # let the build reach the disk, so the writeback does not slow the transfers down
+    os.sync()
+    store = ShardedStore(path)
+    print("  sharded: %d shards, %.0f MB on disk, built in %.1f s" % (
+        len(store.shard_info()), disk_usage(path) / 1e6, built))
+    # half of the accounts are only met by the transfers, so their pages may have to be
+    # read from the disk; the other half is read once beforehand
+    cold, warm = numbers[::2], numbers[1::2]
+    report("sharded, cold", measure(store, cold, transfers, durable))
+    for number in warm:
+        store.get(number)
+    report("sharded, warm", measure(store, warm, transfers, durable))
+    store.close()
+    shutil.rmtree(path)
+
+    if count <= JSON_LIMIT:
+        path = os.path.join(directory, "bank-%d.json" % count)
+        store = AccountStore(path)
+        store.save(make_bank(count))
+        store.close()
+        store = AccountStore(path)
+        store.load()
+        report("json", measure(store, warm, transfers, durable))
+        store.close()
+        for name in os.listdir(directory):
+            if name.startswith("bank-%d.json" % count):
+                os.remove(os.path.join(directory, name))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--transfers", type=int, default=3000)
+    parser.add_argument("--no-sync", action="store_true", help="do not fsync every transfer")
+    parser.add_argument("--directory", help="where to build the banks (default: a temporary directory)")
+    arguments = parser.parse_args()
+    directory = arguments.directory or tempfile.mkdtemp()
+    for accounts in arguments.accounts:
+        run(accounts, arguments.transfers, not arguments.no_sync, directory)
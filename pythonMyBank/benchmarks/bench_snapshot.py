@@ -0,0 +1,63 @@
+"""
+Benchmark of the binary snapshot format against bank.json: the size of
+the file, the time to write it, to load it back into the dictionaries
+the store keeps, and to stream it chunk by chunk.
+
+    python benchmarks/bench_snapshot.py --accounts 100000 1000000
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import snapshot  # noqa: E402
+from datagen import make_bank  # noqa: E402
+
+# ─── BENCHMARK ──────────────────────────────────────────────────────────────────
+
+
+def timed(function, *arguments):
+    start = time.perf_counter()
+    result = function(*arguments)
+    return result, time.perf_counter() - start
+
+
+def run(count):
+    users = make_bank(count)
+    text, json_write = timed(lambda: json.dumps(users).encode())
+    data, snapshot_write = timed(snapshot.dumps, users)
+    print("%d accounts" % count)
+    print("  %-28s %9.1f MB   %9.1f MB" % ("size (JSON, snapshot)", len(text) / 1e6, len(data) / 1e6))
+    print("  %-28s %9.2f s    %9.2f s" % ("write", json_write, snapshot_write))
+    del users
+
+    loaded, json_load = timed(json.loads, text)
+    del loaded
+    loaded, snapshot_load = timed(snapshot.loads, data)
+    del loaded
+    print("  %-28s %9.2f s    %9.2f s   %4.1fx" % ("load into dictionaries", json_load, snapshot_load,
+                                                  json_load / snapshot_load))
+
+    path = os.path.join(tempfile.mkdtemp(), "bank.snap")
+    with open(path, "wb") as f:
+        f.write(data)
+    _, stream_records = timed(lambda: sum(1 for _ in snapshot.iter_records(path)))
+    _, stream_columns = timed(lambda: sum(sum(columns["balance"]) for _, columns in snapshot.iter_columns(path)))
+    print("  %-28s %9s      %9.2f s   %4.1fx" % ("stream record by record", "", stream_records,
+                                                  json_load / stream_records))
+    print("  %-28s %9s      %9.2f s   %4.1fx" % ("stream columns", "", stream_columns,
+                                                  json_load / stream_columns))
+    os.remove(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, nargs="+", default=[100000, 1000000])
+    arguments = parser.parse_args()
+    for accounts in arguments.accounts:
+        run(accounts)
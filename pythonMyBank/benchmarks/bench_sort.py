@@ -0,0 +1,46 @@
+"""
+Benchmark of the sort engine used by the customer listing and the
+account search. Sorts synthetic accounts by every field the menu offers
+and by a mixed multi-key order, for sizes up to one million accounts.
+
+    python benchmarks/bench_sort.py
+    python benchmarks/bench_sort.py --sizes 1000 10000
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from datagen import make_accounts  # noqa: E402
+from sort_engine import sort_records, text_binary_search  # noqa: E402
+
+# ─── BENCHMARK ──────────────────────────────────────────────────────────────────
+
+
+def time_call(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - start
+
+
+def run(sizes):
+    orders = ["full_name", "account_number", "phone_number", ["country", "city", "-balance"]]
+    for size in sizes:
+        accounts = make_accounts(size)
+        print("── %d accounts ──────────────────────────" % size)
+        for order in orders:
+            _, elapsed = time_call(sort_records, accounts, order)
+            print("  %-40s %8.3f s" % ("sort by " + str(order), elapsed))
+        by_name, _ = time_call(sort_records, accounts, "full_name")
+        query = by_name[size // 2]["full_name"]
+        _, elapsed = time_call(text_binary_search, by_name, "full_name", query)
+        print("  %-40s %8.6f s" % ("binary search by full_name", elapsed))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 100000, 1000000])
+    run(parser.parse_args().sizes)
@@ -0,0 +1,79 @@
+"""
+Benchmark of the cold start of the command line. Runs cli.py transfer
+in a new interpreter again and again on a synthetic bank and reports
+the wall time of a whole run, from starting python to its exit, next to
+an empty interpreter and to importing pandas and matplotlib (what every
+start of the menu used to pay). The modules are byte-compiled first, as
+they are after the first run of an installed copy.
+
+    python benchmarks/bench_startup.py --accounts 1000 --runs 30
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import compileall
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import open_backend  # noqa: E402
+from datagen import make_bank  # noqa: E402
+
+CLI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "cli.py")
+TARGET = 0.05
+
+
+# ─── BENCHMARK ──────────────────────────────────────────────────────────────────
+
+
+def wall_times(command, runs, environment, stderr=None):
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(command, env=environment, check=True, stdout=subprocess.DEVNULL, stderr=stderr)
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def report(label, times):
+    print("  %-40s median %7.1f ms   min %7.1f ms" % (label, statistics.median(times) * 1000, min(times) * 1000))
+
+
+def run(count, runs):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "bank.json")
+    store = open_backend("json", path)
+    store.save(make_bank(count))
+    sender, receiver = list(store.load())[:2]
+    store.close()
+    environment = dict(os.environ, MYBANK_STORAGE="json", MYBANK_DATA=path)
+    compileall.compile_dir(os.path.dirname(CLI), maxlevels=0, quiet=1)
+    print("%d accounts, %d runs" % (count, runs))
+    try:
+        report("python -c pass", wall_times([sys.executable, "-c", "pass"], runs, environment))
+        transfer = wall_times([sys.executable, CLI, "transfer", sender, receiver, "1"], runs, environment)
+        report("cli.py transfer", transfer)
+        report("cli.py show", wall_times([sys.executable, CLI, "show", sender], runs, environment))
+        try:
+            report("import pandas, matplotlib.pyplot",
+                   wall_times([sys.executable, "-c", "import pandas, matplotlib.pyplot"], runs, environment,
+                              subprocess.DEVNULL))
+        except subprocess.CalledProcessError:
+            print("  %-40s skipped (not installed)" % "import pandas, matplotlib.pyplot")
+        print("  transfer target %.0f ms: %s" % (TARGET * 1000, "met" if statistics.median(transfer) < TARGET
+                                                  else "MISSED"))
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=30)
+    arguments = parser.parse_args()
+    run(arguments.accounts, arguments.runs)
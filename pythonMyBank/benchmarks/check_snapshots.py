@@ -0,0 +1,107 @@
+"""
+Check of the read snapshots under concurrent load: writer threads
+transfer money at random between the accounts of a bank while reader
+threads add up all the balances, over and over, from a snapshot. The
+total never changes, so every snapshot must add up to the opening total;
+the same sums made over the live accounts of the store are counted for
+comparison, as they can catch a transfer halfway. Once the readers are
+done, no undo record may be left.
+
+    python benchmarks/check_snapshots.py --accounts 20000 --writers 4 --readers 2 --seconds 5
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import DEFAULT_PATHS, open_backend  # noqa: E402
+from bank import Bank  # noqa: E402
+from transactions import TRANSFERRED  # noqa: E402
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+# whole amounts on whole balances: every sum of them is exact
+OPENING_BALANCE = 1000.0
+
+
+# ─── WORKERS ────────────────────────────────────────────────────────────────────
+
+
+def transfer_at_random(bank, numbers, seed, stop, results):
+    rng = random.Random(seed)
+    done = 0
+    while not stop.is_set():
+        sender, receiver = rng.sample(numbers, 2)
+        status, _, _ = bank.engine.transfer(sender, receiver, float(rng.randint(1, 50)), durable=False)
+        done += status == TRANSFERRED
+    results.append(done)
+
+
+def add_up_balances(bank, expected, stop, results):
+    scans = wrong = live_scans = live_wrong = 0
+    while not stop.is_set():
+        with bank.snapshot() as users:
+            scans += 1
+            wrong += sum(user["balance"] for user in users.values()) != expected
+        try:
+            live_wrong += sum(user["balance"] for user in bank.store.load().values()) != expected
+        except RuntimeError:
+            # an account was opened or closed during the sum
+            live_wrong += 1
+        live_scans += 1
+    results.append((scans, wrong, live_scans, live_wrong))
+
+
+# ─── CHECK ──────────────────────────────────────────────────────────────────────
+
+
+def run(kind, accounts, writers, readers, seconds):
+    directory = tempfile.mkdtemp()
+    store = open_backend(kind, os.path.join(directory, DEFAULT_PATHS[kind]))
+    numbers = [str(6060549800000000 + i) for i in range(accounts)]
+    store.save({number: {"full_name": "Check " + number, "gender": "Others", "balance": OPENING_BALANCE,
+                         "account_creation_date": "2023-01-01", "city": "Kochi", "phone_number": "0",
+                         "age": "30", "country": "India"} for number in numbers})
+    bank = Bank(store)
+    expected = accounts * OPENING_BALANCE
+    stop = threading.Event()
+    transfers, sums = [], []
+    threads = [threading.Thread(target=transfer_at_random, args=(bank, numbers, seed, stop, transfers))
+               for seed in range(writers)]
+    threads += [threading.Thread(target=add_up_balances, args=(bank, expected, stop, sums))
+                for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    store.commit()
+
+    scans, wrong, live_scans, live_wrong = map(sum, zip(*sums))
+    total = sum(user["balance"] for user in store.load().values())
+    undo_records = bank.snapshots.undo_records()
+    print("%-8s %d transfers, %d snapshot sums (%d wrong), %d live sums (%d wrong)" % (
+        kind, sum(transfers), scans, wrong, live_scans, live_wrong))
+    print("         total balance %.2f (expected %.2f), undo records left %d" % (total, expected, undo_records))
+    bank.close()
+    return wrong == 0 and total == expected and undo_records == 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=20000)
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5)
+    arguments = parser.parse_args()
+    passed = all([run(kind, arguments.accounts, arguments.writers, arguments.readers, arguments.seconds)
+                  for kind in ("json", "sqlite", "sharded")])
+    print("PASSED" if passed else "FAILED")
+    sys.exit(0 if passed else 1)
@@ -0,0 +1,194 @@
+"""
+Synthetic bank data for the benchmarks. Accounts and transfers are made
+from a seed, so the same arguments always give the same bank.
+
+The distributions follow a real customer base more than uniform noise
+does: a few common first names and surnames are used a lot and a long
+tail of rare ones a little (Zipf weights), most customers live in the
+big cities of their country, balances are log-normal (many small
+accounts, a few very large ones), ages lean towards 25-45, and the busy
+accounts send and receive most of the transfers.
+
+    python benchmarks/datagen.py bank.json --accounts 100000
+    python benchmarks/datagen.py bank.json --accounts 100000 --transfers transfers.csv --count 1000000
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import bisect
+import csv
+import itertools
+import json
+import os
+import random
+import sys
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from allocator import PREFIX, ROUNDS, SPACE, feistel  # noqa: E402
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+FIRST_NAMES = {
+    "Male": ["Adi", "Nasser", "Shabaareesh", "Mukund", "Shravan", "Sai", "Rahul", "Arjun", "Vikram", "Rohan",
+             "Karthik", "Aditya", "Omar", "Ahmed", "Khalid", "Yousef", "Hamad", "James", "Michael", "David",
+             "Daniel", "Matthew", "Anthony", "Joshua", "Ryan", "Rajesh", "Suresh", "Ganesh", "Anil", "Deepak"],
+    "Female": ["Rachel", "Shilpa", "Varsha", "Priya", "Ananya", "Divya", "Lakshmi", "Meera", "Kavya", "Sneha",
+               "Fatima", "Aisha", "Mariam", "Noura", "Layla", "Emily", "Sarah", "Jessica", "Ashley", "Jennifer",
+               "Olivia", "Sophia", "Pooja", "Neha", "Anjali", "Deepa", "Revathi", "Sunita", "Hessa", "Reem"],
+}
+SURNAMES = ["Varma", "Shetty", "Zane", "Agaram", "Al Khafi", "Narayan", "Iyer", "Nair", "Menon", "Reddy",
+            "Sharma", "Patel", "Gupta", "Rao", "Pillai", "Kumar", "Singh", "Das", "Joshi", "Kulkarni",
+            "Al Mansoori", "Al Hashimi", "Al Suwaidi", "Khan", "Hussain", "Smith", "Johnson", "Williams",
+            "Brown", "Garcia", "Miller", "Davis", "Rodriguez", "Martinez", "Wilson", "Anderson"]
+# pieces the rare surnames of the long tail are made of
+SYLLABLES = ["ra", "chel", "sha", "ba", "ree", "var", "ma", "ad", "nas", "ser", "mu", "kund", "sai",
+             "shil", "pa", "an", "jo", "li", "ke", "vin", "to", "der", "son", "mi", "ya", "ko", "pil", "lai"]
+TAIL_SURNAMES = 20000
+
+# country: (share of the customers, cities with their weights, phone prefix)
+COUNTRIES = {
+    "India": (0.6, {"Mumbai": 30, "Bengaluru": 20, "Chennai": 15, "Delhi": 20, "Kochi": 8, "Hyderabad": 7}, "91"),
+    "UAE": (0.15, {"Dubai": 60, "Abu Dhabi": 30, "Sharjah": 10}, "971"),
+    "USA": (0.25, {"San Diego": 10, "New York": 35, "Los Angeles": 25, "Chicago": 15, "Houston": 15}, "1"),
+}
+GENDERS = {"Male": 48, "Female": 48, "Others": 4}
+FIRST_DAY = date(2015, 1, 1)
+LAST_DAY = date(2024, 12, 31)
+
+
+# ─── SAMPLING ───────────────────────────────────────────────────────────────────
+
+
+class Weighted:
+    """
+    Picks values with the given weights in O(log n), with a cumulative
+    table built once
+    """
+
+    def __init__(self, weights):
+        self.values = list(weights)
+        self.cumulative = list(itertools.accumulate(weights[value] for value in self.values))
+
+    def pick(self, rng):
+        return self.values[bisect.bisect_right(self.cumulative, rng.random() * self.cumulative[-1])]
+
+
+def zipf(values, exponent=1.0):
+    """
+    Weights where the n-th value is used 1/n^exponent as often as the first
+    """
+    return Weighted({value: 1.0 / (rank + 1) ** exponent for rank, value in enumerate(values)})
+
+
+def tail_surnames(rng, count):
+    names = set()
+    while len(names) < count:
+        names.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).title())
+    return sorted(names)
+
+
+# ─── ACCOUNTS ───────────────────────────────────────────────────────────────────
+
+
+def iter_accounts(count, seed=7):
+    """
+    Yields count account records shaped like the ones of bank.json, each
+    carrying its account_number, one at a time, so banks larger than the
+    memory can be written out
+    """
+    rng = random.Random(seed)
+    keys = [random.Random(seed + round_number).randrange(1 << 30) for round_number in range(ROUNDS)]
+    if count > SPACE:
+        raise ValueError("At most %d accounts can be numbered" % SPACE)
+    first_names = {gender: zipf(names) for gender, names in FIRST_NAMES.items()}
+    surnames = zipf(SURNAMES + tail_surnames(random.Random(seed), TAIL_SURNAMES), 0.8)
+    countries = Weighted({country: share for country, (share, _, _) in COUNTRIES.items()})
+    cities = {country: Weighted(weights) for country, (_, weights, _) in COUNTRIES.items()}
+    genders = Weighted(GENDERS)
+    days = (LAST_DAY - FIRST_DAY).days
+    for i in range(count):
+        gender = genders.pick(rng)
+        first_name = first_names["Male" if gender == "Others" else gender].pick(rng)
+        country = countries.pick(rng)
+        yield {
+            "account_number": PREFIX + "%08d" % feistel(i, keys),
+            "full_name": first_name + " " + surnames.pick(rng),
+            "gender": gender,
+            "balance": round(min(rng.lognormvariate(9.5, 1.6), 5e7), 2),
+            "account_creation_date": (FIRST_DAY + timedelta(days=int(days * rng.random() ** 0.7))).isoformat(),
+            "city": cities[country].pick(rng),
+            "phone_number": COUNTRIES[country][2] + str(rng.randint(10 ** 8, 10 ** 10 - 1)),
+            "age": str(min(90, max(18, int(rng.gauss(37, 12))))),
+            "country": country,
+        }
+
+
+def make_accounts(count, seed=7):
+    """
+    Builds a list of count account records shaped like the ones of
+    bank.json, each carrying its account_number
+    """
+    return list(iter_accounts(count, seed))
+
+
+def make_bank(count, seed=7):
+    """
+    The accounts of make_accounts, keyed by account number like bank.json
+    """
+    users = {}
+    for account in make_accounts(count, seed):
+        users[account.pop("account_number")] = account
+    return users
+
+
+# ─── TRANSFERS ──────────────────────────────────────────────────────────────────
+
+
+def make_transfers(numbers, count, seed=11, hot_share=0.01, hot_traffic=0.5):
+    """
+    Builds count transfers between the given account numbers, as (sender,
+    receiver, amount) tuples. hot_share of the accounts take part in
+    hot_traffic of the transfers; amounts are log-normal, most of them
+    small.
+    """
+    rng = random.Random(seed)
+    numbers = list(numbers)
+    hot = numbers[:max(1, int(len(numbers) * hot_share))]
+
+    def pick():
+        return rng.choice(hot) if rng.random() < hot_traffic else rng.choice(numbers)
+
+    transfers = []
+    for _ in range(count):
+        sender = pick()
+        receiver = pick()
+        while receiver == sender and len(numbers) > 1:
+            receiver = pick()
+        transfers.append((sender, receiver, round(rng.lognormvariate(5, 1.5), 2)))
+    return transfers
+
+
+def write_transfers(path, transfers):
+    """
+    Writes transfers in the CSV format of batch.py
+    """
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["sender", "receiver", "amount"])
+        writer.writerows(transfers)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("bank", help="the json file to write the accounts to")
+    parser.add_argument("--accounts", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--transfers", help="also write a CSV file of transfers between the accounts")
+    parser.add_argument("--count", type=int, default=100000, help="how many transfers to write")
+    arguments = parser.parse_args()
+    bank = make_bank(arguments.accounts, arguments.seed)
+    with open(arguments.bank, "w") as f:
+        f.write(json.dumps(bank))
+    if arguments.transfers:
+        write_transfers(arguments.transfers, make_transfers(list(bank), arguments.count, arguments.seed + 4))
@@ -0,0 +1,121 @@
+"""
+Load generator for service.py. Starts the service on a temporary bank
+with synthetic accounts (or uses a running one with --port), opens a
+number of connections and pipelines a mix of "get" and "transfer"
+requests on each, then reports requests/second and latencies.
+
+    python benchmarks/load_service.py --connections 16 --requests 5000
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+
+from backends import open_backend  # noqa: E402
+from datagen import make_accounts  # noqa: E402
+
+
+# ─── SERVICE ────────────────────────────────────────────────────────────────────
+
+
+def start_service(account_count, port):
+    """
+    Creates a temporary bank and starts the service on it in a
+    separate process. Returns the process and the account numbers.
+    """
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "bank.json")
+    accounts = make_accounts(account_count)
+    users = {account.pop("account_number"): account for account in accounts}
+    open_backend("json", path).save(users)
+    environment = dict(os.environ, MYBANK_STORAGE="json", MYBANK_DATA=path)
+    process = subprocess.Popen([sys.executable, os.path.join(HERE, "service.py"), "--port", str(port)],
+                               env=environment, stdout=subprocess.DEVNULL)
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.1).close()
+            break
+        except OSError:
+            time.sleep(0.1)
+    return process, list(users)
+
+
+# ─── CLIENT ─────────────────────────────────────────────────────────────────────
+
+
+async def run_connection(port, numbers, count, window, transfer_share, seed, latencies, failures):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    rng = random.Random(seed)
+    sent_at = {}
+    in_flight = asyncio.Semaphore(window)
+
+    async def read_responses():
+        for _ in range(count):
+            response = json.loads(await reader.readline())
+            latencies.append(time.perf_counter() - sent_at.pop(response["id"]))
+            failures[0] += not response["ok"]
+            in_flight.release()
+
+    responses = asyncio.ensure_future(read_responses())
+    for i in range(count):
+        await in_flight.acquire()
+        if rng.random() < transfer_share:
+            request = {"id": i, "op": "transfer", "sender": rng.choice(numbers),
+                       "receiver": rng.choice(numbers), "amount": rng.randint(1, 100)}
+        else:
+            request = {"id": i, "op": "get", "account_number": rng.choice(numbers)}
+        sent_at[i] = time.perf_counter()
+        writer.write(json.dumps(request).encode() + b"\n")
+        await writer.drain()
+    await responses
+    writer.close()
+
+
+async def run_load(port, numbers, connections, requests, window, transfer_share):
+    latencies = []
+    failures = [0]
+    start = time.perf_counter()
+    await asyncio.gather(*[run_connection(port, numbers, requests, window, transfer_share, seed,
+                                          latencies, failures)
+                           for seed in range(connections)])
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    total = connections * requests
+    print("%d requests over %d connections in %.2f s: %.0f requests/s (%d refused)" % (
+        total, connections, elapsed, total / elapsed, failures[0]))
+    for percentile in (50, 90, 99):
+        print("  p%d latency %.2f ms" % (percentile, latencies[int(len(latencies) * percentile / 100)] * 1000))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=10000)
+    parser.add_argument("--connections", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=2000, help="requests per connection")
+    parser.add_argument("--window", type=int, default=32, help="pipelined requests per connection")
+    parser.add_argument("--transfer-share", type=float, default=0.2)
+    parser.add_argument("--port", type=int, help="use a service already running on this port")
+    arguments = parser.parse_args()
+
+    if arguments.port:
+        service, port = None, arguments.port
+        account_numbers = list(open_backend().load())
+    else:
+        port = 8643
+        service, account_numbers = start_service(arguments.accounts, port)
+    try:
+        asyncio.run(run_load(port, account_numbers, arguments.connections, arguments.requests,
+                             arguments.window, arguments.transfer_share))
+    finally:
+        if service is not None:
+            service.terminate()
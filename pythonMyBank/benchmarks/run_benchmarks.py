@@ -0,0 +1,290 @@
+"""
+The benchmark suite. Runs every core operation of the bank on synthetic
+banks of growing size (see datagen.py) and reports, for each operation
+and size, the throughput, the latency percentiles and the peak memory
+the operation allocated.
+
+The results can be written as JSON and compared with an earlier run;
+operations whose median latency grew by more than the tolerance are
+reported as regressions and make the script exit with status 1.
+
+    python benchmarks/run_benchmarks.py --sizes 1000 10000 100000 1000000 --output results.json
+    python benchmarks/run_benchmarks.py --sizes 1000 10000 --compare results.json
+    python benchmarks/run_benchmarks.py --only transfer sort
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import gc
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import analysis  # noqa: E402
+from accounts import find_accounts, top_accounts_by_balance, users_as_list  # noqa: E402
+from aggregates import BalanceAggregates  # noqa: E402
+from backends import open_backend  # noqa: E402
+from datagen import make_bank, make_transfers  # noqa: E402
+from fuzzy import FuzzyNameIndex  # noqa: E402
+from indexes import SecondaryIndexes  # noqa: E402
+from listing import SortedListing  # noqa: E402
+from quantiles import SegmentedQuantiles  # noqa: E402
+from sort_engine import sort_records, text_binary_search  # noqa: E402
+from transactions import TransactionEngine  # noqa: E402
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+SIZES = [1000, 10000, 100000, 1000000]
+# every operation runs for about this long, or MAX_CALLS times
+TIME_BUDGET = 1.0
+MAX_CALLS = 10000
+TOLERANCE = 1.25
+
+
+# ─── OPERATIONS ─────────────────────────────────────────────────────────────────
+#
+# Every operation gets the bank of the current size and returns the
+# function to time. Whatever it prepares lives only while it is timed.
+
+
+def load_cold(bank):
+    def call():
+        store = open_backend("json", bank["path"])
+        store.load()
+    return call
+
+
+def users_list(bank):
+    return lambda: users_as_list(bank["store"])
+
+
+def sort_by_name(bank):
+    records = users_as_list(bank["store"])
+    return lambda: sort_records(records, "full_name")
+
+
+def binary_search(bank):
+    records = sort_records(users_as_list(bank["store"]), "full_name")
+    names = itertools.cycle([record["full_name"] for record in random.Random(1).sample(records, 100)])
+    return lambda: text_binary_search(records, "full_name", next(names))
+
+
+def transfer(bank):
+    engine = TransactionEngine(bank["store"])
+    transfers = itertools.cycle(make_transfers(bank["numbers"], 1000))
+
+    def call():
+        sender, receiver, amount = next(transfers)
+        engine.transfer(sender, receiver, amount)
+    return call
+
+
+def aggregates_build(bank):
+    users = bank["store"].load()
+    return lambda: BalanceAggregates().reset(users)
+
+
+def aggregates_query(bank):
+    aggregates = BalanceAggregates()
+    aggregates.reset(bank["store"].load())
+    return aggregates.summary
+
+
+def quantiles_build(bank):
+    users = bank["store"].load()
+    return lambda: SegmentedQuantiles().reset(users)
+
+
+def quantile_query(bank):
+    quantiles = SegmentedQuantiles()
+    quantiles.reset(bank["store"].load())
+    return lambda: quantiles.quantile(0.5)
+
+
+def pandas_describe(bank):
+    import pandas  # noqa: F401 (skips the operation when pandas is missing)
+    users = bank["store"].load()
+    return lambda: analysis.describe(users)
+
+
+def index_search(bank):
+    indexes = SecondaryIndexes()
+    indexes.reset(bank["store"].load())
+    cities = itertools.cycle(["Mumbai", "Dubai", "Chicago", "Kochi"])
+    return lambda: find_accounts(bank["store"], indexes, [("city", "=", next(cities)), ("age", "between", 25, 40),
+                                                         ("account_creation_date", "between", "2024-01-01",
+                                                          "2024-01-31")])
+
+
+def fuzzy_search(bank):
+    fuzzy_index = FuzzyNameIndex()
+    users = bank["store"].load()
+    fuzzy_index.reset(users)
+    rng = random.Random(2)
+    queries = []
+    for number in rng.sample(bank["numbers"], 100):
+        name = users[number]["full_name"]
+        position = rng.randrange(len(name))
+        queries.append(name[:position] + name[position + 1:])
+    queries = itertools.cycle(queries)
+    return lambda: fuzzy_index.search(next(queries))
+
+
+def listing_page(bank):
+    listing = SortedListing()
+    listing.reset(bank["store"].load())
+    offsets = itertools.cycle(random.Random(3).sample(range(len(bank["numbers"])), 100))
+    return lambda: listing.page("full_name", next(offsets))
+
+
+def top_balances(bank):
+    return lambda: top_accounts_by_balance(bank["store"], 10)
+
+
+OPERATIONS = [
+    ("load", load_cold),
+    ("users_as_list", users_list),
+    ("sort", sort_by_name),
+    ("binary_search", binary_search),
+    ("transfer", transfer),
+    ("aggregates_build", aggregates_build),
+    ("aggregates_query", aggregates_query),
+    ("quantiles_build", quantiles_build),
+    ("quantile_query", quantile_query),
+    ("describe", pandas_describe),
+    ("index_search", index_search),
+    ("fuzzy_search", fuzzy_search),
+    ("listing_page", listing_page),
+    ("top_balances", top_balances),
+]
+
+
+# ─── MEASURING ──────────────────────────────────────────────────────────────────
+
+
+def percentile(ordered, q):
+    """
+    The nearest-rank percentile of sorted values
+    """
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def measure(call):
+    """
+    Calls the function once under tracemalloc for the peak memory, then
+    repeatedly for the timings
+    """
+    gc.collect()
+    tracemalloc.start()
+    call()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    latencies = []
+    started = time.perf_counter()
+    while len(latencies) < MAX_CALLS and time.perf_counter() - started < TIME_BUDGET:
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    total = sum(latencies)
+    latencies.sort()
+    return {
+        "calls": len(latencies),
+        "throughput": len(latencies) / total if total else None,
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "p99": percentile(latencies, 0.99),
+        "max": latencies[-1],
+        "peak_bytes": peak,
+    }
+
+
+def run(sizes, only=None, seed=7):
+    results = []
+    for size in sizes:
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "bank.json")
+        store = open_backend("json", path)
+        store.save(make_bank(size, seed))
+        bank = {"path": path, "store": store, "numbers": list(store.load())}
+        print("── %d accounts ──────────────────────────────────────────────────────────" % size)
+        for name, prepare in OPERATIONS:
+            if only and name not in only:
+                continue
+            try:
+                result = measure(prepare(bank))
+            except ImportError as error:
+                print("  %-18s skipped (%s)" % (name, error))
+                continue
+            result.update(operation=name, size=size)
+            results.append(result)
+            print("  %-18s %12.1f ops/s   p50 %10.1f us   p99 %10.1f us   peak %10.1f KiB" % (
+                name, result["throughput"], result["p50"] * 1e6, result["p99"] * 1e6, result["peak_bytes"] / 1024))
+        store.close()
+        shutil.rmtree(directory, ignore_errors=True)
+    return results
+
+
+# ─── RESULTS ────────────────────────────────────────────────────────────────────
+
+
+def write_results(path, results, seed):
+    document = {
+        "meta": {
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+        },
+        "results": results,
+    }
+    with open(path, "w") as f:
+        f.write(json.dumps(document, indent=2))
+
+
+def compare(results, baseline_path, tolerance=TOLERANCE):
+    """
+    Prints the median latency of every operation against the baseline
+    run and returns the number of regressions
+    """
+    with open(baseline_path, "r") as f:
+        baseline = {(result["operation"], result["size"]): result for result in json.loads(f.read())["results"]}
+    regressions = 0
+    print("── compared with %s ──────────────────────────────────" % baseline_path)
+    for result in results:
+        before = baseline.get((result["operation"], result["size"]))
+        if before is None:
+            continue
+        ratio = result["p50"] / before["p50"] if before["p50"] else 1.0
+        regressed = ratio > tolerance
+        regressions += regressed
+        print("  %-18s %8d   p50 %10.1f -> %10.1f us   x%5.2f  %s" % (
+            result["operation"], result["size"], before["p50"] * 1e6, result["p50"] * 1e6, ratio,
+            "REGRESSION" if regressed else ""))
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=SIZES)
+    parser.add_argument("--only", nargs="+", help="the operations to run, all by default")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="a JSON file of an earlier run to compare with")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE,
+                        help="the median latency growth reported as a regression")
+    arguments = parser.parse_args()
+    measured = run(arguments.sizes, arguments.only, arguments.seed)
+    if arguments.output:
+        write_results(arguments.output, measured, arguments.seed)
+    if arguments.compare:
+        sys.exit(1 if compare(measured, arguments.compare, arguments.tolerance) else 0)
@@ -0,0 +1,100 @@
+"""
+Stress test of the transaction engine: several processes, each with
+several threads, transfer money at random between a small number of
+accounts of the same bank. Afterwards the total balance must be the
+same as before and no balance may be negative.
+
+    python benchmarks/stress_transfers.py --processes 4 --threads 8
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import DEFAULT_PATHS, open_backend  # noqa: E402
+from transactions import TRANSFERRED, TransactionEngine  # noqa: E402
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+ACCOUNTS = 20
+OPENING_BALANCE = 1000.0
+
+
+# ─── WORKERS ────────────────────────────────────────────────────────────────────
+
+
+def transfer_at_random(engine, numbers, count, seed, results):
+    rng = random.Random(seed)
+    done = 0
+    for _ in range(count):
+        sender, receiver = rng.sample(numbers, 2)
+        status, _, _ = engine.transfer(sender, receiver, float(rng.randint(1, 400)))
+        done += status == TRANSFERRED
+    results.append(done)
+
+
+def run_process(kind, path, numbers, threads, transfers, seed, queue):
+    engine = TransactionEngine(open_backend(kind, path))
+    results = []
+    workers = [threading.Thread(target=transfer_at_random,
+                                args=(engine, numbers, transfers, seed * 1000 + i, results))
+               for i in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    engine.store.commit()
+    queue.put(sum(results))
+
+
+# ─── STRESS TEST ────────────────────────────────────────────────────────────────
+
+
+def run(kind, processes, threads, transfers):
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, DEFAULT_PATHS[kind])
+    store = open_backend(kind, path)
+    numbers = [str(6060549800000000 + i) for i in range(ACCOUNTS)]
+    store.save({number: {"full_name": "Stress " + number, "gender": "Others", "balance": OPENING_BALANCE,
+                         "account_creation_date": "2023-01-01", "city": "Kochi", "phone_number": "0",
+                         "age": "30", "country": "India"} for number in numbers})
+    store.close()
+
+    queue = multiprocessing.Queue()
+    start = time.perf_counter()
+    workers = [multiprocessing.Process(target=run_process,
+                                       args=(kind, path, numbers, threads, transfers, seed, queue))
+               for seed in range(processes)]
+    for worker in workers:
+        worker.start()
+    applied = sum(queue.get() for _ in workers)
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    balances = [user["balance"] for user in open_backend(kind, path).load().values()]
+    total = sum(balances)
+    expected = ACCOUNTS * OPENING_BALANCE
+    print("%-8s %d transfers applied by %d processes x %d threads in %.2f s (%.0f/s)" % (
+        kind, applied, processes, threads, elapsed, applied / elapsed))
+    print("        total balance %.2f (expected %.2f), lowest balance %.2f" % (total, expected, min(balances)))
+    return abs(total - expected) < 1e-6 and min(balances) >= 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--transfers", type=int, default=250, help="transfers per thread")
+    arguments = parser.parse_args()
+    passed = all([run(kind, arguments.processes, arguments.threads, arguments.transfers)
+                  for kind in ("json", "snapshot", "sqlite", "sharded")])
+    print("PASSED" if passed else "FAILED")
+    sys.exit(0 if passed else 1)
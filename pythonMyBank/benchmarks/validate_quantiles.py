@@ -0,0 +1,92 @@
+"""
+Checks the balance quantile sketches against exact pandas results.
+Builds synthetic accounts, feeds them through SegmentedQuantiles (with
+some balances changed and some accounts removed on the way, like
+transfers and closures do) and compares every percentile, overall and
+per country, with pandas' Series.quantile.
+
+The documented bound: the sketch answer lies within the relative
+accuracy (1%) of pandas' answer.
+
+    python benchmarks/validate_quantiles.py --accounts 100000
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd  # noqa: E402
+from datagen import make_accounts  # noqa: E402
+from quantiles import RELATIVE_ACCURACY, SegmentedQuantiles  # noqa: E402
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+PERCENTILES = [0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99]
+
+
+# ─── VALIDATION ─────────────────────────────────────────────────────────────────
+
+
+def within_bound(estimate, exact):
+    """
+    Both interpolate between the two values around the rank, each of
+    which the sketch knows within the relative accuracy
+    """
+    return abs(estimate - exact) <= RELATIVE_ACCURACY * abs(exact) + 1e-9
+
+
+def check(sketches, frame, country=None):
+    balances = frame["balance"] if country is None else frame[frame["country"] == country]["balance"]
+    failures = 0
+    for q in PERCENTILES:
+        estimate = sketches.quantile(q, country=country)
+        exact = balances.quantile(q)
+        ok = within_bound(estimate, exact)
+        failures += not ok
+        print("  %-8s p%-3d exact %14.2f  sketch %14.2f  %s" % (
+            country or "all", round(q * 100), exact, estimate, "ok" if ok else "OUT OF BOUND"))
+    return failures
+
+
+def run(account_count, seed):
+    rng = random.Random(seed)
+    accounts = make_accounts(account_count, seed)
+    for account in accounts:
+        account["balance"] = round(rng.lognormvariate(10, 1.5), 2)
+    users = {account.pop("account_number"): account for account in accounts}
+
+    sketches = SegmentedQuantiles()
+    sketches.reset(users)
+    numbers = list(users)
+    for number in rng.sample(numbers, account_count // 10):
+        old = users[number]
+        new = dict(old, balance=round(old["balance"] * rng.uniform(0.5, 1.5), 2))
+        users[number] = new
+        sketches.apply_changes([(number, old, new)])
+    for number in rng.sample(numbers, account_count // 20):
+        sketches.apply_changes([(number, users.pop(number), None)])
+
+    frame = pd.DataFrame.from_dict(users, orient="index")
+    failures = check(sketches, frame)
+    for country in sorted(frame["country"].unique()):
+        failures += check(sketches, frame, country)
+
+    start = time.perf_counter()
+    for _ in range(10000):
+        sketches.quantile(0.99)
+    print("quantile query: %.2f us" % ((time.perf_counter() - start) / 10000 * 1e6))
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--accounts", type=int, default=100000)
+    parser.add_argument("--seed", type=int, default=5)
+    arguments = parser.parse_args()
+    failed = run(arguments.accounts, arguments.seed)
+    print("PASSED" if not failed else "FAILED (%d out of bound)" % failed)
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,272 @@
+"""
+Charts of the accounts, rendered without a display to PNG or SVG files.
+
+The accounts are first reduced to the few numbers a chart shows (the
+total balance of each country, the number of balances in each range,
+the accounts opened each month), so drawing costs the same for ten
+accounts as for a million. The figures are drawn with matplotlib's Agg
+canvas, not pyplot, so nothing needs a screen and renderers in several
+threads do not share a global figure.
+
+A rendered chart is kept until what it shows changes. Next to the file
+is the checksum of the numbers it was drawn from (balance_by_country.png
+.key); asking for the chart again, from any process, returns the file
+already written when the numbers have the same checksum, without
+importing matplotlib. Within a process, the data version of the backend
+also spares the aggregation while the accounts do not change.
+
+    renderer = ChartRenderer(store)
+    path = renderer.render("balance_by_country", "svg")
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import bisect
+import contextlib
+import math
+import os
+import threading
+import zlib
+from collections import Counter
+import metrics
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+CHARTS = ["balance_by_country", "balance_by_city", "balance_histogram", "account_growth"]
+FORMATS = ["png", "svg"]
+# MYBANK_CHARTS overrides the directory the charts are written to
+CHART_DIRECTORY = "charts"
+# the largest groups get a bar each, the others share one
+MAX_BARS = 15
+HISTOGRAM_BINS = 30
+FIGURE_SIZE = (6.8, 4.2)
+DPI = 100
+
+
+# ─── AGGREGATION ────────────────────────────────────────────────────────────────
+
+
+def balance_by(users, field, max_bars=MAX_BARS):
+    """
+    The total balance and the number of accounts of every value of a
+    field (group by field), largest total first, as (value, total,
+    count) tuples. Past max_bars the smallest groups are added up as
+    "Others".
+    """
+    totals = Counter()
+    counts = Counter()
+    for user in users.values():
+        totals[user[field]] += user["balance"]
+        counts[user[field]] += 1
+    groups = sorted(((value, total, counts[value]) for value, total in totals.items()),
+                    key=lambda group: group[1], reverse=True)
+    if len(groups) > max_bars:
+        rest = groups[max_bars - 1:]
+        groups = groups[:max_bars - 1] + [("Others", sum(group[1] for group in rest),
+                                          sum(group[2] for group in rest))]
+    return groups
+
+
+def balance_histogram(users, bins=HISTOGRAM_BINS):
+    """
+    How many balances fall in each of bins ranges, as (edges, counts).
+    The ranges grow geometrically from the smallest positive balance to
+    the largest, which suits balances spread over several orders of
+    magnitude; balances of zero or less are counted in the first range.
+    """
+    balances = [user["balance"] for user in users.values()]
+    positive = [balance for balance in balances if balance > 0]
+    if not positive:
+        return [0.0, 1.0], [len(balances)]
+    low, high = min(positive), max(positive)
+    if high <= low:
+        return [low, low * 2], [len(balances)]
+    step = (math.log(high) - math.log(low)) / bins
+    edges = [low * math.exp(step * i) for i in range(bins)] + [high]
+    counts = [0] * bins
+    for balance in balances:
+        counts[min(bins - 1, max(0, bisect.bisect_right(edges, balance) - 1))] += 1
+    return edges, counts
+
+
+def accounts_per_month(users):
+    """
+    The number of accounts opened each month, from account_creation_date,
+    as sorted (YYYY-MM, count) pairs. Deleted accounts are not counted.
+    """
+    months = Counter(user["account_creation_date"][:7] for user in users.values())
+    return sorted(months.items())
+
+
+# ─── DRAWING ────────────────────────────────────────────────────────────────────
+
+
+def new_figure():
+    from matplotlib.figure import Figure
+    figure = Figure(figsize=FIGURE_SIZE, dpi=DPI)
+    return figure, figure.add_subplot()
+
+
+def draw_balance_by(groups, label):
+    figure, axes = new_figure()
+    axes.bar([str(group[0]) for group in groups], [group[1] for group in groups])
+    axes.set_xlabel(label)
+    axes.set_ylabel("Total balance")
+    axes.set_title(label + "-wise Balance Analysis")
+    axes.tick_params(axis="x", labelrotation=45 if len(groups) > 6 else 0)
+    figure.tight_layout()
+    return figure
+
+
+def draw_balance_histogram(edges, counts):
+    figure, axes = new_figure()
+    axes.stairs(counts, edges, fill=True)
+    axes.set_xscale("log")
+    axes.set_xlabel("Balance")
+    axes.set_ylabel("Accounts")
+    axes.set_title("Distribution of the Balances")
+    figure.tight_layout()
+    return figure
+
+
+def draw_account_growth(months):
+    figure, axes = new_figure()
+    labels = [month for month, _ in months]
+    opened = [count for _, count in months]
+    total = 0
+    running = []
+    for count in opened:
+        total += count
+        running.append(total)
+    axes.bar(range(len(labels)), opened, color="tab:blue", label="opened in the month")
+    axes.set_ylabel("Accounts opened")
+    cumulative = axes.twinx()
+    cumulative.plot(range(len(labels)), running, color="tab:orange", label="accounts")
+    cumulative.set_ylabel("Accounts")
+    ticks = list(range(0, len(labels), max(1, len(labels) // 12)))
+    axes.set_xticks(ticks)
+    axes.set_xticklabels([labels[i] for i in ticks], rotation=45)
+    axes.set_title("Account Growth")
+    figure.tight_layout()
+    return figure
+
+
+def aggregate(chart, users):
+    """
+    The numbers a chart shows, from the accounts
+    """
+    if chart == "balance_by_country":
+        return balance_by(users, "country")
+    if chart == "balance_by_city":
+        return balance_by(users, "city")
+    if chart == "balance_histogram":
+        return balance_histogram(users)
+    if chart == "account_growth":
+        return accounts_per_month(users)
+    raise ValueError("Unknown chart: " + str(chart))
+
+
+def draw_aggregated(chart, data):
+    """
+    Draws the figure of a chart from the numbers of aggregate()
+    """
+    if chart == "balance_by_country":
+        return draw_balance_by(data, "Country")
+    if chart == "balance_by_city":
+        return draw_balance_by(data, "City")
+    if chart == "balance_histogram":
+        return draw_balance_histogram(*data)
+    if chart == "account_growth":
+        return draw_account_growth(data)
+    raise ValueError("Unknown chart: " + str(chart))
+
+
+def draw(chart, users):
+    """
+    Aggregates the accounts and draws the figure of a chart
+    """
+    return draw_aggregated(chart, aggregate(chart, users))
+
+
+def chart_key(chart, image_format, data):
+    """
+    The checksum of what a rendered file shows: the chart, its format
+    and size, and the numbers it is drawn from
+    """
+    return "%08x" % zlib.crc32(repr((chart, image_format, FIGURE_SIZE, DPI, data)).encode())
+
+
+def read_key(path):
+    """
+    The key stored next to a rendered file, None without one
+    """
+    try:
+        with open(path + ".key") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+# ─── RENDERER ───────────────────────────────────────────────────────────────────
+
+
+class ChartRenderer:
+    """
+    Renders the charts of the accounts of a storage backend to files,
+    and keeps each rendered file until the numbers it shows change (see
+    the top of this file). Given a SnapshotManager, the charts are drawn
+    from a snapshot, so writers go on meanwhile.
+    """
+
+    def __init__(self, store, directory=None, snapshots=None):
+        self.store = store
+        self.snapshots = snapshots
+        self.directory = directory or os.environ.get("MYBANK_CHARTS", CHART_DIRECTORY)
+        self._rendered = {}
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def _accounts(self):
+        """
+        The accounts to draw and their version
+        """
+        if self.snapshots is None:
+            yield self.store.load(), self.store.version
+            return
+        with self.snapshots.snapshot() as users:
+            yield users, users.version
+
+    @metrics.timed("charts.render")
+    def render(self, chart, image_format="png"):
+        """
+        Returns the path of the chart rendered from the current accounts,
+        drawing it only when its numbers changed since it was last drawn,
+        by this process or another one
+        """
+        if chart not in CHARTS:
+            raise ValueError("Unknown chart: " + str(chart))
+        if image_format not in FORMATS:
+            raise ValueError("Unknown image format: " + str(image_format))
+        path = os.path.join(self.directory, chart + "." + image_format)
+        with self._lock, self._accounts() as (users, version):
+            # (version, key) of the file this process last saw up to date
+            rendered = self._rendered.get((chart, image_format))
+            if rendered is not None and rendered[0] == version and read_key(path) == rendered[1] \
+                    and os.path.exists(path):
+                metrics.count("charts_from_cache")
+                return path
+            data = aggregate(chart, users)
+            key = chart_key(chart, image_format, data)
+            if read_key(path) == key and os.path.exists(path):
+                self._rendered[(chart, image_format)] = (version, key)
+                metrics.count("charts_from_cache")
+                return path
+            figure = draw_aggregated(chart, data)
+            os.makedirs(self.directory, exist_ok=True)
+            temporary = path + ".tmp"
+            figure.savefig(temporary, format=image_format)
+            os.replace(temporary, path)
+            with open(path + ".key.tmp", "w") as f:
+                f.write(key + "\n")
+            os.replace(path + ".key.tmp", path + ".key")
+            self._rendered[(chart, image_format)] = (version, key)
+            metrics.count("charts_rendered")
+            return path
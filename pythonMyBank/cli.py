@@ -0,0 +1,320 @@
+"""
+The bank from the command line, one operation per run, for scripts and
+for people who know what they want to do without the menu.
+
+    python cli.py transfer 6060... 6060... 250
+    python cli.py create "Rachel Zane" 1000 Female Chicago 13125550100 29 USA
+    python cli.py show 6060...
+    python cli.py search --field city Mumbai
+    python cli.py list full_name --offset 20
+    python cli.py stats --json
+    python cli.py report --by country age_band --top 3
+    python cli.py report --file bank.snap --workers 8 --json
+    python cli.py chart balance_by_country --format svg
+    python cli.py statement 6060... --from 2024-01-01 --to 2024-01-31
+    python cli.py balance-at 6060... 2024-01-01T12:00
+
+The exit status is 0 when the operation was done and 1 when it was
+refused (unknown account, insufficient balance, ...), with the reason on
+stderr. --json prints the result as JSON instead of text; like
+--metrics, it can be given before or after the command.
+
+Only what an operation needs is loaded: a transfer imports the storage
+and the transaction engine, not pandas, matplotlib or the search
+indexes, and starts in a few tens of milliseconds. So the commands
+import the modules they use themselves.
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import json
+import sys
+import metrics
+from bank import Bank
+from transactions import DONE, TRANSFERRED
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+GENDERS = ("Male", "Female", "Others")
+# listing.LISTED_FIELDS and balance, not imported to keep the start short
+LISTED_FIELDS = ["full_name", "gender", "city", "phone_number", "account_creation_date", "account_number",
+                 "age", "country", "balance"]
+# reports.DIMENSIONS, not imported for the same reason
+REPORT_DIMENSIONS = ["country", "city", "gender", "age_band", "creation_month"]
+SHOWN_FIELDS = [("full_name", "Full name"), ("account_number", "Account number"),
+                ("account_creation_date", "Created at"), ("balance", "Balance"), ("gender", "Gender"),
+                ("city", "City"), ("phone_number", "Phone"), ("age", "Age"), ("country", "Country")]
+
+
+class Refused(Exception):
+    """
+    The operation was not done, for the reason given
+    """
+
+
+# ─── OUTPUT ─────────────────────────────────────────────────────────────────────
+
+
+def print_accounts(accounts, as_json):
+    if as_json:
+        print(json.dumps(accounts, indent=2))
+        return
+    for account in accounts:
+        print("─────────────────────────────────────────────")
+        for field, label in SHOWN_FIELDS:
+            print("%-16s%s" % (label + ":", account[field]))
+        if "similarity" in account:
+            print("%-16s%.0f%%" % ("Similarity:", account["similarity"] * 100))
+    print("\n%d account(s)" % len(accounts))
+
+
+def print_statement(account_number, entries, as_json):
+    from datetime import datetime
+    if as_json:
+        print(json.dumps(entries, indent=2))
+        return
+    for entry in entries:
+        if entry["sender"] == account_number:
+            amount, other, balance = -entry["amount"], "to " + entry["receiver"], entry["sender_balance"]
+        else:
+            amount, other, balance = entry["amount"], "from " + entry["sender"], entry["receiver_balance"]
+        print("%s  %14.2f  %-29s balance %.2f" % (
+            datetime.fromtimestamp(entry["timestamp"]).strftime("%Y-%m-%d %H:%M:%S"), amount, other, balance))
+    print("\n%d transfer(s)" % len(entries))
+
+
+# ─── COMMANDS ───────────────────────────────────────────────────────────────────
+
+
+def transfer(bank, arguments):
+    status, sender, receiver = bank.engine.transfer(arguments.sender, arguments.receiver, arguments.amount)
+    if status != TRANSFERRED:
+        raise Refused(status)
+    if arguments.json:
+        print(json.dumps({"status": status, "amount": arguments.amount}))
+    else:
+        print("Transferred ₹", arguments.amount, "from", sender["full_name"], "to", receiver["full_name"])
+
+
+def create(bank, arguments):
+    if arguments.gender not in GENDERS:
+        raise Refused("invalid gender")
+    from accounts import open_account
+    try:
+        account_number = open_account(bank.engine, arguments.full_name, arguments.balance, arguments.gender,
+                                      arguments.city, arguments.phone_number, arguments.age, arguments.country)
+    except ValueError as error:
+        # a field too long for the backend (see sharded_store.encode)
+        raise Refused(str(error)) from None
+    print(json.dumps({"account_number": account_number}) if arguments.json else account_number)
+
+
+def show(bank, arguments):
+    user = bank.store.get(arguments.account_number)
+    if user is None:
+        raise Refused("unknown account")
+    print_accounts([dict(user, account_number=arguments.account_number)], arguments.json)
+
+
+def update(bank, arguments):
+    if arguments.field == "gender" and arguments.value not in GENDERS:
+        raise Refused("invalid gender")
+    try:
+        status = bank.engine.update(arguments.account_number, {arguments.field: arguments.value})
+    except ValueError as error:
+        raise Refused(str(error)) from None
+    if status != DONE:
+        raise Refused(status)
+
+
+def delete(bank, arguments):
+    status = bank.engine.delete(arguments.account_number)
+    if status != DONE:
+        raise Refused(status)
+
+
+def search(bank, arguments):
+    from accounts import find_accounts, find_similar_accounts
+    if arguments.similar:
+        accounts = find_similar_accounts(bank.store, bank.fuzzy_names, arguments.query)
+    else:
+        accounts = find_accounts(bank.store, bank.indexes, [(arguments.field, "=", arguments.query)])
+        if not accounts:
+            accounts = find_accounts(bank.store, bank.indexes, [(arguments.field, "prefix", arguments.query)])
+    print_accounts(accounts, arguments.json)
+
+
+def list_accounts(bank, arguments):
+    from accounts import accounts_page, top_accounts_by_balance
+    if arguments.field == "balance":
+        accounts = top_accounts_by_balance(bank.store, arguments.offset + arguments.limit,
+                                           arguments.descending)[arguments.offset:]
+    else:
+        accounts = accounts_page(bank.store, bank.listing, arguments.field, arguments.offset, arguments.limit,
+                                 arguments.descending)
+    print_accounts(accounts, arguments.json)
+
+
+def stats(bank, arguments):
+    result = bank.aggregates.summary()
+    result["median"] = bank.quantiles.quantile(0.5, country=arguments.country, city=arguments.city)
+    if arguments.country or arguments.city:
+        # the running aggregates cover the whole bank; a segment only has its quantiles
+        result = {"median": result["median"]}
+        for q in (0.9, 0.99):
+            result["p%d" % round(q * 100)] = bank.quantiles.quantile(q, country=arguments.country,
+                                                                     city=arguments.city)
+    if arguments.json:
+        print(json.dumps(result, indent=2))
+    else:
+        for name, value in result.items():
+            print("%-10s%s" % (name, value))
+
+
+def report(bank, arguments):
+    from reports import build_report, format_table, format_top
+    dimensions = arguments.by or REPORT_DIMENSIONS
+    if arguments.file:
+        result = build_report(arguments.file, dimensions, arguments.top, workers=arguments.workers)
+    else:
+        result = bank.report(dimensions, top=arguments.top, workers=arguments.workers)
+    if arguments.json:
+        print(json.dumps(result, indent=2))
+        return
+    for dimension, groups in result.items():
+        print("── by %s " % dimension)
+        print("\n".join(format_table(groups)))
+        print("\n".join(format_top(groups)))
+        print()
+
+
+def statement(bank, arguments):
+    from ledger import including_day
+    entries = bank.ledger.statement(arguments.account_number, arguments.start, including_day(arguments.end))
+    print_statement(arguments.account_number, entries, arguments.json)
+
+
+def balance_at(bank, arguments):
+    balance = bank.ledger.balance_at(arguments.account_number, arguments.when)
+    if balance is None:
+        raise Refused("no transfer of the account in the ledger")
+    print(json.dumps({"balance": balance}) if arguments.json else balance)
+
+
+def chart(bank, arguments):
+    path = bank.charts.render(arguments.chart, arguments.format)
+    print(json.dumps({"path": path}) if arguments.json else path)
+
+
+# ─── ARGUMENTS ──────────────────────────────────────────────────────────────────
+
+
+def make_parser():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--json", action="store_true", help="print the result as JSON")
+    parser.add_argument("--metrics", action="store_true", help="write mybank_metrics.json/.prom at exit")
+    # the same options after the command; SUPPRESS keeps a command that
+    # is not given them from resetting the ones given before it
+    options = argparse.ArgumentParser(add_help=False)
+    options.add_argument("--json", action="store_true", default=argparse.SUPPRESS,
+                         help="print the result as JSON")
+    options.add_argument("--metrics", action="store_true", default=argparse.SUPPRESS,
+                         help="write mybank_metrics.json/.prom at exit")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    command = commands.add_parser("transfer", parents=[options], help="move money between two accounts")
+    command.add_argument("sender")
+    command.add_argument("receiver")
+    command.add_argument("amount", type=float)
+    command.set_defaults(run=transfer)
+
+    command = commands.add_parser("create", parents=[options], help="open an account and print its number")
+    for field in ("full_name", "balance", "gender", "city", "phone_number", "age", "country"):
+        command.add_argument(field, type=float if field == "balance" else str)
+    command.set_defaults(run=create)
+
+    command = commands.add_parser("show", parents=[options], help="show an account")
+    command.add_argument("account_number")
+    command.set_defaults(run=show)
+
+    command = commands.add_parser("update", parents=[options], help="change one field of an account")
+    command.add_argument("account_number")
+    command.add_argument("field", choices=["full_name", "gender", "city", "phone_number", "age", "country"])
+    command.add_argument("value")
+    command.set_defaults(run=update)
+
+    command = commands.add_parser("delete", parents=[options], help="remove an account")
+    command.add_argument("account_number")
+    command.set_defaults(run=delete)
+
+    command = commands.add_parser("search", parents=[options],
+                                  help="find accounts by a field, or by a name with typos")
+    command.add_argument("query")
+    command.add_argument("--field", default="full_name",
+                         choices=["full_name", "phone_number", "city", "country", "age", "account_creation_date"])
+    command.add_argument("--similar", action="store_true", help="the names closest to the query")
+    command.set_defaults(run=search)
+
+    command = commands.add_parser("list", parents=[options], help="one page of the accounts sorted by a field")
+    command.add_argument("field", nargs="?", default="full_name", choices=LISTED_FIELDS)
+    command.add_argument("--offset", type=int, default=0)
+    command.add_argument("--limit", type=int, default=20)
+    command.add_argument("--descending", action="store_true")
+    command.set_defaults(run=list_accounts)
+
+    command = commands.add_parser("stats", parents=[options],
+                                  help="balance statistics, for the bank or a country/city")
+    segment = command.add_mutually_exclusive_group()
+    segment.add_argument("--country")
+    segment.add_argument("--city")
+    command.set_defaults(run=stats)
+
+    command = commands.add_parser("report", parents=[options],
+                                  help="balance statistics by country, city, gender, age band...")
+    command.add_argument("--by", nargs="+", choices=REPORT_DIMENSIONS, help="the dimensions (default: all)")
+    command.add_argument("--top", type=int, default=5, help="the number of largest accounts of every group")
+    command.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    command.add_argument("--file", help="report on a snapshot file (.snap) instead of the bank")
+    command.set_defaults(run=report)
+
+    command = commands.add_parser("chart", parents=[options],
+                                  help="render a chart to a PNG or SVG file and print its path")
+    command.add_argument("chart", choices=["balance_by_country", "balance_by_city", "balance_histogram",
+                                           "account_growth"])
+    command.add_argument("--format", default="png", choices=["png", "svg"])
+    command.set_defaults(run=chart)
+
+    command = commands.add_parser("statement", parents=[options],
+                                  help="the transfers of an account, between two dates")
+    command.add_argument("account_number")
+    command.add_argument("--from", dest="start", help="YYYY-MM-DD or YYYY-MM-DDTHH:MM[:SS]")
+    command.add_argument("--to", dest="end", help="YYYY-MM-DD (the day included) or YYYY-MM-DDTHH:MM[:SS]")
+    command.set_defaults(run=statement)
+
+    command = commands.add_parser("balance-at", parents=[options],
+                                  help="the balance an account had at a past moment")
+    command.add_argument("account_number")
+    command.add_argument("when", help="YYYY-MM-DD (its midnight) or YYYY-MM-DDTHH:MM[:SS]")
+    command.set_defaults(run=balance_at)
+    return parser
+
+
+def main(argv=None):
+    arguments = make_parser().parse_args(argv)
+    if arguments.metrics:
+        metrics.enable()
+    bank = Bank()
+    try:
+        arguments.run(bank, arguments)
+    except Refused as refusal:
+        print(refusal.args[0], file=sys.stderr)
+        return 1
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 1
+    finally:
+        bank.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
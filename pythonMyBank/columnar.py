@@ -0,0 +1,383 @@
+"""
+Compact in-memory layouts of the accounts, for banks with millions of
+customers.
+
+In bank.json an account is a dictionary of eight strings and a float;
+held as such in Python it costs several hundred bytes. Two smaller
+layouts are offered here:
+
+    Account        one account as an object with __slots__, for point
+                   access: no per-object dictionary, age as an int
+    AccountTable   all the accounts as NumPy columns, for bulk work:
+                   names in one UTF-8 buffer, gender/city/country as
+                   codes into a dictionary of their distinct values,
+                   integer account numbers, ages and phones, balances
+                   in fixed point (cents) and creation dates as days
+
+Both convert from and back to the JSON schema of the storage backends.
+A value the compact column cannot hold as it was typed (a phone with a
+leading zero, an age that is not a number, ...) is kept aside as the
+original string, so the round trip gives back exactly what went in.
+Balances are kept in cents: a fraction of a cent is rounded away.
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import sys
+from datetime import date
+from operator import itemgetter
+import numpy as np
+from backends import ACCOUNT_FIELDS
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+# balances are stored as an integer number of 1/SCALE
+SCALE = 100
+# the fields stored as codes into a dictionary of their distinct values
+CODED_FIELDS = ["gender", "city", "country"]
+# the fields stored as integers, with the integer type of their column
+INTEGER_FIELDS = {"account_number": np.int64, "phone_number": np.int64, "age": np.int16}
+# what an integer column holds for a value kept aside as typed
+MISSING = -1
+EPOCH = date(1970, 1, 1).toordinal()
+MISSING_DAY = np.iinfo(np.int32).min
+
+
+# ─── POINT ACCESS ───────────────────────────────────────────────────────────────
+
+
+def as_integer(text, limit=18):
+    """
+    The integer a string of digits stands for, or None when the string
+    is not exactly how that integer is written (leading zeros, signs,
+    spaces, too many digits, ...)
+    """
+    if isinstance(text, str) and text.isascii() and text.isdigit() and len(text) <= limit \
+            and (text[0] != "0" or text == "0"):
+        return int(text)
+    return None
+
+
+class Account:
+    """
+    One account. With __slots__ the fields live in the object itself,
+    without a dictionary per account; the age is held as an int. Ages
+    are given back as strings, like the JSON schema has them.
+    """
+
+    __slots__ = ("account_number",) + tuple(ACCOUNT_FIELDS)
+
+    def __init__(self, account_number, full_name, gender, balance, account_creation_date, city, phone_number,
+                 age, country):
+        self.account_number = account_number
+        self.full_name = full_name
+        self.gender = gender
+        self.balance = balance
+        self.account_creation_date = account_creation_date
+        self.city = city
+        self.phone_number = phone_number
+        self.age = age
+        self.country = country
+
+    @classmethod
+    def from_record(cls, account_number, record):
+        """
+        The account of a record of the JSON schema
+        """
+        age = as_integer(record["age"], 4)
+        # the few distinct genders, cities, countries and dates are shared
+        # by all the accounts instead of one string each
+        return cls(account_number, record["full_name"], sys.intern(record["gender"]), record["balance"],
+                   sys.intern(record["account_creation_date"]), sys.intern(record["city"]), record["phone_number"],
+                   record["age"] if age is None else age, sys.intern(record["country"]))
+
+    def to_record(self):
+        """
+        The record of the JSON schema, without the account number
+        """
+        return {
+            "full_name": self.full_name,
+            "gender": self.gender,
+            "balance": self.balance,
+            "account_creation_date": self.account_creation_date,
+            "city": self.city,
+            "phone_number": self.phone_number,
+            "age": str(self.age),
+            "country": self.country,
+        }
+
+    def __eq__(self, other):
+        return isinstance(other, Account) and all(getattr(self, name) == getattr(other, name)
+                                                  for name in self.__slots__)
+
+    def __repr__(self):
+        return "Account(%s, %r)" % (self.account_number, self.full_name)
+
+
+# ─── COLUMN ENCODING ────────────────────────────────────────────────────────────
+
+
+def encode_strings(values):
+    """
+    The strings as one UTF-8 buffer and the offsets of every string in
+    it: string i is buffer[offsets[i]:offsets[i + 1]]
+    """
+    joined = "".join(values)
+    if joined.isascii():
+        # one byte per character: the lengths of the strings are their sizes
+        buffer, sizes = joined.encode("ascii"), list(map(len, values))
+    else:
+        encoded = [value.encode("utf-8") for value in values]
+        buffer, sizes = b"".join(encoded), list(map(len, encoded))
+    offsets = np.zeros(len(values) + 1, dtype=np.int64)
+    np.cumsum(sizes, out=offsets[1:])
+    return buffer, offsets
+
+
+def encode_codes(values):
+    """
+    The distinct values, sorted, and for every value the code of its
+    position among them
+    """
+    dictionary = sorted(set(values))
+    positions = {value: code for code, value in enumerate(dictionary)}
+    dtype = np.uint8 if len(dictionary) <= 1 << 8 else np.uint16 if len(dictionary) <= 1 << 16 else np.uint32
+    return dictionary, np.array([positions[value] for value in values], dtype=dtype)
+
+
+def encode_integers(values, dtype):
+    """
+    The integers the strings stand for; the strings that do not stand
+    for one (see as_integer) are returned aside, by row
+    """
+    try:
+        numbers = list(map(int, values))
+        column = np.array(numbers, dtype=dtype)
+    except (TypeError, ValueError, OverflowError):
+        # some value is not a number at all, or too large: one value at a time
+        limit = len(str(np.iinfo(dtype).max)) - 1
+        numbers = [as_integer(value, limit) for value in values]
+        aside = {row: values[row] for row, number in enumerate(numbers) if number is None}
+        return np.array([MISSING if number is None else number for number in numbers], dtype=dtype), aside
+    # values int() reads but that are not written as str() writes them
+    # ("007", " 7", "+7", or not strings at all) are kept as they were
+    written = list(map(str, numbers))
+    if written == values:
+        return column, {}
+    aside = {row: value for row, (text, value) in enumerate(zip(written, values)) if text != value}
+    column[list(aside)] = MISSING
+    return column, aside
+
+
+def encode_days(values):
+    """
+    The YYYY-MM-DD dates as days since 1970-01-01. Every distinct date
+    is parsed once; the dates that are not written as date.isoformat()
+    writes them are returned aside, by row.
+    """
+    dictionary, codes = encode_codes(values)
+    days = np.empty(len(dictionary), dtype=np.int32)
+    for code, value in enumerate(dictionary):
+        try:
+            day = date.fromisoformat(value)
+            days[code] = day.toordinal() - EPOCH if day.isoformat() == value else MISSING_DAY
+        except (TypeError, ValueError):
+            days[code] = MISSING_DAY
+    column = days[codes]
+    aside = {int(row): values[row] for row in np.flatnonzero(column == MISSING_DAY)}
+    return column, aside
+
+
+# ─── COLUMNAR TABLE ─────────────────────────────────────────────────────────────
+
+
+class AccountTable:
+    """
+    All the accounts as NumPy columns, one row per account, sorted by
+    account number so an account is found by binary search without an
+    index.
+
+        table = AccountTable.from_users(store.load())
+        table.total_balance_by("country")
+        table.get("6060549895545293")
+        users = table.to_users()
+
+    The table is a read-only copy: it does not follow the changes of the
+    store, build a new one to see them.
+    """
+
+    def __init__(self, columns, names, name_offsets, dictionaries, aside):
+        self.columns = columns
+        self.names = names
+        self.name_offsets = name_offsets
+        self.dictionaries = dictionaries
+        self.aside = aside
+        self._numbers_aside = {number: row for row, number in aside["account_number"].items()}
+
+    @classmethod
+    def from_users(cls, users):
+        """
+        The table of accounts keyed by account number, as load() returns
+        them
+        """
+        # the columns are read in the order of the dictionary, which is
+        # the order of the records in memory, then sorted by account number
+        numbers = list(users)
+        records = list(users.values())
+        encoded, numbers_aside = encode_integers(numbers, INTEGER_FIELDS["account_number"])
+        order = np.argsort(encoded, kind="stable")
+        rank = np.empty_like(order)
+        rank[order] = np.arange(len(order))
+
+        def sort(column, rows_aside):
+            return column[order], {int(rank[row]): value for row, value in rows_aside.items()}
+
+        columns = {}
+        aside = {}
+        columns["account_number"], aside["account_number"] = sort(encoded, numbers_aside)
+        names = list(map(itemgetter("full_name"), records))
+        names, name_offsets = encode_strings(list(map(names.__getitem__, order.tolist())))
+        dictionaries = {}
+        for field in CODED_FIELDS:
+            dictionaries[field], codes = encode_codes(list(map(itemgetter(field), records)))
+            columns[field] = codes[order]
+        for field in ("phone_number", "age"):
+            columns[field], aside[field] = sort(*encode_integers(list(map(itemgetter(field), records)),
+                                                                 INTEGER_FIELDS[field]))
+        balances = np.array(list(map(itemgetter("balance"), records)), dtype=np.float64)
+        columns["balance"] = np.rint(balances * SCALE).astype(np.int64)[order]
+        columns["account_creation_date"], aside["account_creation_date"] = sort(
+            *encode_days(list(map(itemgetter("account_creation_date"), records))))
+        return cls(columns, names, name_offsets, dictionaries, aside)
+
+    def __len__(self):
+        return len(self.columns["balance"])
+
+    # ─── POINT ACCESS ───────────────────────────────────────────────────────
+
+    def row_of(self, account_number):
+        """
+        The row of an account, or None when it is not in the table
+        """
+        number = as_integer(account_number)
+        if number is None:
+            return self._numbers_aside.get(account_number)
+        numbers = self.columns["account_number"]
+        row = int(np.searchsorted(numbers, number))
+        return row if row < len(numbers) and numbers[row] == number else None
+
+    def value(self, field, row):
+        """
+        The value of a field of a row, as the JSON schema has it
+        """
+        if field == "full_name":
+            return self.names[self.name_offsets[row]:self.name_offsets[row + 1]].decode("utf-8")
+        if field in CODED_FIELDS:
+            return self.dictionaries[field][self.columns[field][row]]
+        if field == "balance":
+            return int(self.columns["balance"][row]) / SCALE
+        if row in self.aside.get(field, ()):
+            return self.aside[field][row]
+        if field == "account_creation_date":
+            return date.fromordinal(int(self.columns[field][row]) + EPOCH).isoformat()
+        return str(self.columns[field][row])
+
+    def account(self, row):
+        """
+        The account of a row
+        """
+        return Account.from_record(self.value("account_number", row),
+                                   {field: self.value(field, row) for field in ACCOUNT_FIELDS})
+
+    def get(self, account_number):
+        """
+        The account of an account number, or None when it is not there
+        """
+        row = self.row_of(account_number)
+        return None if row is None else self.account(row)
+
+    # ─── BULK ACCESS ────────────────────────────────────────────────────────
+
+    def balances(self):
+        """
+        The balances of all the rows, as floats
+        """
+        return self.columns["balance"] / SCALE
+
+    def where(self, field, value):
+        """
+        A boolean mask of the rows whose field has the value, for the
+        coded fields, the age and the creation date
+        """
+        if field in CODED_FIELDS:
+            dictionary = self.dictionaries[field]
+            code = np.searchsorted(dictionary, value) if dictionary else 0
+            if code == len(dictionary) or dictionary[code] != value:
+                return np.zeros(len(self), dtype=bool)
+            return self.columns[field] == code
+        if field == "account_creation_date":
+            return self.columns[field] == date.fromisoformat(value).toordinal() - EPOCH
+        return self.columns[field] == int(value)
+
+    def total_balance_by(self, field):
+        """
+        The total balance of every value of a coded field, like a group
+        by in one pass over two columns
+        """
+        dictionary = self.dictionaries[field]
+        totals = np.bincount(self.columns[field], weights=self.columns["balance"], minlength=len(dictionary))
+        return {value: float(total) / SCALE for value, total in zip(dictionary, totals)}
+
+    def nbytes(self):
+        """
+        The memory held by the columns and the name buffer
+        """
+        return sum(column.nbytes for column in self.columns.values()) + len(self.names) + self.name_offsets.nbytes
+
+    # ─── CONVERSION ─────────────────────────────────────────────────────────
+
+    def _strings(self, field):
+        """
+        The values of a whole integer or date column as the strings of
+        the JSON schema
+        """
+        column = self.columns[field]
+        if field == "account_creation_date":
+            strings = np.datetime_as_string(column.astype("datetime64[D]")).tolist()
+        else:
+            strings = column.astype(str).tolist()
+        for row, value in self.aside.get(field, {}).items():
+            strings[row] = value
+        return strings
+
+    def to_users(self):
+        """
+        The accounts in the JSON schema, keyed by account number
+        """
+        offsets = self.name_offsets.tolist()
+        text = self.names.decode("utf-8")
+        if len(text) != len(self.names):
+            # not only ASCII: the offsets count bytes, not characters
+            text = self.names
+        names = [text[offsets[row]:offsets[row + 1]] for row in range(len(self))]
+        if text is self.names:
+            names = [name.decode("utf-8") for name in names]
+        coded = {field: [self.dictionaries[field][code] for code in self.columns[field].tolist()]
+                 for field in CODED_FIELDS}
+        balances = (self.columns["balance"] / SCALE).tolist()
+        dates = self._strings("account_creation_date")
+        phones = self._strings("phone_number")
+        ages = self._strings("age")
+        users = {}
+        for number, name, gender, balance, created, city, phone, age, country in zip(
+                self._strings("account_number"), names, coded["gender"], balances, dates, coded["city"], phones,
+                ages, coded["country"]):
+            users[number] = {
+                "full_name": name,
+                "gender": gender,
+                "balance": balance,
+                "account_creation_date": created,
+                "city": city,
+                "phone_number": phone,
+                "age": age,
+                "country": country,
+            }
+        return users
@@ -0,0 +1,339 @@
+"""
+The end-of-day run: interest, maintenance fees and minimum-balance
+penalties applied to every account in one pass.
+
+    python eod.py --date 2024-03-31 --rules rules.json --report eod.csv
+
+The balances are taken as NumPy columns of whole cents, and every
+amount is computed on them with integer arithmetic, so the result does
+not depend on how floats round:
+    interest    balance x annual rate x days / days in the year, on a
+                positive balance, rounded half to even to the cent
+    fee         the maintenance fee of the tier, per day
+    penalty     per day, when the balance is below the minimum balance
+The fee and the penalty are never more than what the account holds
+after the interest, so they do not push a balance below zero.
+
+The rules (see DEFAULT_RULES) are given per country, falling back to
+"default", and within a country per balance tier: the tier of an
+account is the last one whose "from" its balance reaches (the first
+tier takes every balance below the second). Rates are exact to a
+millionth, amounts to the cent; anything finer is refused.
+
+The changes of all the accounts are persisted as one atomic change of
+the store (apply_deltas), and the date of the run is kept next to the
+data (bank.json.eod) so the same day is not charged twice.
+
+The date cannot be written in the same change as the balances, so the
+run first writes itself into bank.json.eod as in progress, with a
+fingerprint of the balances before and after it, then applies the
+changes, then marks itself done. A run that finds a run in progress (the
+last one crashed) compares the fingerprint of the balances: equal to
+the one after, the changes were applied and that run is marked done;
+equal to the one before, they were not and that run is forgotten. When
+the balances changed since, the run is refused until --force says they
+were checked.
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import contextlib
+import csv
+import json
+import os
+import time
+import zlib
+from datetime import date
+from decimal import Decimal
+from operator import itemgetter
+import numpy as np
+import metrics
+from backends import open_backend
+from columnar import SCALE, encode_codes
+from transactions import TransactionEngine
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+DEFAULT_RULES = {
+    "days_in_year": 365,
+    "default": {
+        "minimum_balance": 1000,
+        "penalty": 2,
+        "tiers": [
+            {"from": 0, "annual_rate": 0.0, "fee": 0.5},
+            {"from": 10000, "annual_rate": 0.02, "fee": 0},
+            {"from": 100000, "annual_rate": 0.035, "fee": 0},
+        ],
+    },
+    "countries": {
+        "India": {
+            "minimum_balance": 5000,
+            "penalty": 5,
+            "tiers": [
+                {"from": 0, "annual_rate": 0.027, "fee": 0},
+                {"from": 100000, "annual_rate": 0.03, "fee": 0},
+                {"from": 1000000, "annual_rate": 0.035, "fee": 0},
+            ],
+        },
+        "USA": {
+            "minimum_balance": 1500,
+            "penalty": 0.4,
+        },
+    },
+}
+# rates are kept as an integer number of millionths
+RATE_SCALE = 1000000
+# the tiers of every rule set are searched together, the balances of the
+# n-th rule set shifted by n * RULE_SPAN cents
+RULE_SPAN = 1 << 48
+REPORT_FIELDS = ["account_number", "balance", "interest", "fee", "penalty", "new_balance"]
+# what the summary of a run in progress has on top of the summary of the run
+IN_PROGRESS_FIELDS = ("in_progress", "before", "after", "previous")
+
+
+# ─── RULES ──────────────────────────────────────────────────────────────────────
+
+
+def fixed_point(value, scale, what):
+    """
+    A rate or an amount as an integer number of 1/scale, refusing values
+    with more precision than that
+    """
+    scaled = Decimal(str(value)) * scale
+    if scaled != scaled.to_integral_value() or scaled < 0:
+        raise ValueError("%s must be a non-negative multiple of %s: %r" % (what, Decimal(1) / scale, value))
+    return int(scaled)
+
+
+def load_rules(path=None):
+    """
+    The rules of a JSON file shaped like DEFAULT_RULES, or the default
+    rules without a path
+    """
+    if path is None:
+        return DEFAULT_RULES
+    with open(path) as f:
+        return json.load(f)
+
+
+def compile_rules(rules, countries):
+    """
+    The rules as arrays for the given countries (the dictionary of a
+    country column): the rule set of every country, and for every tier
+    of every rule set its shifted lower bound, rate and fee
+    """
+    names = ["default"] + sorted(rules.get("countries", {}))
+    rule_sets = [rules["default"]] + [dict(rules["default"], **rules["countries"][name]) for name in names[1:]]
+    bounds, rates, fees, minimums, penalties = [], [], [], [], []
+    for number, rule_set in enumerate(rule_sets):
+        tiers = sorted(rule_set["tiers"], key=itemgetter("from"))
+        if not tiers:
+            raise ValueError("The rules of %s have no tier" % names[number])
+        for position, tier in enumerate(tiers):
+            bound = 0 if position == 0 else fixed_point(tier["from"], SCALE, "A tier bound")
+            if bound >= RULE_SPAN:
+                raise ValueError("Tier bound too large: %r" % tier["from"])
+            bounds.append(number * RULE_SPAN + bound)
+            rates.append(fixed_point(tier["annual_rate"], RATE_SCALE, "An annual rate"))
+            fees.append(fixed_point(tier.get("fee", 0), SCALE, "A fee"))
+        minimums.append(fixed_point(rule_set.get("minimum_balance", 0), SCALE, "A minimum balance"))
+        penalties.append(fixed_point(rule_set.get("penalty", 0), SCALE, "A penalty"))
+    positions = {name: number for number, name in enumerate(names)}
+    return {
+        "rule_of_country": np.array([positions.get(country, 0) for country in countries], dtype=np.int64),
+        "bounds": np.array(bounds, dtype=np.int64),
+        "rates": np.array(rates, dtype=np.int64),
+        "fees": np.array(fees, dtype=np.int64),
+        "minimums": np.array(minimums, dtype=np.int64),
+        "penalties": np.array(penalties, dtype=np.int64),
+        "days_in_year": int(rules.get("days_in_year", 365)),
+    }
+
+
+# ─── COMPUTATION ────────────────────────────────────────────────────────────────
+
+
+def divide_half_even(numerators, denominator):
+    """
+    The non-negative integer numerators divided by the denominator,
+    rounded half to even, in integers
+    """
+    quotients, remainders = np.divmod(numerators, denominator)
+    twice = remainders * 2
+    quotients += (twice > denominator) | ((twice == denominator) & (quotients % 2 == 1))
+    return quotients
+
+
+@metrics.timed("eod.compute")
+def compute(balances, country_codes, compiled, days=1):
+    """
+    The interest, fee and penalty of every account, in cents, from the
+    balances in cents and the codes of the countries into the
+    dictionary the rules were compiled for
+    """
+    rule = compiled["rule_of_country"][country_codes]
+    positive = np.maximum(balances, 0)
+    keys = rule * RULE_SPAN + np.minimum(positive, RULE_SPAN - 1)
+    tier = np.searchsorted(compiled["bounds"], keys, side="right") - 1
+    rates = compiled["rates"][tier]
+    if len(balances) and int(positive.max()) * int(rates.max()) * days >= 1 << 63:
+        raise ValueError("Balance too large to compute its interest exactly")
+    interest = divide_half_even(positive * rates * days, compiled["days_in_year"] * RATE_SCALE)
+    fees = compiled["fees"][tier] * days
+    penalties = np.where(balances < compiled["minimums"][rule], compiled["penalties"][rule] * days, 0)
+    # what cannot be paid is not charged, the fee first
+    available = np.maximum(balances + interest, 0)
+    fees = np.minimum(fees, available)
+    penalties = np.minimum(penalties, available - fees)
+    return interest, fees, penalties
+
+
+# ─── RUNNING ────────────────────────────────────────────────────────────────────
+
+
+def read_last_run(store):
+    """
+    The summary of the last end-of-day run of the store, or None
+    """
+    try:
+        with open(store.path + ".eod") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_last_run(store, summary):
+    """
+    Replaces the summary of the last run, or removes it given None
+    """
+    if summary is None:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(store.path + ".eod")
+        return
+    temporary_path = store.path + ".eod.tmp"
+    with open(temporary_path, "w") as f:
+        json.dump(summary, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, store.path + ".eod")
+
+
+def account_weights(numbers):
+    """
+    The CRC32 of every account number, to weight its balance with
+    """
+    return np.fromiter(map(zlib.crc32, map(str.encode, numbers)), dtype=np.uint64, count=len(numbers))
+
+
+def fingerprint(weights, balances):
+    """
+    A fingerprint of the balances (in cents) of the accounts, whatever
+    their order: the number of accounts, the total, and the total of the
+    balances weighted by account_weights() (modulo 2 ** 64), which a
+    transfer changes too
+    """
+    return [len(balances), int(balances.sum()), int((balances.astype(np.uint64) * weights).sum())]
+
+
+def reconcile(store, last_run, numbers, balances, force=False):
+    """
+    Settles a run left in progress by a crash (see the top of this file)
+    and returns the summary of the last run that was done, or None
+    """
+    if last_run is None or not last_run.get("in_progress"):
+        return last_run
+    current = fingerprint(account_weights(numbers), balances)
+    if current == last_run["after"]:
+        done = {key: value for key, value in last_run.items() if key not in IN_PROGRESS_FIELDS}
+    elif current == last_run["before"] or force:
+        done = last_run["previous"]
+    else:
+        raise ValueError("The end of day of %s was interrupted and the balances changed since: check whether "
+                         "it was applied, then run with --force" % last_run["date"])
+    write_last_run(store, done)
+    return done
+
+
+def write_report(path, numbers, balances, interest, fees, penalties):
+    with open(path, "w", newline="") as f:
+        report = csv.writer(f)
+        report.writerow(REPORT_FIELDS)
+        report.writerows(zip(numbers, *[(column / SCALE).tolist() for column in
+                                        (balances, interest, fees, penalties,
+                                         balances + interest - fees - penalties)]))
+
+
+@metrics.timed("eod.run")
+def run_end_of_day(store, rules=None, day=None, days=1, report_path=None, locks=None, force=False):
+    """
+    Applies the interest, fees and penalties of the business day (today
+    by default) to every account, for days days (e.g. 3 on a Friday, for
+    the weekend). A day that is not after the last run is refused unless
+    forced. locks, if given, is the LockManager of the running
+    transaction engine, whose locks are then held over the whole run.
+    report_path, if given, gets one CSV row per account. Returns a
+    summary with the totals.
+    """
+    if days < 1:
+        raise ValueError("An end of day run covers at least one day, not %d" % days)
+    start = time.perf_counter()
+    day = (day or date.today()).isoformat()
+    with locks.locked_all() if locks is not None else contextlib.nullcontext():
+        users = store.load()
+        numbers = list(users)
+        records = list(users.values())
+        balances = np.rint(np.fromiter(map(itemgetter("balance"), records), dtype=np.float64,
+                                       count=len(records)) * SCALE).astype(np.int64)
+        countries, country_codes = encode_codes(list(map(itemgetter("country"), records)))
+        del users, records
+        last_run = reconcile(store, read_last_run(store), numbers, balances, force)
+        if last_run is not None and last_run["date"] >= day and not force:
+            raise ValueError("The end of day of %s was already run" % last_run["date"])
+        compiled_rules = compile_rules(rules or DEFAULT_RULES, countries)
+        interest, fees, penalties = compute(balances, country_codes, compiled_rules, days)
+        changes = interest - fees - penalties
+        changed = np.flatnonzero(changes)
+        summary = {
+            "date": day,
+            "days": days,
+            "accounts": len(numbers),
+            "changed": len(changed),
+            "interest": int(interest.sum()) / SCALE,
+            "fees": int(fees.sum()) / SCALE,
+            "penalties": int(penalties.sum()) / SCALE,
+        }
+        weights = account_weights(numbers)
+        write_last_run(store, dict(summary, in_progress=True, before=fingerprint(weights, balances),
+                                   after=fingerprint(weights, balances + changes), previous=last_run))
+        store.apply_deltas(dict(zip(map(numbers.__getitem__, changed.tolist()),
+                                    (changes[changed] / SCALE).tolist())))
+        write_last_run(store, summary)
+    if report_path is not None:
+        write_report(report_path, numbers, balances, interest, fees, penalties)
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+
+# ─── MAIN ───────────────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply the interest, fees and penalties of the end of the day.")
+    parser.add_argument("--date", type=date.fromisoformat, help="business day, YYYY-MM-DD (default today)")
+    parser.add_argument("--days", type=int, default=1, help="number of days the run covers")
+    parser.add_argument("--rules", help="JSON file of rules (default: the DEFAULT_RULES of eod.py)")
+    parser.add_argument("--report", help="where to write the per-account amounts (CSV)")
+    parser.add_argument("--force", action="store_true", help="run even if the day was already run")
+    arguments = parser.parse_args()
+    if arguments.days < 1:
+        parser.error("--days must be at least 1")
+
+    store = open_backend()
+    engine = TransactionEngine(store)
+    try:
+        summary = run_end_of_day(store, load_rules(arguments.rules), arguments.date, arguments.days,
+                                 arguments.report, engine.locks, arguments.force)
+    except ValueError as error:
+        parser.exit(1, "%s\n" % error)
+    print("Accounts:", summary["accounts"], " changed:", summary["changed"])
+    print("Interest: %.2f  fees: %.2f  penalties: %.2f" % (summary["interest"], summary["fees"],
+                                                          summary["penalties"]))
+    print("Took %.3f s" % summary["seconds"])
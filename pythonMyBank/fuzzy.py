@@ -0,0 +1,210 @@
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import heapq
+import itertools
+import math
+import threading
+import metrics
+from collections import Counter
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+# the share of trigrams two names must have in common to be similar
+# (matching trigrams over all the trigrams of both names)
+MIN_SIMILARITY = 0.3
+# the same, for a word of the query and a word of a name
+WORD_SIMILARITY = 0.25
+# how many of the most similar words of every query word are tried
+WORD_CANDIDATES = 5
+TOP_K = 10
+
+
+# ─── TRIGRAMS ───────────────────────────────────────────────────────────────────
+
+
+def normalize_name(name):
+    """
+    Lowercases a name and keeps single spaces between its words
+    """
+    return " ".join(str(name).lower().split())
+
+
+def trigrams(name):
+    """
+    The set of 3-letter pieces of every word of the name. Words are
+    padded with two spaces in front and one behind, so the first letters
+    weigh more and "Zan" still has pieces in common with "Zain".
+    """
+    result = set()
+    for word in name.split():
+        padded = "  " + word + " "
+        for i in range(len(padded) - 2):
+            result.add(padded[i:i + 3])
+    return result
+
+
+def similarity(first, second):
+    """
+    The trigrams two sets have in common over all their trigrams, from
+    0 (nothing in common) to 1 (the same trigrams)
+    """
+    if not first or not second:
+        return 0.0
+    common = len(first & second)
+    return common / (len(first) + len(second) - common)
+
+
+# ─── FUZZY INDEX ────────────────────────────────────────────────────────────────
+
+
+class FuzzyNameIndex:
+    """
+    A typo tolerant index of the account names, so "Rachel Zan" finds
+    "Rachel Zain" and "Shabareesh Varma" finds "Shabaareesh Varma".
+
+    Names are made of far fewer distinct words (first names, surnames)
+    than there are accounts, so the trigram index is kept over the words:
+    every trigram points to the words holding it, every word to the
+    names using it, every name to its accounts. Subscribed to a storage
+    backend, it only moves the names that changed.
+
+    A query first finds, for every query word, the similar words of the
+    vocabulary. A word sharing none of the len(query) -
+    ceil(WORD_SIMILARITY * len(query)) + 1 rarest trigrams of the query
+    word cannot be similar enough, so only those posting lists are read
+    to find the candidates; the other lists just count their overlap.
+    The names holding a similar word for every query word are then
+    scored against the whole query, keeping the best k in a heap.
+    """
+
+    def __init__(self, min_similarity=MIN_SIMILARITY, word_similarity=WORD_SIMILARITY):
+        self.min_similarity = min_similarity
+        self.word_similarity = word_similarity
+        self._lock = threading.RLock()
+        self.reset({})
+
+    # ─── LISTENER ───────────────────────────────────────────────────────────
+
+    def reset(self, users):
+        with self._lock:
+            self._names = {}
+            self._accounts = {}
+            self._words = {}
+            self._postings = {}
+            self._trigrams = {}
+            for number, user in users.items():
+                self._add(number, user["full_name"])
+
+    def apply_changes(self, changes):
+        with self._lock:
+            for number, old, new in changes:
+                if old is not None and new is not None and old["full_name"] == new["full_name"]:
+                    continue
+                if old is not None:
+                    self._remove(number)
+                if new is not None:
+                    self._add(number, new["full_name"])
+
+    # ─── UPDATES ────────────────────────────────────────────────────────────
+
+    def _add(self, number, full_name):
+        name = normalize_name(full_name)
+        self._names[number] = name
+        accounts = self._accounts.get(name)
+        if accounts is None:
+            accounts = self._accounts[name] = set()
+            for word in set(name.split()):
+                names = self._words.get(word)
+                if names is None:
+                    names = self._words[word] = set()
+                    pieces = self._trigrams[word] = frozenset(trigrams(word))
+                    for trigram in pieces:
+                        self._postings.setdefault(trigram, set()).add(word)
+                names.add(name)
+        accounts.add(number)
+
+    def _remove(self, number):
+        name = self._names.pop(number, None)
+        if name is None:
+            return
+        accounts = self._accounts[name]
+        accounts.discard(number)
+        if accounts:
+            return
+        del self._accounts[name]
+        for word in set(name.split()):
+            names = self._words[word]
+            names.discard(name)
+            if names:
+                continue
+            del self._words[word]
+            for trigram in self._trigrams.pop(word):
+                words = self._postings[trigram]
+                words.discard(word)
+                if not words:
+                    del self._postings[trigram]
+
+    # ─── QUERIES ────────────────────────────────────────────────────────────
+
+    def similar_words(self, word, k=WORD_CANDIDATES):
+        """
+        The k words of the vocabulary most similar to the given one
+        """
+        wanted = trigrams(word)
+        if not wanted:
+            return set()
+        lists = sorted((self._postings.get(trigram, ()) for trigram in wanted), key=len)
+        needed = max(1, math.ceil(self.word_similarity * len(wanted)))
+        prefix = len(wanted) - needed + 1
+        # Counter counts an iterable in C, much faster than a Python loop
+        overlap = Counter(itertools.chain.from_iterable(lists[:prefix]))
+        for words in lists[prefix:]:
+            overlap.update(overlap.keys() & words)
+        best = []
+        for candidate, common in overlap.items():
+            score = common / (len(wanted) + len(self._trigrams[candidate]) - common)
+            if score < self.word_similarity:
+                continue
+            if len(best) < k:
+                heapq.heappush(best, (score, candidate))
+            elif score > best[0][0]:
+                heapq.heapreplace(best, (score, candidate))
+        return set(candidate for _, candidate in best)
+
+    @metrics.timed("search.fuzzy")
+    def search(self, query, k=TOP_K):
+        """
+        Returns up to k (similarity, account number) pairs, the most
+        similar names first
+        """
+        query = normalize_name(query)
+        wanted = trigrams(query)
+        if not wanted:
+            return []
+        with self._lock:
+            similar = [self.similar_words(word) for word in set(query.split())]
+            similar.sort(key=lambda words: sum(len(self._words[word]) for word in words))
+            candidates = set()
+            for word in similar[0]:
+                candidates.update(self._words[word])
+            for words in similar[1:]:
+                candidates = [name for name in candidates if not words.isdisjoint(name.split())]
+            if not candidates:
+                # no name is close on every word, try the names close on one
+                for words in similar[1:]:
+                    for word in words:
+                        candidates.extend(self._words[word])
+            best = []
+            for name in candidates:
+                # the trigrams of a name are those of its words
+                score = similarity(wanted, frozenset().union(*[self._trigrams[word] for word in name.split()]))
+                if score < self.min_similarity:
+                    continue
+                if len(best) < k:
+                    heapq.heappush(best, (score, name))
+                elif score > best[0][0]:
+                    heapq.heapreplace(best, (score, name))
+            result = []
+            for score, name in sorted(best, reverse=True):
+                for number in sorted(self._accounts[name]):
+                    result.append((score, number))
+        return result[:k]
@@ -0,0 +1,250 @@
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import bisect
+import threading
+import metrics
+from sort_engine import make_text_searchable
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+# the highest character, appended to a prefix to get the end of its range
+PREFIX_END = "\U0010ffff"
+# above this many moved entries an index is rebuilt in one pass
+BULK_CHANGES = 256
+
+
+# ─── NORMALIZATION ──────────────────────────────────────────────────────────────
+
+
+def normalize_text(value):
+    """
+    Names, cities and countries are compared without case and spaces,
+    so "foo bar" finds "FooBar"
+    """
+    return make_text_searchable(str(value))
+
+
+def normalize_phone(value):
+    """
+    Phone numbers are compared on their digits only, so "+91 98-12"
+    finds "919812"
+    """
+    return "".join(character for character in str(value) if character.isdigit())
+
+
+def normalize_age(value):
+    """
+    Ages are stored as typed in, they are compared as numbers. An age
+    that is not a number is not indexed.
+    """
+    try:
+        return int(str(value).strip())
+    except ValueError:
+        return None
+
+
+def normalize_date(value):
+    """
+    Creation dates are YYYY-MM-DD strings, which already sort in date
+    order
+    """
+    return str(value).strip()
+
+
+INDEXED_FIELDS = {
+    "full_name": normalize_text,
+    "phone_number": normalize_phone,
+    "city": normalize_text,
+    "country": normalize_text,
+    "age": normalize_age,
+    "account_creation_date": normalize_date,
+}
+
+
+# ─── FIELD INDEX ────────────────────────────────────────────────────────────────
+
+
+class FieldIndex:
+    """
+    The index of one field: a sorted list of (key, account number) pairs.
+    Equal keys sit next to each other, so an exact, prefix or range query
+    is two binary searches and a slice, and all the accounts sharing a
+    value are found, not just one of them.
+    """
+
+    def __init__(self, normalize):
+        self.normalize = normalize
+        self.entries = []
+
+    def build(self, users, field):
+        entries = []
+        for number, user in users.items():
+            key = self.normalize(user[field])
+            if key is not None:
+                entries.append((key, number))
+        entries.sort()
+        self.entries = entries
+
+    def add(self, key, number):
+        if key is not None:
+            bisect.insort(self.entries, (key, number))
+
+    def remove(self, key, number):
+        if key is None:
+            return
+        position = bisect.bisect_left(self.entries, (key, number))
+        if position < len(self.entries) and self.entries[position] == (key, number):
+            del self.entries[position]
+
+    def replace_many(self, removed, added):
+        """
+        Removes and adds many entries in one pass over the list, for big
+        changes where moving the entries one by one would cost more
+        """
+        removed = set(removed)
+        entries = [entry for entry in self.entries if entry not in removed] if removed else self.entries
+        entries.extend(added)
+        # the list is sorted but for the added tail, which Timsort merges
+        entries.sort()
+        self.entries = entries
+
+    def _slice(self, low, high):
+        """
+        The account numbers of the keys from low to high, both included
+        """
+        start = bisect.bisect_left(self.entries, (low,))
+        # (high, PREFIX_END) sorts after every (high, account number)
+        end = bisect.bisect_right(self.entries, (high, PREFIX_END))
+        return [number for _, number in self.entries[start:end]]
+
+    def _bound(self, value):
+        key = self.normalize(value)
+        if key is None:
+            raise ValueError("Invalid range bound: " + str(value))
+        return key
+
+    def exact(self, value):
+        key = self.normalize(value)
+        return [] if key is None else self._slice(key, key)
+
+    def prefix(self, value):
+        key = self.normalize(value)
+        if not isinstance(key, str):
+            raise ValueError("Prefix queries only work on text fields")
+        return self._slice(key, key + PREFIX_END)
+
+    def range(self, low=None, high=None):
+        """
+        The accounts whose key lies between low and high, both included.
+        A missing bound leaves that side open.
+        """
+        low = None if low is None else self._bound(low)
+        high = None if high is None else self._bound(high)
+        start = 0 if low is None else bisect.bisect_left(self.entries, (low,))
+        end = len(self.entries) if high is None else bisect.bisect_right(self.entries, (high, PREFIX_END))
+        return [number for _, number in self.entries[start:end]]
+
+
+# ─── SECONDARY INDEXES ──────────────────────────────────────────────────────────
+
+
+class SecondaryIndexes:
+    """
+    Indexes on the name, phone number, city, country, age and creation
+    date of the accounts, kept up to date change by change.
+
+    Subscribed to a storage backend, it gets every created, changed or
+    removed account and moves only that account's entries, so a search
+    never has to sort the accounts again. A search is a list of
+    conditions, each one answered by its field index; the account numbers
+    matching all of them are returned.
+    """
+
+    def __init__(self, fields=None):
+        self.fields = dict(INDEXED_FIELDS if fields is None else fields)
+        self.indexes = {field: FieldIndex(normalize) for field, normalize in self.fields.items()}
+        self._lock = threading.RLock()
+
+    # ─── LISTENER ───────────────────────────────────────────────────────────
+
+    def reset(self, users):
+        """
+        Rebuilds every index from all the accounts
+        """
+        with self._lock:
+            for field, index in self.indexes.items():
+                index.build(users, field)
+
+    def apply_changes(self, changes):
+        with self._lock:
+            for field, index in self.indexes.items():
+                removed, added = [], []
+                for number, old, new in changes:
+                    old_key = None if old is None else index.normalize(old[field])
+                    new_key = None if new is None else index.normalize(new[field])
+                    if old_key == new_key and old is not None and new is not None:
+                        continue
+                    if old_key is not None:
+                        removed.append((old_key, number))
+                    if new_key is not None:
+                        added.append((new_key, number))
+                if len(removed) + len(added) > BULK_CHANGES:
+                    index.replace_many(removed, added)
+                    continue
+                for key, number in removed:
+                    index.remove(key, number)
+                for key, number in added:
+                    index.add(key, number)
+
+    # ─── QUERIES ────────────────────────────────────────────────────────────
+
+    def _index(self, field):
+        if field not in self.indexes:
+            raise ValueError("Field is not indexed: " + field)
+        return self.indexes[field]
+
+    def exact(self, field, value):
+        with self._lock:
+            return self._index(field).exact(value)
+
+    def prefix(self, field, value):
+        with self._lock:
+            return self._index(field).prefix(value)
+
+    def range(self, field, low=None, high=None):
+        with self._lock:
+            return self._index(field).range(low, high)
+
+    @metrics.timed("search.indexes")
+    def search(self, conditions):
+        """
+        Returns the sorted account numbers matching all the conditions.
+        A condition is a tuple:
+            (field, "=", value)            exact value
+            (field, "prefix", value)       text starting with value
+            (field, "between", low, high)  value from low to high, a bound
+                                           can be None
+        For example [("city", "=", "Mumbai"), ("age", "between", 25, 40)].
+        The smallest result is intersected with the others.
+        """
+        with self._lock:
+            results = []
+            for condition in conditions:
+                field, operator = condition[0], condition[1]
+                index = self._index(field)
+                if operator == "=":
+                    results.append(index.exact(condition[2]))
+                elif operator == "prefix":
+                    results.append(index.prefix(condition[2]))
+                elif operator == "between":
+                    results.append(index.range(condition[2], condition[3]))
+                else:
+                    raise ValueError("Unknown search operator: " + str(operator))
+        if not results:
+            return []
+        results.sort(key=len)
+        matches = set(results[0])
+        for result in results[1:]:
+            if not matches:
+                break
+            matches.intersection_update(result)
+        return sorted(matches)
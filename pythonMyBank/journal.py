@@ -0,0 +1,136 @@
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import json
+import os
+import threading
+import metrics
+
+
+# ─── JOURNAL ────────────────────────────────────────────────────────────────────
+
+
+class Journal:
+    """
+    An append-only write-ahead journal of the changes made to the accounts.
+
+    Every line is one committed transaction: a JSON object with a list of
+    operations, where an operation is one of
+        ["delta", account_number, amount]   adds amount to the balance
+        ["put", account_number, record]     creates or replaces an account
+        ["del", account_number]             removes an account
+
+    The first line is a header naming the snapshot the journal applies to
+    (the CRC32 of the snapshot file). A journal whose header does not match
+    the snapshot was already folded into it by a checkpoint and is ignored.
+
+    Appends are written to the operating system right away, and commit()
+    makes them durable with fsync. Commits are grouped: a commit that
+    finds its entry already synced by somebody else returns without
+    touching the disk, so many appends share a single fsync.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.base = None
+        self._file = None
+        self._written_seq = 0
+        self._synced_seq = 0
+        self._append_lock = threading.Lock()
+        self._commit_lock = threading.Lock()
+
+    # ─── READING ────────────────────────────────────────────────────────────
+
+    def read(self, base, offset=0):
+        """
+        Returns the transactions of the journal from the given byte offset
+        on, and the offset where reading stopped. A journal that belongs
+        to another snapshot reads as empty. A torn last line, left by a
+        crash in the middle of an append, is not returned.
+        """
+        if not os.path.exists(self.path):
+            return [], 0
+        with open(self.path, "rb") as f:
+            if offset == 0:
+                header = f.readline()
+                if not header.endswith(b"\n") or json.loads(header).get("base") != base:
+                    return [], 0
+                offset = f.tell()
+            f.seek(offset)
+            transactions = []
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    transactions.append(json.loads(line)["ops"])
+                except ValueError:
+                    break
+                offset += len(line)
+        return transactions, offset
+
+    # ─── WRITING ────────────────────────────────────────────────────────────
+
+    def reset(self, base):
+        """
+        Starts an empty journal on top of the snapshot with the given
+        checksum. The new journal replaces the old one atomically.
+        """
+        self.close()
+        temporary_path = self.path + ".tmp"
+        with open(temporary_path, "wb") as f:
+            f.write(json.dumps({"base": base}).encode() + b"\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self.path)
+        self.base = base
+
+    def truncate(self, offset):
+        """
+        Cuts the journal at the given offset, dropping a torn last line
+        so the next append starts on a fresh line.
+        """
+        self.close()
+        with open(self.path, "r+b") as f:
+            f.truncate(offset)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def append(self, ops):
+        """
+        Appends one transaction and returns its sequence number and the
+        journal size after it. The entry reaches the operating system
+        before this returns, commit() makes it survive a power loss.
+        """
+        line = json.dumps({"ops": ops}, separators=(",", ":")).encode() + b"\n"
+        metrics.count("bytes_written", len(line))
+        with self._append_lock:
+            if self._file is None:
+                self._file = open(self.path, "ab", buffering=0)
+            self._file.write(line)
+            self._written_seq += 1
+            return self._written_seq, self._file.tell()
+
+    @metrics.timed("journal.fsync")
+    def commit(self, seq=None):
+        """
+        Makes every transaction up to seq (by default all of them) durable.
+        """
+        if seq is None:
+            seq = self._written_seq
+        if self._synced_seq >= seq:
+            return
+        with self._commit_lock:
+            if self._synced_seq >= seq or self._file is None:
+                return
+            target = self._written_seq
+            os.fsync(self._file.fileno())
+            self._synced_seq = target
+
+    def close(self):
+        """
+        Syncs and closes the journal file
+        """
+        with self._append_lock, self._commit_lock:
+            if self._file is not None:
+                os.fsync(self._file.fileno())
+                self._synced_seq = self._written_seq
+                self._file.close()
+                self._file = None
@@ -0,0 +1,503 @@
+"""
+The ledger: every transfer, kept for good, so statements, audits and
+the balance of an account at a past moment can be answered.
+
+The ledger of a bank lives next to its data (bank.json.ledger):
+    bank.json.ledger        the entries, fixed-width binary records in
+                            the order the transfers were made
+    bank.json.ledger.idx    the account index: sorted runs of
+                            (account, time, entry number) postings
+    bank.json.ledger.runs   where each run of the index starts and the
+                            entries and times it covers
+    bank.json.ledger.lock   keeps the writers of all processes apart
+
+Entries are appended under the lock and their timestamps never go
+backwards, so the entry file is itself sorted by time: the transfers
+between two dates are found by binary search over it.
+
+Every RUN_ENTRIES entries the postings of those entries (one for the
+sender, one for the receiver) are sorted by account and time and
+appended to the index as a run. A statement binary searches the account
+in each run overlapping the dates asked for, then looks at the entries
+not indexed yet, which every process keeps in memory. Runs are never
+rewritten, so appending costs the same however long the ledger gets.
+
+An entry holds the balances of both accounts after the transfer, so the
+balance of an account at a past moment is read off its last entry
+before that moment. Only transfers are recorded: the balance an account
+was opened with, or a balance changed another way, shows in the ledger
+only through the transfers that follow.
+
+The ledger is a separate file from the accounts, so an entry is written
+after the transfer it records was committed to the storage backend
+(TransactionEngine and batch.py do so while the accounts are still
+locked). A process that crashes in between leaves a transfer made but
+not in the ledger: the statements of both accounts miss it and
+balance_at() answers from the entries around it. Nothing is lost from
+the accounts themselves. Replaying the gap is not possible in general:
+a batch commits the net change of many transfers, and the SQLite and
+sharded backends do not keep their transactions once applied. So the
+ledger is the record of the transfers, not a second copy of the
+balances; an audit that must be exact compares the balances of its
+entries with the accounts.
+
+A transfer from an account to itself is refused before it gets here
+(see transactions.valid_amount and SAME_ACCOUNT), as the balances of
+its entry would be wrong.
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import bisect
+import os
+import struct
+import threading
+import time
+import zlib
+import metrics
+from locking import FileLock
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+NUMBER_WIDTH = 24
+# CRC32 of the rest, time in microseconds since the epoch, sender, receiver,
+# amount, balance of the sender after the transfer, balance of the receiver after it
+ENTRY = struct.Struct("<IQ%ds%dsddd" % (NUMBER_WIDTH, NUMBER_WIDTH))
+ENTRY_SIZE = 96
+ENTRY_PADDING = bytes(ENTRY_SIZE - ENTRY.size)
+# account, time, entry number; big-endian, so that sorting the bytes sorts
+# the postings by account, then time
+POSTING = struct.Struct(">%dsQQ" % NUMBER_WIDTH)
+# first entry, entries, first time, last time, first posting, postings
+RUN = struct.Struct("<QQQQQQ")
+RUN_ENTRIES = 16384
+LAST = (1 << 64) - 1
+READ_CHUNK = 256
+
+
+# ─── TIMES ──────────────────────────────────────────────────────────────────────
+
+
+def to_micros(when):
+    """
+    A moment as microseconds since the epoch. Accepts a datetime, a date
+    (its midnight), an ISO 8601 string, or seconds since the epoch;
+    None stays None. Naive dates and times are local time.
+    """
+    # imported here, a transfer does not need it and the command line starts faster
+    from datetime import date, datetime
+    if when is None:
+        return None
+    if isinstance(when, str):
+        when = datetime.fromisoformat(when)
+    if isinstance(when, datetime):
+        return int(when.timestamp() * 1000000)
+    if isinstance(when, date):
+        return int(datetime(when.year, when.month, when.day).timestamp() * 1000000)
+    return int(when * 1000000)
+
+
+def including_day(when):
+    """
+    An end moment given as a bare date (a date, or a YYYY-MM-DD string)
+    as the end of that day, so that the day is included
+    """
+    from datetime import date, datetime
+    if isinstance(when, str) and len(when) == 10:
+        when = date.fromisoformat(when)
+    if isinstance(when, date) and not isinstance(when, datetime):
+        return datetime(when.year, when.month, when.day, 23, 59, 59, 999999)
+    return when
+
+
+def open_ledger(store):
+    """
+    The ledger kept next to the data of a storage backend
+    """
+    return Ledger(store.path + ".ledger")
+
+
+def account_key(account_number):
+    key = account_number.encode("utf-8")
+    if len(key) > NUMBER_WIDTH:
+        raise ValueError("Account number too long for the ledger: %r" % account_number)
+    return key.ljust(NUMBER_WIDTH, b"\0")
+
+
+# ─── LEDGER ─────────────────────────────────────────────────────────────────────
+
+
+class Ledger:
+    """
+    The append-only record of the transfers of a bank, see the top of
+    this file. Entries are returned as dictionaries:
+        entry               its number, from 0 in the order of the ledger
+        timestamp           seconds since the epoch
+        sender, receiver    the account numbers
+        amount
+        sender_balance      the balances right after the transfer
+        receiver_balance
+    """
+
+    def __init__(self, path):
+        """
+        Opens the ledger at path. Nothing is read until it is used.
+        """
+        self.path = path
+        self._lock = threading.RLock()
+        self._writer_lock = None
+        self._file = None
+        self._index_file = None
+        self._append_fd = None
+        self._unsynced = False
+        self._runs = []
+        self._run_ends = []
+        self._indexed = 0
+        self._entries = 0
+        # account number -> [(time, entry number)] of the entries not in a run yet
+        self._tail = {}
+
+    # ─── READING ────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _size(path):
+        try:
+            return os.path.getsize(path)
+        except FileNotFoundError:
+            return 0
+
+    def _read(self, first, count):
+        """
+        The entries first to first + count - 1 as (number, fields)
+        pairs, stopping at one that is not completely written yet
+        """
+        if self._file is None:
+            self._file = open(self.path, "rb")
+        self._file.seek(first * ENTRY_SIZE)
+        data = self._file.read(count * ENTRY_SIZE)
+        entries = []
+        for number, offset in enumerate(range(0, len(data) - ENTRY_SIZE + 1, ENTRY_SIZE), first):
+            fields = ENTRY.unpack_from(data, offset)
+            if zlib.crc32(data[offset + 4:offset + ENTRY.size]) != fields[0]:
+                break
+            entries.append((number, fields))
+        metrics.count("bytes_read", len(data))
+        return entries
+
+    def _refresh(self):
+        """
+        Catches up with the runs and the entries other processes added
+        """
+        runs = self._size(self.path + ".runs") // RUN.size
+        if runs != len(self._runs):
+            with open(self.path + ".runs", "rb") as f:
+                data = f.read(runs * RUN.size)
+            self._runs = [RUN.unpack_from(data, offset) for offset in range(0, len(data), RUN.size)]
+            self._run_ends = [run[3] for run in self._runs]
+            self._indexed = self._runs[-1][0] + self._runs[-1][1] if self._runs else 0
+            self._entries = self._indexed
+            self._tail = {}
+        count = self._size(self.path) // ENTRY_SIZE
+        if count > self._entries:
+            for number, fields in self._read(self._entries, count - self._entries):
+                for key in dict.fromkeys((fields[2], fields[3])):
+                    self._tail.setdefault(key.rstrip(b"\0").decode("utf-8"), []).append((fields[1], number))
+                self._entries = number + 1
+
+    def _entry(self, number, fields):
+        return {
+            "entry": number,
+            "timestamp": fields[1] / 1000000,
+            "sender": fields[2].rstrip(b"\0").decode("utf-8"),
+            "receiver": fields[3].rstrip(b"\0").decode("utf-8"),
+            "amount": fields[4],
+            "sender_balance": fields[5],
+            "receiver_balance": fields[6],
+        }
+
+    def entries(self, numbers):
+        """
+        The entries of the given numbers, in that order
+        """
+        with self._lock:
+            return [self._entry(*self._read(number, 1)[0]) for number in numbers]
+
+    def __len__(self):
+        with self._lock:
+            self._refresh()
+            return self._entries
+
+    def _posting(self, position):
+        self._index_file.seek(position * POSTING.size)
+        return self._index_file.read(POSTING.size)
+
+    def _lower_bound(self, run, target):
+        """
+        The position of the first posting of a run not below target
+        """
+        if self._index_file is None:
+            self._index_file = open(self.path + ".idx", "rb")
+        low, high = run[4], run[4] + run[5]
+        while low < high:
+            middle = (low + high) // 2
+            if self._posting(middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _postings(self, run, position):
+        """
+        The postings of a run from position on, read a chunk at a time
+        """
+        end = run[4] + run[5]
+        while position < end:
+            self._index_file.seek(position * POSTING.size)
+            count = min(READ_CHUNK, end - position)
+            data = self._index_file.read(count * POSTING.size)
+            for offset in range(0, len(data), POSTING.size):
+                yield POSTING.unpack_from(data, offset)
+            position += count
+
+    @metrics.timed("ledger.statement")
+    def statement(self, account_number, start=None, end=None):
+        """
+        The entries of an account (as sender or receiver) from start to
+        end included, oldest first; see to_micros for the accepted
+        moments, None meaning no limit
+        """
+        key = account_key(account_number)
+        low = to_micros(start) or 0
+        high = LAST if end is None else to_micros(end)
+        with self._lock:
+            self._refresh()
+            numbers = []
+            for run in self._runs[bisect.bisect_left(self._run_ends, low):]:
+                if run[2] > high:
+                    break
+                for posting_key, moment, number in self._postings(run, self._lower_bound(run, POSTING.pack(
+                        key, low, 0))):
+                    if posting_key != key or moment > high:
+                        break
+                    numbers.append(number)
+            numbers.extend(number for moment, number in self._tail.get(account_number, ()) if low <= moment <= high)
+            return self.entries(numbers)
+
+    @metrics.timed("ledger.between")
+    def between(self, start=None, end=None, limit=None):
+        """
+        The entries of all the accounts from start to end included,
+        oldest first, at most limit of them
+        """
+        low = to_micros(start) or 0
+        high = LAST if end is None else to_micros(end)
+        with self._lock:
+            self._refresh()
+            first = self._first_at(low)
+            result = []
+            while first < self._entries and (limit is None or len(result) < limit):
+                entries = self._read(first, min(READ_CHUNK, self._entries - first))
+                for number, fields in entries:
+                    if fields[1] > high or len(result) == limit:
+                        return result
+                    result.append(self._entry(number, fields))
+                first += len(entries)
+            return result
+
+    def scan(self, start=None, end=None):
+        """
+        Yields the entries of all the accounts from start to end
+        included, oldest first, reading READ_CHUNK entries at a time, for
+        going over more entries than between() should return at once
+        """
+        low = to_micros(start) or 0
+        high = LAST if end is None else to_micros(end)
+        with self._lock:
+            self._refresh()
+            first = self._first_at(low)
+        while True:
+            with self._lock:
+                entries = self._read(first, READ_CHUNK)
+            if not entries:
+                return
+            for number, fields in entries:
+                if fields[1] > high:
+                    return
+                yield self._entry(number, fields)
+            first += len(entries)
+
+    def _first_at(self, moment):
+        """
+        The number of the first entry at or after a moment, in
+        microseconds, by binary search over the entries
+        """
+        first, last = 0, self._entries
+        while first < last:
+            middle = (first + last) // 2
+            if self._read(middle, 1)[0][1][1] < moment:
+                first = middle + 1
+            else:
+                last = middle
+        return first
+
+    def _last_before(self, account_number, key, moment):
+        """
+        The number of the last entry of an account at or before moment
+        """
+        earlier = [number for at, number in self._tail.get(account_number, ()) if at <= moment]
+        if earlier:
+            return earlier[-1]
+        for run in reversed(self._runs[:bisect.bisect_right([run[2] for run in self._runs], moment)]):
+            position = self._lower_bound(run, POSTING.pack(key, moment, LAST)) - 1
+            if position >= run[4]:
+                posting_key, _, number = POSTING.unpack(self._posting(position))
+                if posting_key == key:
+                    return number
+        return None
+
+    def _first_after(self, account_number, key, moment):
+        """
+        The number of the first entry of an account after moment
+        """
+        for run in self._runs[bisect.bisect_right(self._run_ends, moment):]:
+            position = self._lower_bound(run, POSTING.pack(key, moment + 1, 0))
+            if position < run[4] + run[5]:
+                posting_key, _, number = POSTING.unpack(self._posting(position))
+                if posting_key == key:
+                    return number
+        later = [number for at, number in self._tail.get(account_number, ()) if at > moment]
+        return later[0] if later else None
+
+    @metrics.timed("ledger.balance_at")
+    def balance_at(self, account_number, when):
+        """
+        The balance an account had at a past moment: the balance after
+        its last transfer until then, or, when it made none yet, the
+        balance before its first transfer after. None when the ledger
+        has no transfer of the account at all.
+        """
+        key = account_key(account_number)
+        moment = to_micros(when)
+        with self._lock:
+            self._refresh()
+            number = self._last_before(account_number, key, moment)
+            if number is not None:
+                entry = self.entries([number])[0]
+                return entry["sender_balance"] if entry["sender"] == account_number else entry["receiver_balance"]
+            number = self._first_after(account_number, key, moment)
+            if number is None:
+                return None
+            entry = self.entries([number])[0]
+            if entry["sender"] == account_number:
+                return entry["sender_balance"] + entry["amount"]
+            return entry["receiver_balance"] - entry["amount"]
+
+    # ─── WRITING ────────────────────────────────────────────────────────────
+
+    def writing(self):
+        """
+        The lock every writer holds, across threads and processes
+        """
+        with self._lock:
+            if self._writer_lock is None:
+                self._writer_lock = FileLock(self.path + ".lock")
+        return self._writer_lock
+
+    def record(self, sender_number, receiver_number, amount, sender_balance, receiver_balance, durable=True):
+        """
+        Appends the entry of one transfer and returns it
+        """
+        return self.record_many([(sender_number, receiver_number, amount, sender_balance, receiver_balance)],
+                                durable)[0]
+
+    @metrics.timed("ledger.record")
+    def record_many(self, transfers, durable=True):
+        """
+        Appends the entries of (sender, receiver, amount, sender balance
+        after, receiver balance after) transfers, made in that order, with
+        a single write. With durable=False the fsync is left to commit().
+        """
+        with self._lock, self.writing():
+            self._refresh()
+            size = self._size(self.path)
+            if size > self._entries * ENTRY_SIZE:
+                # a torn entry left by a crash in the middle of an append
+                self._close_files()
+                with open(self.path, "r+b") as f:
+                    f.truncate(self._entries * ENTRY_SIZE)
+            last = self._read(self._entries - 1, 1)[0][1][1] if self._entries else 0
+            moment = max(int(time.time() * 1000000), last)
+            data = []
+            entries = []
+            for sender_number, receiver_number, amount, sender_balance, receiver_balance in transfers:
+                fields = (moment, account_key(sender_number), account_key(receiver_number), float(amount),
+                          float(sender_balance), float(receiver_balance))
+                body = ENTRY.pack(0, *fields)
+                data.append(struct.pack("<I", zlib.crc32(body[4:])) + body[4:] + ENTRY_PADDING)
+                number = self._entries + len(entries)
+                entries.append(self._entry(number, (0,) + fields))
+            if self._append_fd is None:
+                self._append_fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            os.write(self._append_fd, b"".join(data))
+            metrics.count("bytes_written", len(data) * ENTRY_SIZE)
+            if durable:
+                os.fsync(self._append_fd)
+            else:
+                self._unsynced = True
+            self._refresh()
+            while self._entries - self._indexed >= RUN_ENTRIES:
+                self._write_run()
+            return entries
+
+    @metrics.timed("ledger.write_run")
+    def _write_run(self):
+        """
+        Sorts the postings of the next RUN_ENTRIES entries into a new run
+        of the index
+        """
+        first, end = self._indexed, self._indexed + RUN_ENTRIES
+        postings = []
+        moments = []
+        for account, items in self._tail.items():
+            key = account_key(account)
+            for moment, number in items:
+                if number < end:
+                    postings.append(POSTING.pack(key, moment, number))
+                    moments.append(moment)
+        postings.sort()
+        start = self._runs[-1][4] + self._runs[-1][5] if self._runs else 0
+        for path, offset, data in [(self.path + ".idx", start * POSTING.size, b"".join(postings)),
+                                   (self.path + ".runs", len(self._runs) * RUN.size,
+                                    RUN.pack(first, end - first, min(moments), max(moments), start, len(postings)))]:
+            # cut what a crash in the middle of a run left behind, then append
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                os.ftruncate(fd, offset)
+                os.lseek(fd, offset, os.SEEK_SET)
+                os.write(fd, data)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        self._refresh()
+
+    def commit(self):
+        """
+        Makes every entry appended so far durable
+        """
+        with self._lock:
+            if self._unsynced and self._append_fd is not None:
+                os.fsync(self._append_fd)
+            self._unsynced = False
+
+    def _close_files(self):
+        for f in (self._file, self._index_file):
+            if f is not None:
+                f.close()
+        if self._append_fd is not None:
+            if self._unsynced:
+                os.fsync(self._append_fd)
+            os.close(self._append_fd)
+        self._file = self._index_file = self._append_fd = None
+        self._unsynced = False
+
+    def close(self):
+        with self._lock:
+            self._close_files()
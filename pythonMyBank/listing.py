@@ -0,0 +1,146 @@
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import bisect
+import heapq
+import threading
+import metrics
+from indexes import BULK_CHANGES, FieldIndex
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+LISTED_FIELDS = ["full_name", "gender", "city", "phone_number", "account_creation_date",
+                 "account_number", "age", "country"]
+PAGE_SIZE = 20
+
+
+# ─── VALUES ─────────────────────────────────────────────────────────────────────
+
+
+def keep_value(value):
+    """
+    Listings sort the values as they are stored, like sort_records
+    """
+    return value
+
+
+def value_of(number, user, field):
+    """
+    The account number is the key of an account, not one of its fields
+    """
+    return number if field == "account_number" else user[field]
+
+
+# ─── SORTED LISTING ─────────────────────────────────────────────────────────────
+
+
+class SortedListing:
+    """
+    Keeps the accounts in the order of every listed field, so a page of
+    a sorted listing is a slice instead of a sort of all the accounts.
+
+    Subscribed to a storage backend, every field order is a sorted list
+    of (value, account number) pairs that only moves the accounts whose
+    value changed. Transfers do not change any listed field, so they
+    cost nothing here. Balances change all the time; the accounts with
+    the highest balances are found with a heap instead (top_by_balance).
+
+    A page can be asked by offset, or after a cursor: the (value, account
+    number) of the last account shown. A cursor stays right when accounts
+    are opened or closed between two pages.
+    """
+
+    def __init__(self, fields=None):
+        self.fields = list(LISTED_FIELDS if fields is None else fields)
+        self.orders = {field: FieldIndex(keep_value) for field in self.fields}
+        self._lock = threading.RLock()
+
+    # ─── LISTENER ───────────────────────────────────────────────────────────
+
+    def reset(self, users):
+        with self._lock:
+            for field, order in self.orders.items():
+                if field == "account_number":
+                    order.entries = sorted((number, number) for number in users)
+                else:
+                    order.build(users, field)
+
+    def apply_changes(self, changes):
+        with self._lock:
+            for field, order in self.orders.items():
+                removed, added = [], []
+                for number, old, new in changes:
+                    old_key = None if old is None else value_of(number, old, field)
+                    new_key = None if new is None else value_of(number, new, field)
+                    if old_key == new_key and old is not None and new is not None:
+                        continue
+                    if old_key is not None:
+                        removed.append((old_key, number))
+                    if new_key is not None:
+                        added.append((new_key, number))
+                if len(removed) + len(added) > BULK_CHANGES:
+                    order.replace_many(removed, added)
+                    continue
+                for key, number in removed:
+                    order.remove(key, number)
+                for key, number in added:
+                    order.add(key, number)
+
+    # ─── QUERIES ────────────────────────────────────────────────────────────
+
+    def _order(self, field):
+        if field not in self.orders:
+            raise ValueError("Field is not listed: " + field)
+        return self.orders[field]
+
+    def count(self):
+        with self._lock:
+            return len(self._order(self.fields[0]).entries)
+
+    @metrics.timed("listing.page")
+    def page(self, field, offset=0, limit=PAGE_SIZE, descending=False, after=None):
+        """
+        Returns up to limit (value, account number) pairs in the order of
+        the field, starting at offset, or right after the cursor after
+        when it is given
+        """
+        with self._lock:
+            entries = self._order(field).entries
+            if after is not None:
+                after = tuple(after)
+                if descending:
+                    end = bisect.bisect_left(entries, after)
+                    return entries[max(0, end - limit):end][::-1]
+                start = bisect.bisect_right(entries, after)
+                return entries[start:start + limit]
+            if descending:
+                end = len(entries) - offset
+                return entries[max(0, end - limit):max(0, end)][::-1]
+            return entries[offset:offset + limit]
+
+    def iterate(self, field, descending=False, chunk=PAGE_SIZE * 50):
+        """
+        Yields the (value, account number) pairs of every account in the
+        order of the field, a chunk at a time, so nothing is copied or
+        sorted up front
+        """
+        cursor = None
+        while True:
+            entries = self.page(field, limit=chunk, descending=descending, after=cursor)
+            if not entries:
+                return
+            for entry in entries:
+                yield entry
+            cursor = entries[-1]
+
+
+# ─── TOP ACCOUNTS ───────────────────────────────────────────────────────────────
+
+
+@metrics.timed("listing.top_by_balance")
+def top_by_balance(users, count, largest=True):
+    """
+    The count accounts with the highest (or lowest) balance, as (account
+    number, account) pairs, best first. A heap of count elements is kept
+    while going over the accounts once, nothing else is sorted.
+    """
+    pick = heapq.nlargest if largest else heapq.nsmallest
+    return pick(count, users.items(), key=lambda item: item[1]["balance"])
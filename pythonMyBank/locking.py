@@ -0,0 +1,155 @@
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import errno
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+STRIPES = 1024
+
+
+# ─── FILE LOCKS ─────────────────────────────────────────────────────────────────
+
+
+class RangeLock:
+    """
+    Exclusive locks on single bytes of a lock file, shared by every
+    process on the host that opens the same file. Each byte is a separate
+    lock, so one file can hold many independent locks.
+
+    The locks belong to the process, not to the thread, so threads of the
+    same process have to be kept apart with thread locks on top. The file
+    stays open for the life of the object: closing it would release every
+    lock the process holds on it.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+
+    def acquire(self, offset):
+        if fcntl is not None:
+            while True:
+                try:
+                    fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, offset)
+                    return
+                except OSError as error:
+                    # the kernel tracks these locks per process, so two
+                    # processes whose threads wait on each other's stripes
+                    # look like a deadlock even though the stripe order
+                    # rules one out; waiting a moment and retrying is safe
+                    if error.errno != errno.EDEADLK:
+                        raise
+                    time.sleep(0.001)
+        os.lseek(self._fd, offset, os.SEEK_SET)
+        while True:
+            try:
+                msvcrt.locking(self._fd, msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                # LK_LOCK gives up after ten seconds, keep waiting
+                continue
+
+    def release(self, offset):
+        if fcntl is not None:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, offset)
+            return
+        os.lseek(self._fd, offset, os.SEEK_SET)
+        msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+
+
+class FileLock:
+    """
+    A single lock held across the threads and processes of the host,
+    usable as a with block. Re-entrant within a thread.
+    """
+
+    def __init__(self, path):
+        self._range = RangeLock(path)
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        if self._depth == 0:
+            self._range.acquire(0)
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0:
+            self._range.release(0)
+        self._thread_lock.release()
+
+
+# ─── ACCOUNT LOCKS ──────────────────────────────────────────────────────────────
+
+
+class LockManager:
+    """
+    Locks accounts for the threads and processes working on the same
+    bank. Account numbers are hashed onto a fixed number of stripes; each
+    stripe is a thread lock plus one byte of the lock file.
+
+    Locks of several accounts are always taken in ascending stripe order,
+    so two transfers between the same pair of accounts in opposite
+    directions cannot wait on each other forever.
+    """
+
+    def __init__(self, path, stripes=STRIPES):
+        self.stripes = stripes
+        self._range = RangeLock(path)
+        self._thread_locks = [threading.Lock() for _ in range(stripes)]
+
+    def stripe(self, account_number):
+        return zlib.crc32(account_number.encode()) % self.stripes
+
+    def _acquire(self, stripes):
+        for stripe in stripes:
+            self._thread_locks[stripe].acquire()
+            try:
+                self._range.acquire(stripe)
+            except BaseException:
+                self._thread_locks[stripe].release()
+                self._release(stripes[:stripes.index(stripe)])
+                raise
+
+    def _release(self, stripes):
+        for stripe in reversed(stripes):
+            self._range.release(stripe)
+            self._thread_locks[stripe].release()
+
+    @contextmanager
+    def locked(self, *account_numbers):
+        """
+        Holds the locks of the given accounts for a with block
+        """
+        stripes = sorted(set(self.stripe(number) for number in account_numbers))
+        self._acquire(stripes)
+        try:
+            yield
+        finally:
+            self._release(stripes)
+
+    @contextmanager
+    def locked_all(self):
+        """
+        Holds the locks of every account, e.g. for a batch that may
+        touch any of them
+        """
+        stripes = list(range(self.stripes))
+        self._acquire(stripes)
+        try:
+            yield
+        finally:
+            self._release(stripes)
@@ -1,16 +1,29 @@
 # ─── IMPORTS ────────────────────────────────────────────────────────────────────
-import math
-import json
 import os
-import random
+import sys
 from datetime import datetime
-from os.path import exists
-import pandas as pd
-import matplotlib.pyplot as plt
+import analysis
+from accounts import (accounts_of_entries, find_accounts, find_similar_accounts, open_account,
+                      top_accounts_by_balance, users_as_list)
+from bank import Bank
+from ledger import including_day
+from listing import PAGE_SIZE
+import metrics
+from transactions import (HELD, INSUFFICIENT_BALANCE, INVALID_AMOUNT, SAME_ACCOUNT, UNKNOWN_ACCOUNT,
+                          UNKNOWN_RECEIVER, UNKNOWN_SENDER)
 
 # ─── CONSTANTS ──────────────────────────────────────────────────────────────────
 
-FILE_PATH = "bank.json"
+# set by menu option 9: the next command runs under cProfile
+profile_next_command = False
+
+# MYBANK_STORAGE picks the backend: "json" for bank.json (the default),
+# "snapshot" for the binary bank.snap, "sqlite" for an indexed bank.db or
+# "sharded" for the bank.shards directory; MYBANK_DATA overrides the file.
+# The statistics, indexes and listings of BANK are built on first use.
+BANK = Bank()
+STORE = BANK.store
+ENGINE = BANK.engine
 
 
 # ─── DATABASE ───────────────────────────────────────────────────────────────────
@@ -18,24 +31,18 @@ FILE_PATH = "bank.json"
 
 def get_data():
     """
-    Reads the bank information from the data file.
+    Reads the bank information from the storage backend. The json
+    file is only parsed again when it changed on disk, otherwise the
+    cached accounts are returned.
     """
-    # assume none existent file as empty file
-    if not exists(FILE_PATH):
-        return {}
-    f = open(FILE_PATH, "r")
-    data = f.read()
-    # convert string json to python object
-    return json.loads(data)
+    return STORE.load()
 
 
 def set_data(data):
     """
-    Writes the bank information into the data file
+    Writes the bank information into the storage backend
     """
-    f = open(FILE_PATH, "w")
-    json_data = json.dumps(data)
-    f.write(json_data)
+    STORE.save(data)
 
 
 def get_users_as_list():
@@ -45,183 +52,7 @@ def get_users_as_list():
     account_number as a key from outside into the
     data object.
     """
-    result = []
-    users = get_data()
-    for user_account_number in users:
-        user_data = users[user_account_number]
-        user_data["account_number"] = user_account_number
-        result.append(user_data)
-    results_as_ll = list_to_linked_list(result)
-    return results_as_ll
-
-
-# ─── LINKED LIST ────────────────────────────────────────────────────────────────
-
-
-class LinkedList:
-    """
-    A Linked List Node
-    """
-
-    def __init__(self, _value, _next):
-        """
-        Creates the node with a value and reference to
-        the next object
-        """
-        self.value = _value
-        self.next = _next
-
-    def index(self, index):
-        """
-        Similar to A[i], this works as A.index(i)
-        """
-        if index == 0:
-            return self.value
-        else:
-            if self.next is None:
-                return None
-            else:
-                return self.next.index(index - 1)
-
-    def set_index(self, index, value):
-        """
-        Similar to A[i] = value, this is A.set_index(i, value)
-        """
-        if index == 0:
-            self.value = value
-        else:
-            self.next.set_index(index - 1, value)
-
-    def size(self):
-        """
-        Similar to len(A), this is A.size()
-        """
-        if self.next is None:
-            return 1
-        else:
-            return 1 + self.next.size()
-
-    def append(self, x):
-        """
-        Appends a new node to the end of nodes
-        """
-        if self.next is None:
-            self.next = LinkedList(x, None)
-        else:
-            self.next.append(x)
-
-
-def list_to_linked_list(arr):
-    """
-    Converts a Python List to a LinkedList
-    """
-    n = None
-    for i in range(len(arr) - 1, -1, -1):
-        node = LinkedList(arr[i], n)
-        n = node
-    return n
-
-
-# ─── HEAP SORT ──────────────────────────────────────────────────────────────────
-
-
-def heap_sort(input_list, field):
-    """
-    A custom implementation of the heap sort function that
-    also gets a field and then assumes the input_list contains
-    data objects. So it sorts based on a common key on all those
-    functions. This makes possible to sort users based on different
-    aspects, like based on full name or phone number
-    """
-    range_start = int((input_list.size() - 2) / 2)
-    for start in range(range_start, -1, -1):
-        sift_down(input_list, field, start, input_list.size() - 1)
-
-    range_start = int(input_list.size() - 1)
-    for end_index in range(range_start, 0, -1):
-        swap(input_list, end_index, 0)
-        sift_down(input_list, field, 0, end_index - 1)
-    return input_list
-
-
-def swap(input_list, a, b):
-    """
-    Swaps two elements of a list with the python shorthand
-    """
-    a_value = input_list.index(a)
-    b_value = input_list.index(b)
-    input_list.set_index(a, b_value)
-    input_list.set_index(b, a_value)
-
-
-def sift_down(input_list, field, start_index, end_index):
-    """
-    The "Sift Down" function of the heap sort algorithm,
-    customized to also include object fields.
-    """
-    root_index = start_index
-    while True:
-        child = root_index * 2 + 1
-        if child > end_index:
-            break
-        if child + 1 <= end_index and input_list.index(child)[field] < input_list.index(child + 1)[field]:
-            child += 1
-        if input_list.index(root_index)[field] < input_list.index(child)[field]:
-            swap(input_list, child, root_index)
-            root_index = child
-        else:
-            break
-
-
-# ─── BINARY SEARCH ──────────────────────────────────────────────────────────────
-
-
-def text_binary_search(input_list, field, query):
-    """
-    A custom binary search implementation that:
-    (1) Assumes the input_list to have elements of type object
-        and then sorts by a common key in all those objects name
-        "field"
-    (2) Make the text lowercase and trims the text in the fields
-        so for example "foo bar" can match "FooBar"
-    """
-    low = 0
-    high = input_list.size() - 1
-    query = make_text_searchable(query)
-    while low <= high:
-        mid = math.floor((low + high) / 2)
-        if make_text_searchable(input_list.index(mid)[field]) > query:
-            high = mid - 1
-        elif make_text_searchable(input_list.index(mid)[field]) < query:
-            low = mid + 1
-        else:
-            return mid
-    return -1
-
-
-def make_text_searchable(text):
-    """
-    Make the text lowercase the text and removes spaces
-    """
-    return text.lower().replace(" ", "")
-
-
-# ─── ACCOUNT NUMBER ─────────────────────────────────────────────────────────────
-
-
-def generate_account_number():
-    """
-    Generates a new unique account number. The bank
-    prefix number is 6060 5498, the 8 other digits are
-    then generated randomly
-    """
-    prefix = "60605498"
-    result = ""
-    for _ in range(0, 8):
-        random_number = random.randint(1, 9)
-        result += str(random_number)
-
-    return prefix + result
+    return users_as_list(STORE)
 
 
 # ─── TRANSACTION ADMIN ────────────────────────────────────────────────────────────────
@@ -232,27 +63,54 @@ def perform_transaction(sender_number, receiver_number, amount):
     Given two account numbers and a transaction amount, this will move
     the money from the sender account to the recipient account.
     """
-    users = get_data()
+    status, sender, receiver = ENGINE.transfer(sender_number, receiver_number, amount)
+
+    if status == INVALID_AMOUNT:
+        print("The transaction amount must be a number above zero")
+        return
+
+    if status == SAME_ACCOUNT:
+        print("The sender and the recipient must be different accounts")
+        return
 
-    if sender_number not in users:
+    if status == UNKNOWN_SENDER:
         print("Did not find any account with account number: " + sender_number)
         return
 
-    if receiver_number not in users:
+    if status == UNKNOWN_RECEIVER:
         print("Did not find any account with account number: " + receiver_number)
         return
 
-    if users[sender_number]["balance"] < amount:
+    if status == INSUFFICIENT_BALANCE:
         print("Insufficient account balance")
         return
 
-    users[sender_number]["balance"] -= amount
-    users[receiver_number]["balance"] += amount
-
-    set_data(users)
+    if status == HELD:
+        print("The transfer looks suspicious and was held for review")
+        return
 
     print("Transferred ₹", amount, " from account",
-          users[sender_number]["full_name"], "to", users[receiver_number]["full_name"])
+          sender["full_name"], "to", receiver["full_name"])
+
+
+def display_statement(account_number):
+    """
+    Shows the transfers of an account between two dates, from the ledger
+    """
+    start = input("From (YYYY-MM-DD, empty for no limit): ") or None
+    end = input("To (YYYY-MM-DD, empty for no limit): ") or None
+    entries = BANK.ledger.statement(account_number, start, including_day(end))
+    if not entries:
+        print("No transfers of account number", account_number, "in these dates")
+        return
+    for entry in entries:
+        if entry["sender"] == account_number:
+            print(datetime.fromtimestamp(entry["timestamp"]).strftime("%Y-%m-%d %H:%M:%S"), "  Sent ₹",
+                  entry["amount"], "to", entry["receiver"], "  Balance:", entry["sender_balance"])
+        else:
+            print(datetime.fromtimestamp(entry["timestamp"]).strftime("%Y-%m-%d %H:%M:%S"), "  Received ₹",
+                  entry["amount"], "from", entry["sender"], "  Balance:", entry["receiver_balance"])
+    print("\n", len(entries), "transfer(s)")
 
 
 # ─── UPDATE INFORMATION ──────────────────────────────────────────────────────────
@@ -263,7 +121,7 @@ def update_information(account_number):
     Given an account number, this asks the user what to change and then
     changes the properties of that.
     """
-    users = get_data()
+    changes = {}
     print_horizontal_line()
     print(" 1 ∙ Full Name ")
     print_horizontal_line()
@@ -281,27 +139,35 @@ def update_information(account_number):
     print_horizontal_line()
     if command == 1:
         new_name = input("New Full Name: ")
-        users[account_number]["full_name"] = new_name
+        changes["full_name"] = new_name
     if command == 2:
         new_gender = input("New Gender (Male/Female/Others): ")
         if new_gender == 'Male' or new_gender == 'Female' or new_gender == 'Others':
-            users[account_number]["gender"] = new_gender
+            changes["gender"] = new_gender
         else:
             print("Invalid Gender")
     if command == 3:
         new_city = input("New City: ")
-        users[account_number]["city"] = new_city
+        changes["city"] = new_city
     if command == 4:
         new_phone_number = input("New Phone Number: ")
-        users[account_number]["phone_number"] = new_phone_number
+        changes["phone_number"] = new_phone_number
     if command == 5:
         new_age = input("New Age: ")
-        users[account_number]["age"] = new_age
+        changes["age"] = new_age
     if command == 6:
         new_country = input("New Country: ")
-        users[account_number]["country"] = new_country
+        changes["country"] = new_country
 
-    set_data(users)
+    try:
+        status = ENGINE.update(account_number, changes)
+    except ValueError as error:
+        # a field too long for the backend (see sharded_store.encode)
+        print("The account was not changed:", error)
+        return
+    if status == UNKNOWN_ACCOUNT:
+        print("Did not find any account with account number: " + account_number)
+        return
     clean_terminal_screen()
     display_account_information_by_given_account_number(account_number)
 
@@ -313,21 +179,11 @@ def create_new_user(full_name, balance, gender, city, phone_number, age, country
     """
     Creates a new user with the given information
     """
-    users = get_data()
-    date = datetime.today().strftime('%Y-%m-%d')
-    account_number = generate_account_number()
-    users[account_number] = {
-        "full_name": full_name,
-        "gender": gender,
-        "balance": balance,
-        "account_creation_date": date,
-        "city": city,
-        "phone_number": phone_number,
-        "age": age,
-        "country": country
-
-    }
-    set_data(users)
+    try:
+        account_number = open_account(ENGINE, full_name, balance, gender, city, phone_number, age, country)
+    except ValueError as error:
+        print("The account was not opened:", error)
+        return
     display_account_information_by_given_account_number(account_number)
 
 
@@ -336,19 +192,75 @@ def create_new_user(full_name, balance, gender, city, phone_number, age, country
 
 def search_account(field, query):
     """
-    Searches the "query" from the user data in the "field" fields
+    Searches the "query" from the user data in the "field" fields and
+    displays every account that matches. When nobody matches exactly,
+    the accounts whose field starts with the query are shown.
     """
-    users = get_users_as_list()
-    users = heap_sort(users, field)
-    index = text_binary_search(users, field, query)
-    if index == -1:
+    users = find_accounts(STORE, BANK.indexes, [(field, "=", query)])
+    if not users:
+        users = find_accounts(STORE, BANK.indexes, [(field, "prefix", query)])
+    if not users and field == "full_name":
+        fuzzy_search_account(query)
+        return
+    if not users:
         print("──── Error ──────────────────────────────────")
         print("Found no one as", query)
-    else:
-        user = users.index(index)
+    for user in users:
         display_user_object(user, user["account_number"])
 
 
+def fuzzy_search_account(query):
+    """
+    Displays the accounts whose name is the closest to the query, so a
+    name typed with a typo is still found
+    """
+    users = find_similar_accounts(STORE, BANK.fuzzy_names, query)
+    if not users:
+        print("──── Error ──────────────────────────────────")
+        print("Found no one as", query)
+        return
+    print("The names closest to", query, "are:")
+    for user in users:
+        display_user_object(user, user["account_number"])
+        print("Similarity:     ", "%.0f%%" % (user["similarity"] * 100))
+
+
+def ask_range(label):
+    """
+    Asks for the two bounds of a range, an empty answer leaves that
+    side open. Returns None when both are empty.
+    """
+    low = input(label + " from (empty for no limit): ") or None
+    high = input(label + " to (empty for no limit): ") or None
+    return None if low is None and high is None else (low, high)
+
+
+def search_accounts_by_fields():
+    """
+    Asks for values of several fields and displays the accounts
+    matching all of them, for example every customer aged 25 to 40
+    living in Mumbai
+    """
+    conditions = []
+    for field, label in [("full_name", "Full name starts with"), ("phone_number", "Phone number"),
+                         ("city", "City"), ("country", "Country")]:
+        value = input(label + " (empty to skip): ")
+        if value:
+            conditions.append((field, "prefix" if field == "full_name" else "=", value))
+    for field, label in [("age", "Age"), ("account_creation_date", "Creation date (YYYY-MM-DD)")]:
+        bounds = ask_range(label)
+        if bounds is not None:
+            conditions.append((field, "between") + bounds)
+    clean_terminal_screen()
+    users = find_accounts(STORE, BANK.indexes, conditions)
+    if not users:
+        print("──── Error ──────────────────────────────────")
+        print("Found no one matching the search")
+    for user in users:
+        display_user_object(user, user["account_number"])
+    print("\n", len(users), "account(s) found")
+
+
 # ─── DELETE AN ACCOUNT ──────────────────────────────────────────────────────────
 
 
@@ -356,12 +268,9 @@ def delete_account(account_number):
     """
     Deletes an account if exists, otherwise displays an error
     """
-    users = get_data()
-    if account_number not in users:
+    if ENGINE.delete(account_number) == UNKNOWN_ACCOUNT:
         print("Did not any account with account number: " + account_number)
         return
-    del users[account_number]
-    set_data(users)
     print("Account number", account_number, "is removed.")
 
 
@@ -390,8 +299,7 @@ def display_account_information_by_given_account_number(account_number):
     """
     Displays the information about a given account number
     """
-    users = get_data()
-    user = users[account_number]
+    user = STORE.get(account_number)
     display_user_object(user, account_number)
 
 
@@ -417,16 +325,71 @@ def display_user_object(user_object, account_number):
 
 def display_all_accounts_sorted_by(field):
     """
-    Displays all the users one after the other, sorted by a given field
+    Displays the users sorted by a given field, one page at a time, from
+    the order BANK.listing maintains. The next and previous pages are
+    found from the first and last accounts shown (cursors), so accounts
+    opened or closed meanwhile are neither shown twice nor skipped. The
+    accounts of a page are read when it is shown, from a snapshot held
+    only while reading them, so a transfer does not show halfway.
+    """
+    listing = BANK.listing
+    entries = listing.page(field, limit=PAGE_SIZE)
+    offset = 0
+    while True:
+        with BANK.snapshot() as snapshot:
+            users = accounts_of_entries(snapshot, entries)
+        clean_terminal_screen()
+        for user in users:
+            display_user_object(user, user["account_number"])
+        print("\nAccounts", offset + 1 if entries else 0, "to", offset + len(entries), "of", listing.count())
+        command = input("n = next page, p = previous page, anything else = stop: ")
+        if command == "n":
+            following = listing.page(field, limit=PAGE_SIZE, after=entries[-1]) if entries else []
+            if following:
+                offset += len(entries)
+                entries = following
+        elif command == "p":
+            previous = listing.page(field, limit=PAGE_SIZE, descending=True, after=entries[0]) if entries else []
+            if len(previous) < PAGE_SIZE:
+                # back at the first page
+                offset, entries = 0, listing.page(field, limit=PAGE_SIZE)
+            else:
+                offset, entries = max(0, offset - PAGE_SIZE), previous[::-1]
+        else:
+            return
+
+
+def display_top_accounts_by_balance():
     """
-    users = get_users_as_list()
-    users = heap_sort(users, field)
+    Displays the accounts with the highest balances, without sorting
+    all the accounts
+    """
+    count = int(input("How many accounts: "))
     clean_terminal_screen()
-    for i in range(0, users.size()):
-        user = users.index(i)
+    with BANK.snapshot() as snapshot:
+        accounts = top_accounts_by_balance(snapshot, count)
+    for user in accounts:
         display_user_object(user, user["account_number"])
 
 
+def display_report():
+    """
+    Displays the balance statistics of the groups of accounts of one
+    dimension (country, city, gender, age band or creation month)
+    """
+    from reports import DIMENSIONS, format_table, format_top
+    dimensions = list(DIMENSIONS)
+    print("Group the accounts by: ")
+    for number, dimension in enumerate(dimensions, 1):
+        print(number, "•", dimension.replace("_", " ").capitalize())
+    dimension = dimensions[int(input("\n  ☞ Enter your command: ")) - 1]
+    groups = BANK.report([dimension])[dimension]
+    clean_terminal_screen()
+    print("\n".join(format_table(groups)))
+    print("\nLargest balances:")
+    print("\n".join(format_top(groups)))
+
+
 def beatify_field_name(field):
     if field == "full_name":
         return "Full Name"
@@ -442,6 +405,8 @@ def beatify_field_name(field):
         return "Age"
     if field == "country":
         return "Country"
+    if field == "balance":
+        return "Balance"
     return "Unknown"
 
 
@@ -462,6 +427,8 @@ def ask_user_what_field_to_sort_the_display_by():
     print(" 5 ∙ Account Creating Date ")
     print_horizontal_line()
     print(" 6 ∙ Account Number ")
+    print_horizontal_line()
+    print(" 7 ∙ Top Balances ")
     print()
     command = input("Your option: ")
     if command == "1":
@@ -476,9 +443,37 @@ def ask_user_what_field_to_sort_the_display_by():
         return "account_creation_date"
     if command == "6":
         return "account_number"
+    if command == "7":
+        return "balance"
     return "full_name"
 
 
+# ─── GRAPHICAL ANALYSIS ─────────────────────────────────────────────────────────
+
+
+def render_chart():
+    """
+    Asks which chart to draw and in which format, and writes it to a
+    file. The same chart of unchanged accounts is not drawn again.
+    """
+    print("Enter which of the following charts should be drawn ")
+    print("1 • Balance by Country: ")
+    print("2 • Balance by City: ")
+    print("3 • Distribution of the Balances: ")
+    print("4 • Account Growth: ")
+    chart = int(input("\n  ☞ Enter your command: "))
+    if chart not in (1, 2, 3, 4):
+        print("Invalid chart")
+        return
+    image_format = input("Format (png/svg, empty for png): ") or "png"
+    if image_format not in ("png", "svg"):
+        print("Invalid format")
+        return
+    path = BANK.charts.render(["balance_by_country", "balance_by_city", "balance_histogram",
+                               "account_growth"][chart - 1], image_format)
+    print("The chart is saved as", os.path.abspath(path))
+
+
 # ─── ADMIN LOGIN ───────────────────────────────────────────────────────────────
 
 def display_menu():
@@ -489,6 +484,7 @@ def display_menu():
     This also acts as the UI and receives the information
     regarding of the respective functions.
     """
+    global profile_next_command
     clean_terminal_screen()
     print("Welcome Admin")
     print("1 • Create Account")
@@ -499,6 +495,7 @@ def display_menu():
     print("6 • View Customer's List")
     print("7 • Perform Analysis")
     print("8 • Exit System")
+    print("9 • Profile the Next Command")
     user_choice = int(input("\n  ☞ Enter your command: "))
 
     if user_choice == 1:
@@ -534,21 +531,36 @@ def display_menu():
 
     if user_choice == 5:
         print("── Search Account ───────────────────────────")
-        query = input("Enter the account name you are searching for: ")
-        clean_terminal_screen()
-        search_account("full_name", query)
+        print("1 • Search by Name")
+        print("2 • Search by Several Fields")
+        print("3 • Search by Similar Name")
+        print("4 • Account Statement")
+        search_choice = int(input("\n  ☞ Enter your command: "))
+        if search_choice == 1:
+            query = input("Enter the account name you are searching for: ")
+            clean_terminal_screen()
+            search_account("full_name", query)
+        if search_choice == 2:
+            search_accounts_by_fields()
+        if search_choice == 3:
+            query = input("Enter the account name you are searching for: ")
+            clean_terminal_screen()
+            fuzzy_search_account(query)
+        if search_choice == 4:
+            account_number = input("Account Number: ")
+            display_statement(account_number)
 
     if user_choice == 6:
         print("── Displaying all Accounts ──────────────────")
         field = ask_user_what_field_to_sort_the_display_by()
-        display_all_accounts_sorted_by(field)
+        if field == "balance":
+            display_top_accounts_by_balance()
+        else:
+            display_all_accounts_sorted_by(field)
 
         print("\n\nSorted by user", beatify_field_name(field))
 
     if user_choice == 7:
-        df = pd.read_json("bank.json")
-        bank_df = df.T
-        bank_df.to_csv(path_or_buf='C:/Users/LENOVO/OneDrive/Desktop/pythonMyBank/bank.csv', sep=',', header=True)
         print("Enter which of the following analysis should be performed ")
         print("1 • Numerical Analysis: ")
         print("2 • Graphical Analysis: ")
@@ -564,67 +576,103 @@ def display_menu():
             print("6 • Find the Variance of Account Balance: ")
             print("7 • Find the Standard Deviation of Account Balance:")
             print("8 • Show the Descriptive Statistics Value:")
+            print("9 • Find a Percentile of Account Balance:")
+            print("10 • Show the Balance Statistics by Segment:")
             x = int(input("\n  ☞ Enter your command: "))
 
             if x == 1:
-                print('The Maximum Account Balance is ', max(bank_df['balance']))
+                print('The Maximum Account Balance is ', BANK.aggregates.maximum())
             if x == 2:
-                print('The Minimum Account Balance is ', min(bank_df['balance']))
+                print('The Minimum Account Balance is ', BANK.aggregates.minimum())
             if x == 3:
-                print('The Average Account Balance of a Customer is',
-                      (sum(bank_df['balance']) / (len(bank_df['balance']))))
+                print('The Average Account Balance of a Customer is', BANK.aggregates.mean())
             if x == 4:
-                print('The Total Balance of all the Customers Combined is', (sum(bank_df['balance'])))
+                print('The Total Balance of all the Customers Combined is', BANK.aggregates.total)
             if x == 5:
-                print('The Median Account Balance is', bank_df['balance'].median())
+                print('The Median Account Balance is', BANK.quantiles.quantile(0.5))
             if x == 6:
-                print('The Variance of Account Balance is', bank_df['balance'].var())
+                print('The Variance of Account Balance is', BANK.aggregates.variance())
             if x == 7:
-                print('The Standard Deviation of Account Balance is', bank_df['balance'].std())
+                print('The Standard Deviation of Account Balance is', BANK.aggregates.std())
             if x == 8:
-                print(bank_df.describe())
+                with BANK.snapshot() as users:
+                    print(analysis.describe(users))
+            if x == 9:
+                percentile = float(input("Percentile (e.g. 90 or 99): "))
+                if 0 <= percentile <= 100:
+                    country = input("Country (leave empty for all): ") or None
+                    city = None if country else input("City (leave empty for all): ") or None
+                    print('The', percentile, 'th Percentile of Account Balance is',
+                          BANK.quantiles.quantile(percentile / 100, country=country, city=city))
+                else:
+                    print("The percentile must be between 0 and 100")
+            if x == 10:
+                display_report()
 
         if a == 2:
-            data = pd.read_csv('bank.csv')
-            plt.figure(figsize=(6.8, 4.2))
-            plt.bar(list(data['country']), list(data['balance']))
-            plt.xticks(list(data['country']))
-            plt.yticks(list(data['balance']))
-            plt.xlabel('Country')
-            plt.ylabel('Balance')
-            plt.title("Country-wise Balance Analysis")
-            plt.show()
+            render_chart()
 
     if user_choice == 8:
         quit()
 
+    if user_choice == 9:
+        profile_next_command = True
+        print("The next command runs under cProfile, its profile is written to mybank_profile_menu.prof")
+
+
+def run_menu_command():
+    """
+    Shows the menu and runs one command, under cProfile when menu option
+    9 asked for it
+    """
+    global profile_next_command
+    if profile_next_command:
+        profile_next_command = False
+        metrics.profile_call("menu", display_menu)
+    else:
+        display_menu()
 
-print()
-print_horizontal_line()
-input("PRESS ENTER TO CONTINUE ")
-print()
 
 # ─── MAIN ───────────────────────────────────────────────────────────────────────
 
-while True:
+
+def main():
+    """
+    The login screen, then the admin menu until the admin exits
+    """
+    # --metrics (or MYBANK_METRICS=1) records the latency of the operations
+    # and writes mybank_metrics.json and mybank_metrics.prom at exit
+    if "--metrics" in sys.argv:
+        metrics.enable()
+
     print()
+    print_horizontal_line()
+    input("PRESS ENTER TO CONTINUE ")
     print()
-    print("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
-    print("Welcome to My Bank Please Enter the Login Type: ")
-    print("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
-    print("1) Admin Login")
-    print("2) Quit")
-    print(" ")
-    option = int(input("\nChoose your option: "))
-    if option == 1:
-        user_id = input("Enter Admin Id: ")
-        user_password = input("Enter Password: ")
-        if user_id == 'Mukund' and user_password == 'mukun!2' or user_id == 'Shravan' and user_password == 'shravu@3':
-            while True:
-                display_menu()
-        else:
-            print("Credentials Invalid")
-    elif option == 2:
-        quit()
+
+    while True:
+        print()
+        print()
+        print("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
+        print("Welcome to My Bank Please Enter the Login Type: ")
+        print("~~~~~~~~~~~~~~~~~~~~~~~~~~~~~")
+        print("1) Admin Login")
+        print("2) Quit")
+        print(" ")
+        option = int(input("\nChoose your option: "))
+        if option == 1:
+            user_id = input("Enter Admin Id: ")
+            user_password = input("Enter Password: ")
+            if user_id == 'Mukund' and user_password == 'mukun!2' or user_id == 'Shravan' and user_password == 'shravu@3':
+                while True:
+                    run_menu_command()
+            else:
+                print("Credentials Invalid")
+        elif option == 2:
+            quit()
+
+
+if __name__ == "__main__":
+    main()
 
 # ────────────────────────────────────────────────────────────────────────────────
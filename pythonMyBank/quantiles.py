@@ -0,0 +1,220 @@
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import bisect
+import math
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+RELATIVE_ACCURACY = 0.01
+MIN_VALUE = 1e-9
+
+
+# ─── QUANTILE SKETCH ────────────────────────────────────────────────────────────
+
+
+class QuantileSketch:
+    """
+    A mergeable quantile sketch with a relative error bound, in the style
+    of DDSketch.
+
+    Values are counted in buckets whose bounds grow geometrically by
+    gamma = (1 + a) / (1 - a), a being the relative accuracy. A quantile
+    is answered with the middle of the bucket holding the value of that
+    rank, so the answer is within a * value of the exact value of that
+    rank (1% by default). Balances from 1 to 10 million need about 800
+    buckets, whatever the number of accounts.
+
+    Unlike t-digest or KLL, the buckets also allow removing a value again,
+    which a balance that changes with every transfer needs. Two sketches
+    with the same accuracy merge by adding up their buckets.
+
+    Rank convention: like pandas' default linear interpolation, the
+    quantile q lies at rank q * (count - 1) in ascending order, between
+    the values of the ranks around it. Each of the two is within a of
+    its exact value, and so is the answer within a of the exact one.
+    """
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.count = 0
+        self.zero_count = 0
+        self._positive = {}
+        self._negative = {}
+        self._keys = None
+        self._cumulative = None
+
+    # ─── UPDATES ────────────────────────────────────────────────────────────
+
+    def _key(self, value):
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _change(self, value, count):
+        if value > MIN_VALUE:
+            buckets, key = self._positive, self._key(value)
+        elif value < -MIN_VALUE:
+            buckets, key = self._negative, self._key(-value)
+        else:
+            self.zero_count += count
+            self.count += count
+            self._keys = None
+            return
+        total = buckets.get(key, 0) + count
+        if total:
+            buckets[key] = total
+        else:
+            del buckets[key]
+        self.count += count
+        self._keys = None
+
+    def add(self, value, count=1):
+        self._change(value, count)
+
+    def remove(self, value, count=1):
+        """
+        Removes a value that was added before
+        """
+        self._change(value, -count)
+
+    def add_buckets(self, key_counts, negative=False):
+        """
+        Adds counts to the buckets of the given keys, from (key, count)
+        pairs, for values whose keys were computed in bulk (the key of a
+        value v being ceil(log(|v|) / log(gamma)))
+        """
+        buckets = self._negative if negative else self._positive
+        for key, count in key_counts:
+            buckets[key] = buckets.get(key, 0) + count
+            self.count += count
+        self._keys = None
+
+    def merge(self, other):
+        """
+        Adds the counts of another sketch with the same accuracy
+        """
+        if other.gamma != self.gamma:
+            raise ValueError("Only sketches with the same accuracy can be merged")
+        for key, count in other._positive.items():
+            self._positive[key] = self._positive.get(key, 0) + count
+        for key, count in other._negative.items():
+            self._negative[key] = self._negative.get(key, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self._keys = None
+
+    # ─── QUERIES ────────────────────────────────────────────────────────────
+
+    def _value(self, key):
+        """
+        The value that represents a bucket, at most a relative
+        accuracy away from every value in it
+        """
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def _index(self):
+        """
+        The buckets in ascending value order with their cumulative counts,
+        rebuilt only after a change
+        """
+        if self._keys is None:
+            keys = [(-self._value(key), count) for key, count in self._negative.items()]
+            keys.sort()
+            if self.zero_count:
+                keys.append((0.0, self.zero_count))
+            keys.extend(sorted((self._value(key), count) for key, count in self._positive.items()))
+            self._keys = [value for value, _ in keys]
+            self._cumulative = []
+            total = 0
+            for _, count in keys:
+                total += count
+                self._cumulative.append(total)
+        return self._keys, self._cumulative
+
+    def quantile(self, q):
+        """
+        The value at quantile q (0 <= q <= 1), or None when empty.
+        Raises ValueError for a q outside [0, 1].
+        """
+        if not 0 <= q <= 1:
+            raise ValueError("The quantile must be between 0 and 1, not %r" % q)
+        if self.count <= 0:
+            return None
+        values, cumulative = self._index()
+        position = q * (self.count - 1)
+        rank = int(position)
+        lower = values[bisect.bisect_right(cumulative, rank)]
+        if position == rank:
+            return lower
+        upper = values[bisect.bisect_right(cumulative, rank + 1)]
+        return lower + (upper - lower) * (position - rank)
+
+    def median(self):
+        return self.quantile(0.5)
+
+
+# ─── SEGMENTED QUANTILES ────────────────────────────────────────────────────────
+
+
+class SegmentedQuantiles:
+    """
+    Balance quantiles over all the accounts and per country and city,
+    kept up to date as a storage backend listener
+    """
+
+    SEGMENTS = ("country", "city")
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY):
+        self.relative_accuracy = relative_accuracy
+        self.reset({})
+
+    def reset(self, users):
+        self.overall = QuantileSketch(self.relative_accuracy)
+        self.segments = {field: {} for field in self.SEGMENTS}
+        for user in users.values():
+            self._add(user)
+
+    def apply_changes(self, changes):
+        for _, old, new in changes:
+            if old is not None:
+                self._remove(old)
+            if new is not None:
+                self._add(new)
+
+    def _sketch(self, field, value):
+        sketches = self.segments[field]
+        if value not in sketches:
+            sketches[value] = QuantileSketch(self.relative_accuracy)
+        return sketches[value]
+
+    def _add(self, user):
+        balance = user["balance"]
+        self.overall.add(balance)
+        for field in self.SEGMENTS:
+            self._sketch(field, user[field]).add(balance)
+
+    def _remove(self, user):
+        balance = user["balance"]
+        self.overall.remove(balance)
+        for field in self.SEGMENTS:
+            sketch = self._sketch(field, user[field])
+            sketch.remove(balance)
+            if sketch.count == 0:
+                del self.segments[field][user[field]]
+
+    def quantile(self, q, country=None, city=None):
+        """
+        The balance at quantile q over all the accounts, or over the
+        accounts of a country or a city. None when there are none.
+        The segments are kept per country and per city, not per pair,
+        so a country and a city together raise ValueError. The median
+        (q = 0.5) interpolates between the two middle balances, like
+        pandas' median.
+        """
+        if country is not None and city is not None:
+            raise ValueError("Give a country or a city, not both")
+        sketch = self.overall
+        if city is not None:
+            sketch = self.segments["city"].get(city)
+        elif country is not None:
+            sketch = self.segments["country"].get(country)
+        return None if sketch is None else sketch.quantile(q)
@@ -0,0 +1,415 @@
+"""
+Balance reports by segment: the accounts grouped by country, city,
+gender, age band or month of creation, with for every group the count,
+sum, mean, variance, standard deviation, min, max, percentiles and the
+accounts with the largest balances.
+
+    report = build_report(bank_snapshot, ["country", "age_band"])
+    report["country"]["India"]["p90"]
+    report = build_report("bank.snap", workers=8)
+
+The accounts are split in partitions of PARTITION_RECORDS accounts,
+aggregated apart, in a pool of processes, into partial results that
+merge: counts and sums add up, means and variances combine with the
+formula of Chan et al., minimums and maximums keep the smaller and the
+larger, the top accounts keep the largest, and the percentiles come from
+QuantileSketches (±1%), which merge bucket by bucket. Within a partition
+the work is done on NumPy columns, chunk by chunk.
+
+A report can be made from accounts in memory (a dictionary or a
+snapshot of the bank), whose columns are then sent to the workers, or
+from the path of a snapshot file (.snap), which the workers read
+themselves, chunk by chunk, so a bank larger than the memory can be
+reported on. The partitions do not depend on the number of workers and
+are merged in their order, so the report is the same with any number
+of workers. Sums are exact to the cent; balances are taken to the cent.
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import heapq
+import itertools
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+from operator import itemgetter
+import numpy as np
+import metrics
+import snapshot
+from columnar import SCALE
+from quantiles import MIN_VALUE, RELATIVE_ACCURACY, QuantileSketch
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+AGE_BANDS = [(0, "under 18"), (18, "18-24"), (25, "25-34"), (35, "35-44"), (45, "45-54"), (55, "55-64"),
+             (65, "65 and over")]
+UNKNOWN = "unknown"
+PERCENTILES = (0.5, 0.9, 0.99)
+TOP = 5
+# the accounts of a partition, aggregated by one worker at a time
+PARTITION_RECORDS = 8 * snapshot.CHUNK_RECORDS
+# the sketch bucket of a balance is held as one integer per group:
+# code * SLOTS + the key of the bucket, shifted by KEY_BIAS, and by
+# NEGATIVE more for a negative balance; ZERO for a zero balance
+KEY_BIAS = 1 << 20
+NEGATIVE = 1 << 21
+ZERO = 1 << 22
+SLOTS = ZERO + 1
+
+
+# ─── SEGMENTS ───────────────────────────────────────────────────────────────────
+
+
+@lru_cache(maxsize=None)
+def age_band(age):
+    """
+    The age band of an age (a string, as the records have it)
+    """
+    try:
+        age = int(age)
+    except (TypeError, ValueError):
+        return UNKNOWN
+    band = UNKNOWN
+    for start, name in AGE_BANDS:
+        if age >= start:
+            band = name
+    return band
+
+
+@lru_cache(maxsize=None)
+def creation_month(created_at):
+    """
+    The month (YYYY-MM) of an account_creation_date
+    """
+    if isinstance(created_at, str) and len(created_at) >= 7 and created_at[4] == "-":
+        return created_at[:7]
+    return UNKNOWN
+
+
+# dimension: (the field it is read from, the group of a value of the field)
+DIMENSIONS = {
+    "country": ("country", None),
+    "city": ("city", None),
+    "gender": ("gender", None),
+    "age_band": ("age", age_band),
+    "creation_month": ("account_creation_date", creation_month),
+}
+
+
+# ─── PARTIAL RESULTS ────────────────────────────────────────────────────────────
+
+
+class SegmentStats:
+    """
+    The statistics of the balances of one group of accounts, as a
+    partial result that merges with the one of other accounts of the
+    same group
+    """
+
+    def __init__(self, top=TOP, relative_accuracy=RELATIVE_ACCURACY):
+        self.count = 0
+        self.cents = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.minimum = None
+        self.maximum = None
+        self.sketch = QuantileSketch(relative_accuracy)
+        # the largest balances, as (cents, account number), largest first
+        self.top = []
+        self.top_size = top
+
+    def merge(self, other):
+        if not other.count:
+            return
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.cents += other.cents
+        self.minimum = other.minimum if self.minimum is None else min(self.minimum, other.minimum)
+        self.maximum = other.maximum if self.maximum is None else max(self.maximum, other.maximum)
+        self.sketch.merge(other.sketch)
+        self.top = heapq.nlargest(self.top_size, self.top + other.top)
+
+    def result(self, percentiles=PERCENTILES):
+        """
+        The statistics as a dictionary; the variance is the sample
+        variance (divided by count - 1, like pandas), and a percentile
+        interpolates between the balances around its rank, like pandas,
+        within 1% of the exact one and never outside [min, max]
+        """
+        variance = self.m2 / (self.count - 1) if self.count > 1 else None
+        minimum, maximum = self.minimum / SCALE, self.maximum / SCALE
+        result = {
+            "count": self.count,
+            "sum": self.cents / SCALE,
+            "mean": self.mean,
+            "variance": variance,
+            "std": None if variance is None else math.sqrt(variance),
+            "min": minimum,
+            "max": maximum,
+        }
+        for q in percentiles:
+            result["p%g" % (q * 100)] = min(max(self.sketch.quantile(q), minimum), maximum)
+        result["top"] = [{"account_number": number, "balance": cents / SCALE} for cents, number in self.top]
+        return result
+
+
+class _Codes(dict):
+    """
+    The code of every value of a column, given on first sight, the values
+    being grouped by label_of when given
+    """
+
+    def __init__(self, label_of):
+        super().__init__()
+        self.label_of = label_of
+        self.labels = {}
+
+    def __missing__(self, value):
+        label = value if self.label_of is None else self.label_of(value)
+        code = self.labels.get(label)
+        if code is None:
+            code = self.labels[label] = len(self.labels)
+        self[value] = code
+        return code
+
+
+class _Grouping:
+    """
+    The partial statistics of the groups of one dimension over the
+    chunks of a partition, as arrays indexed by the code of the group
+    """
+
+    def __init__(self, label_of, top):
+        self.codes = _Codes(label_of)
+        self.top = top
+        self.count = np.zeros(0, dtype=np.int64)
+        # float sums of whole cents are exact below 2 ** 53 cents
+        self.cents = np.zeros(0)
+        self.mean = np.zeros(0)
+        self.m2 = np.zeros(0)
+        self.minimum = np.zeros(0, dtype=np.int64)
+        self.maximum = np.zeros(0, dtype=np.int64)
+        self.candidates = []
+        self.buckets = []
+
+    def _grow(self, size):
+        grown = size - len(self.count)
+        if grown > 0:
+            for name in ("count", "cents", "mean", "m2"):
+                setattr(self, name, np.concatenate([getattr(self, name), np.zeros(grown, getattr(self, name).dtype)]))
+            self.minimum = np.concatenate([self.minimum, np.full(grown, np.iinfo(np.int64).max)])
+            self.maximum = np.concatenate([self.maximum, np.full(grown, np.iinfo(np.int64).min)])
+
+    def add(self, numbers, values, cents, balances, slots, by_balance):
+        """
+        Adds a chunk: the account numbers, the values of the field of the
+        dimension, the balances in cents and as floats, their sketch
+        slots and the positions of the balances in ascending order
+        """
+        codes = np.fromiter(map(self.codes.__getitem__, values), dtype=np.int64, count=len(values))
+        size = len(self.codes.labels)
+        self._grow(size)
+        count = np.bincount(codes, minlength=size)
+        present = count > 0
+        mean = np.divide(np.bincount(codes, balances, size), count, out=np.zeros(size), where=present)
+        m2 = np.bincount(codes, (balances - mean[codes]) ** 2, size)
+        total = self.count + count
+        delta = mean - self.mean
+        share = np.divide(count, total, out=np.zeros(size), where=present)
+        self.mean += delta * share
+        self.m2 += m2 + delta * delta * self.count * share
+        self.count = total
+        self.cents += np.bincount(codes, cents, size)
+
+        # by group, then by balance: a stable sort of the codes in balance
+        # order, a radix sort when the codes fit in 16 bits
+        if size <= 1 << 16:
+            order = by_balance[np.argsort(codes.astype(np.uint16)[by_balance], kind="stable")]
+        else:
+            order = np.lexsort((cents, codes))
+        ends = np.cumsum(count)
+        starts = ends - count
+        ordered = cents[order]
+        self.minimum[present] = np.minimum(self.minimum[present], ordered[starts[present]])
+        self.maximum[present] = np.maximum(self.maximum[present], ordered[ends[present] - 1])
+        # the largest balances of a group are the last ones of its run
+        kept = order[np.arange(len(order)) >= ends[codes[order]] - self.top]
+        self.candidates.append((codes[kept], cents[kept], [numbers[i] for i in kept.tolist()]))
+        self.buckets.append(np.unique(codes * SLOTS + slots, return_counts=True))
+
+    def results(self, relative_accuracy):
+        """
+        The SegmentStats of every group, by label
+        """
+        labels = {code: label for label, code in self.codes.labels.items()}
+        stats = {}
+        for code in np.flatnonzero(self.count).tolist():
+            segment = stats[labels[code]] = SegmentStats(self.top, relative_accuracy)
+            segment.count = int(self.count[code])
+            segment.cents = int(self.cents[code])
+            segment.mean = float(self.mean[code])
+            segment.m2 = float(self.m2[code])
+            segment.minimum = int(self.minimum[code])
+            segment.maximum = int(self.maximum[code])
+
+        codes = np.concatenate([codes for codes, _, _ in self.candidates])
+        cents = np.concatenate([cents for _, cents, _ in self.candidates])
+        numbers = list(itertools.chain.from_iterable(numbers for _, _, numbers in self.candidates))
+        for position in np.lexsort((cents, codes))[::-1].tolist():
+            top = stats[labels[int(codes[position])]].top
+            if len(top) < self.top:
+                top.append((int(cents[position]), numbers[position]))
+
+        keys = np.concatenate([keys for keys, _ in self.buckets])
+        keys, positions = np.unique(keys, return_inverse=True)
+        counts = np.bincount(positions, np.concatenate([counts for _, counts in self.buckets]).astype(np.float64))
+        codes, slots = np.divmod(keys, SLOTS)
+        for code, run in itertools.groupby(zip(codes.tolist(), slots.tolist(), counts.astype(np.int64).tolist()),
+                                           itemgetter(0)):
+            sketch = stats[labels[code]].sketch
+            run = list(run)
+            sketch.add_buckets((slot - KEY_BIAS, count) for _, slot, count in run if slot < NEGATIVE)
+            sketch.add_buckets(((slot - NEGATIVE - KEY_BIAS, count) for _, slot, count in run
+                                if NEGATIVE <= slot < ZERO), negative=True)
+            sketch.add(0.0, sum(count for _, slot, count in run if slot == ZERO))
+        return stats
+
+
+def sketch_slots(balances, relative_accuracy=RELATIVE_ACCURACY):
+    """
+    The sketch slot of every balance (see the constants), the bucket keys
+    computed like QuantileSketch does
+    """
+    gamma = QuantileSketch(relative_accuracy).gamma
+    log_gamma = math.log(gamma)
+    slots = np.full(len(balances), ZERO, dtype=np.int64)
+    positive = balances > MIN_VALUE
+    negative = balances < -MIN_VALUE
+    slots[positive] = np.ceil(np.log(balances[positive]) / log_gamma).astype(np.int64) + KEY_BIAS
+    slots[negative] = np.ceil(np.log(-balances[negative]) / log_gamma).astype(np.int64) + KEY_BIAS + NEGATIVE
+    return slots
+
+
+# ─── PARTITIONS ─────────────────────────────────────────────────────────────────
+
+
+def _chunks(partition):
+    """
+    The (account numbers, columns) chunks of a partition: a snapshot file
+    with the offsets of its chunks, or columns sent as they are
+    """
+    kind, *arguments = partition
+    if kind == "snapshot":
+        return snapshot.read_columns_at(*arguments)
+    return [tuple(arguments)]
+
+
+def aggregate_partition(partition, dimensions, top=TOP, relative_accuracy=RELATIVE_ACCURACY):
+    """
+    The partial results of one partition: for every dimension, the
+    SegmentStats of its groups. Runs in a worker process.
+    """
+    groupings = {dimension: _Grouping(DIMENSIONS[dimension][1], top) for dimension in dimensions}
+    for numbers, columns in _chunks(partition):
+        balances = np.array(columns["balance"], dtype=np.float64)
+        cents = np.rint(balances * SCALE).astype(np.int64)
+        balances = cents / SCALE
+        slots = sketch_slots(balances, relative_accuracy)
+        by_balance = np.argsort(cents, kind="stable")
+        for dimension, grouping in groupings.items():
+            grouping.add(numbers, columns[DIMENSIONS[dimension][0]], cents, balances, slots, by_balance)
+    return {dimension: grouping.results(relative_accuracy) for dimension, grouping in groupings.items()}
+
+
+def partitions_of(accounts, dimensions):
+    """
+    The partitions of the accounts: those of a snapshot file when given
+    its path, else the columns the dimensions need, PARTITION_RECORDS
+    accounts at a time
+    """
+    if isinstance(accounts, (str, os.PathLike)):
+        offsets = snapshot.chunk_offsets(accounts)
+        per_partition = PARTITION_RECORDS // snapshot.CHUNK_RECORDS
+        return [("snapshot", accounts, offsets[start:start + per_partition])
+                for start in range(0, len(offsets), per_partition)]
+    fields = ["balance"] + sorted(set(DIMENSIONS[dimension][0] for dimension in dimensions))
+    items = iter(accounts.items())
+    partitions = []
+    while True:
+        chunk = list(itertools.islice(items, PARTITION_RECORDS))
+        if not chunk:
+            return partitions
+        records = [record for _, record in chunk]
+        partitions.append(("columns", [number for number, _ in chunk],
+                           {field: list(map(itemgetter(field), records)) for field in fields}))
+
+
+# ─── REPORT ─────────────────────────────────────────────────────────────────────
+
+
+@metrics.timed("reports.build")
+def build_report(accounts, dimensions=tuple(DIMENSIONS), top=TOP, percentiles=PERCENTILES, workers=None,
+                 relative_accuracy=RELATIVE_ACCURACY):
+    """
+    The report of the accounts (a mapping of account number to record, or
+    the path of a snapshot file) by the given dimensions: for every
+    dimension, the statistics of every group (see SegmentStats.result),
+    sorted by group. workers is the number of processes, the number of
+    CPUs by default; a single partition is aggregated in this process.
+    """
+    unknown = [dimension for dimension in dimensions if dimension not in DIMENSIONS]
+    if unknown:
+        raise ValueError("Unknown dimension %s, expected one of %s" % (unknown[0], ", ".join(DIMENSIONS)))
+    partitions = partitions_of(accounts, dimensions)
+    aggregate = partial(aggregate_partition, dimensions=dimensions, top=top, relative_accuracy=relative_accuracy)
+    workers = min(workers or os.cpu_count() or 1, len(partitions))
+    merged = {dimension: {} for dimension in dimensions}
+    if workers <= 1:
+        merge_results(merged, map(aggregate, partitions), top, relative_accuracy)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            merge_results(merged, pool.map(aggregate, partitions), top, relative_accuracy)
+    return {dimension: {label: groups[label].result(percentiles) for label in sorted(groups)}
+            for dimension, groups in merged.items()}
+
+
+def merge_results(merged, results, top=TOP, relative_accuracy=RELATIVE_ACCURACY):
+    """
+    Merges the partial results of partitions, in their order, into the
+    SegmentStats of merged (dimension -> label -> SegmentStats)
+    """
+    for result in results:
+        for dimension, groups in result.items():
+            segments = merged[dimension]
+            for label, stats in groups.items():
+                if label not in segments:
+                    segments[label] = SegmentStats(top, relative_accuracy)
+                segments[label].merge(stats)
+    return merged
+
+
+def format_table(groups, percentiles=PERCENTILES):
+    """
+    The lines of a text table of the groups of one dimension of a report
+    """
+    names = ["p%g" % (q * 100) for q in percentiles]
+    lines = ["%-16s %9s %16s %12s %12s %12s %12s " % ("group", "count", "sum", "mean", "std", "min", "max")
+             + " ".join("%12s" % name for name in names)]
+    for label, stats in groups.items():
+        std = "" if stats["std"] is None else "%.2f" % stats["std"]
+        lines.append("%-16s %9d %16.2f %12.2f %12s %12.2f %12.2f " % (
+            label, stats["count"], stats["sum"], stats["mean"], std, stats["min"], stats["max"])
+            + " ".join("%12.2f" % stats[name] for name in names))
+    return lines
+
+
+def format_top(groups):
+    """
+    The lines listing the accounts with the largest balances of every
+    group of one dimension of a report
+    """
+    return ["%-16s %s" % (label, "  ".join("%s %.2f" % (account["account_number"], account["balance"])
+                                           for account in stats["top"]))
+            for label, stats in groups.items()]
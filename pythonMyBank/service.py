@@ -0,0 +1,288 @@
+"""
+A local network service for the bank, so programs can drive it without
+the interactive menu.
+
+    python service.py --port 8642
+
+The protocol is JSON lines over TCP. Every request is one line holding a
+JSON object with an "op" and its arguments, and optionally an "id":
+
+    {"id": 1, "op": "transfer", "sender": "6060...", "receiver": "6060...", "amount": 10}
+
+Every request gets one response line, in the order the requests were
+sent: {"id": 1, "ok": true, "result": ...} or {"id": 1, "ok": false,
+"error": "..."}. A client does not have to wait for a response before
+sending the next request (pipelining). Account numbers are strings and
+amounts are numbers; a request that fails for any reason gets an error
+response, and the requests after it are still answered.
+
+Operations: get, create, transfer, update, delete, search, fuzzy, list,
+statement, balance_at.
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+from accounts import accounts_page, find_accounts, find_similar_accounts, open_account, top_accounts_by_balance
+from anomaly import open_detector
+from backends import open_backend
+from fuzzy import TOP_K, FuzzyNameIndex
+from ledger import open_ledger
+from listing import SortedListing
+from indexes import SecondaryIndexes
+from transactions import DONE, INVALID_AMOUNT, TRANSFERRED, TransactionEngine, valid_amount
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+HOST = "127.0.0.1"
+PORT = 8642
+WORKERS = 8
+MAX_CONCURRENCY = 64
+PIPELINE_DEPTH = 128
+LIST_LIMIT = 100
+OPERATIONS = ("get", "create", "transfer", "update", "delete", "search", "fuzzy", "list", "statement",
+              "balance_at")
+# the arguments that must be account numbers (strings) and amounts (numbers)
+ACCOUNT_ARGUMENTS = ("account_number", "sender", "receiver")
+AMOUNT_ARGUMENTS = ("amount", "balance")
+
+
+# ─── OPERATIONS ─────────────────────────────────────────────────────────────────
+
+
+class BankOperations:
+    """
+    The operations of the service, as blocking functions taking the
+    arguments of a request. They run in the executor threads.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.store = engine.store
+        self.ledger = engine.ledger
+        self.indexes = SecondaryIndexes()
+        self.store.subscribe(self.indexes)
+        self.fuzzy_names = FuzzyNameIndex()
+        self.store.subscribe(self.fuzzy_names)
+        self.listing = SortedListing()
+        self.store.subscribe(self.listing)
+
+    def get(self, account_number):
+        user = self.store.get(account_number)
+        if user is None:
+            raise LookupError("unknown account")
+        return dict(user, account_number=account_number)
+
+    def create(self, full_name, balance, gender, city, phone_number, age, country):
+        if gender not in ("Male", "Female", "Others"):
+            raise ValueError("invalid gender")
+        account_number = open_account(self.engine, full_name, float(balance), gender, city,
+                                      str(phone_number), str(age), country)
+        return account_number
+
+    def transfer(self, sender, receiver, amount):
+        amount = float(amount)
+        if not valid_amount(amount):
+            raise ValueError(INVALID_AMOUNT)
+        status, _, _ = self.engine.transfer(sender, receiver, amount)
+        if status != TRANSFERRED:
+            raise ValueError(status)
+        return status
+
+    def update(self, account_number, changes):
+        if "balance" in changes or "account_creation_date" in changes:
+            raise ValueError("balance and creation date cannot be updated")
+        if "gender" in changes and changes["gender"] not in ("Male", "Female", "Others"):
+            raise ValueError("invalid gender")
+        status = self.engine.update(account_number, changes)
+        if status != DONE:
+            raise LookupError(status)
+        return status
+
+    def delete(self, account_number):
+        status = self.engine.delete(account_number)
+        if status != DONE:
+            raise LookupError(status)
+        return status
+
+    def search(self, query=None, field="full_name", conditions=None):
+        """
+        All the accounts whose field has the query as value, or that
+        match every condition, e.g. [["city", "=", "Mumbai"], ["age",
+        "between", 25, 40]] (see SecondaryIndexes.search)
+        """
+        if conditions is None:
+            conditions = [(field, "=", query)]
+        return find_accounts(self.store, self.indexes, [tuple(condition) for condition in conditions])
+
+    def fuzzy(self, query, limit=TOP_K):
+        """
+        The accounts whose name is the most similar to the query, with
+        their similarity
+        """
+        return find_similar_accounts(self.store, self.fuzzy_names, query, int(limit))
+
+    def list(self, field="full_name", offset=0, limit=LIST_LIMIT, descending=False, after=None):
+        """
+        A page of the accounts sorted by field, from offset or after the
+        cursor [value, account number] of the last account of the
+        previous page. field "balance" lists the highest balances first.
+        """
+        limit = min(int(limit), LIST_LIMIT)
+        if field == "balance":
+            return top_accounts_by_balance(self.store, int(offset) + limit)[int(offset):]
+        return accounts_page(self.store, self.listing, field, int(offset), limit, bool(descending), after)
+
+    def statement(self, account_number, start=None, end=None):
+        """
+        The ledger entries of an account between two moments (ISO 8601
+        or seconds since the epoch), oldest first
+        """
+        if self.ledger is None:
+            raise LookupError("no ledger")
+        return self.ledger.statement(account_number, start, end)
+
+    def balance_at(self, account_number, when):
+        """
+        The balance of an account at a past moment, from the ledger
+        """
+        if self.ledger is None:
+            raise LookupError("no ledger")
+        balance = self.ledger.balance_at(account_number, when)
+        if balance is None:
+            raise LookupError("no transfer of the account in the ledger")
+        return balance
+
+
+# ─── SERVICE ────────────────────────────────────────────────────────────────────
+
+
+def check_arguments(arguments):
+    """
+    Refuses the arguments of a request whose account numbers are not
+    strings or whose amounts are not numbers, before they reach the
+    engine (a number given as account number would fail deep in the
+    locking, and "10" as amount would be taken as ten)
+    """
+    for name in ACCOUNT_ARGUMENTS:
+        if name in arguments and not isinstance(arguments[name], str):
+            raise TypeError("%s must be a string" % name)
+    for name in AMOUNT_ARGUMENTS:
+        value = arguments.get(name)
+        if name in arguments and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            raise TypeError("%s must be a number" % name)
+
+
+class BankService:
+    """
+    Serves BankOperations over TCP. The storage work runs in a thread
+    pool so the event loop only parses and routes requests. A semaphore
+    bounds the requests being worked on over all the connections, and
+    each connection has at most PIPELINE_DEPTH requests in flight, after
+    which it stops reading until responses have been written.
+    """
+
+    def __init__(self, operations, workers=WORKERS, max_concurrency=MAX_CONCURRENCY,
+                 pipeline_depth=PIPELINE_DEPTH):
+        self.operations = operations
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.max_concurrency = max_concurrency
+        self.pipeline_depth = pipeline_depth
+        self._slots = None
+
+    async def execute(self, request):
+        """
+        Runs one request and returns its response object
+        """
+        request_id = request.get("id") if isinstance(request, dict) else None
+        try:
+            if not isinstance(request, dict):
+                raise ValueError("request must be an object")
+            arguments = dict(request)
+            arguments.pop("id", None)
+            name = arguments.pop("op", None)
+            if name not in OPERATIONS:
+                raise ValueError("unknown op: " + str(name))
+            check_arguments(arguments)
+            operation = getattr(self.operations, name)
+            async with self._slots:
+                result = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, lambda: operation(**arguments))
+            return {"id": request_id, "ok": True, "result": result}
+        except (LookupError, TypeError, ValueError) as error:
+            return {"id": request_id, "ok": False, "error": str(error.args[0] if error.args else error)}
+        except Exception as error:
+            # anything else fails this request only, not the connection and
+            # the requests pipelined after it
+            return {"id": request_id, "ok": False, "error": "%s: %s" % (type(error).__name__, error)}
+
+    async def respond(self, pending, writer):
+        """
+        Writes the responses of a connection in the order of its requests
+        """
+        while True:
+            task = await pending.get()
+            if task is None:
+                break
+            response = await task
+            writer.write(json.dumps(response).encode() + b"\n")
+            if pending.empty():
+                await writer.drain()
+
+    async def handle_connection(self, reader, writer):
+        pending = asyncio.Queue(maxsize=self.pipeline_depth)
+        responder = asyncio.ensure_future(self.respond(pending, writer))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if not line.strip():
+                    continue
+                try:
+                    request = json.loads(line)
+                except ValueError:
+                    request = None
+                await pending.put(asyncio.ensure_future(self.execute(request)))
+            await pending.put(None)
+            await responder
+            await writer.drain()
+        except ConnectionError:
+            responder.cancel()
+        finally:
+            writer.close()
+
+    async def serve(self, host=HOST, port=PORT, ready=None):
+        """
+        Serves until cancelled. ready, if given, is called with the
+        server once it listens.
+        """
+        self._slots = asyncio.Semaphore(self.max_concurrency)
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        if ready is not None:
+            ready(server)
+        async with server:
+            await server.serve_forever()
+
+
+# ─── MAIN ───────────────────────────────────────────────────────────────────────
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the bank over TCP (JSON lines).")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="threads doing the storage work")
+    parser.add_argument("--max-concurrency", type=int, default=MAX_CONCURRENCY,
+                        help="requests worked on at the same time")
+    arguments = parser.parse_args()
+
+    store = open_backend()
+    engine = TransactionEngine(store, ledger=open_ledger(store), detector=open_detector(store))
+    service = BankService(BankOperations(engine), arguments.workers, arguments.max_concurrency)
+    print("Serving the bank on %s:%d" % (arguments.host, arguments.port))
+    try:
+        asyncio.run(service.serve(arguments.host, arguments.port))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,724 @@
+"""
+A storage backend for banks too large to keep in memory. The accounts
+are kept in shard files of fixed-width records that are read and
+written through mmap, so a transfer only touches the pages of the two
+accounts it changes, whether the bank has ten thousand accounts or ten
+million.
+
+The data is a directory (bank.shards by default):
+    manifest.json   the shards, the range of account hashes each one
+                    holds, and the number of the last checkpoint
+    shard-*.dat     a shard: a header page, then a table of slots
+    control         how far the journal was applied, and a change counter
+    journal         the write-ahead journal since the last checkpoint
+
+An account belongs to the shard whose range holds the CRC32 of its
+account number. Within the shard its slot is found from the same hash
+with open addressing and linear probing, so a lookup reads one or two
+256-byte slots, sixteen to a page. When a shard is 75% full its range
+is split in two: only its own records are copied into the two new
+shards, the manifest is replaced atomically, and the other shards are
+left alone. Processes notice a new manifest and map the new files.
+
+A change is first appended to the journal as the new images of the
+accounts it changes (so applying it twice does no harm), then written
+into the mapped files. Every CHECKPOINT_EVERY transactions the mapped
+files are flushed to disk and an empty journal is started. The first
+time a process touches the store it applies the whole journal again,
+which repairs whatever a crash, even a power loss, left out of the
+shard files.
+
+Text fields are stored UTF-8 encoded in fixed widths (see WIDTHS); a
+value that does not fit, or contains a NUL character, is refused with
+a ValueError. Values are stored as text, the balance as a float.
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import bisect
+import json
+import mmap
+import os
+import shutil
+import struct
+import threading
+import zlib
+import metrics
+from backends import ACCOUNT_FIELDS, StorageBackend
+from journal import Journal
+from locking import FileLock
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+CHECKPOINT_EVERY = 1000
+FORMAT = 1
+SHARD_MAGIC = b"MYBANKSH"
+CONTROL_MAGIC = b"MYBANKCT"
+HEADER_SIZE = 4096
+RECORD_SIZE = 256
+# the widths in bytes of the text fields of a record
+NUMBER_WIDTH = 24
+WIDTHS = [("full_name", 80), ("gender", 8), ("account_creation_date", 16), ("city", 40),
+          ("phone_number", 20), ("age", 8), ("country", 40)]
+# state, CRC32 of the rest, account number, the text fields, balance
+RECORD = struct.Struct("<BI%ds" % NUMBER_WIDTH + "".join("%ds" % width for _, width in WIDTHS) + "d")
+PADDING = bytes(RECORD_SIZE - RECORD.size)
+# magic, format, record size, capacity, used slots, deleted slots
+SHARD_HEADER = struct.Struct("<8sIIQQQ")
+COUNTS_OFFSET = 24
+# magic, checkpoint the journal belongs to, bytes of it applied, changes made
+CONTROL = struct.Struct("<8sQQQ")
+EMPTY, USED, DELETED = 0, 1, 2
+FIBONACCI = 0x9E3779B1
+HASH_SPACE = 1 << 32
+# slots of a new shard, and how full shards are built and split
+SHARD_CAPACITY = 1 << 16
+BUILD_LOAD = 0.5
+MAX_LOAD = 0.75
+READ_RETRIES = 100
+
+
+# ─── RECORDS ────────────────────────────────────────────────────────────────────
+
+
+def account_hash(account_number):
+    """
+    The hash that places an account in a shard and in a slot
+    """
+    return zlib.crc32(account_number.encode("utf-8"))
+
+
+def encode(field, value, width):
+    data = str(value).encode("utf-8")
+    if len(data) > width or b"\0" in data:
+        raise ValueError("The %s does not fit in a record of %d bytes: %r" % (field, width, value))
+    return data
+
+
+def pack_record(account_number, record):
+    """
+    The bytes of the slot of an account
+    """
+    texts = [encode(field, record[field], width) for field, width in WIDTHS]
+    body = RECORD.pack(USED, 0, encode("account number", account_number, NUMBER_WIDTH), *texts,
+                       float(record["balance"]))
+    rest = body[5:]
+    return body[:1] + struct.pack("<I", zlib.crc32(rest)) + rest + PADDING
+
+
+def unpack_record(data):
+    """
+    The account number and the account of the bytes of a slot
+    """
+    values = RECORD.unpack_from(data)
+    fields = {field: value.rstrip(b"\0").decode("utf-8") for (field, _), value in zip(WIDTHS, values[3:-1])}
+    fields["balance"] = values[-1]
+    return values[2].rstrip(b"\0").decode("utf-8"), {field: fields[field] for field in ACCOUNT_FIELDS}
+
+
+def slot_key(data):
+    """
+    The padded account number and the hash of the account in a slot
+    """
+    key = data[5:5 + NUMBER_WIDTH]
+    return key, zlib.crc32(key.rstrip(b"\0"))
+
+
+# ─── SHARDS ─────────────────────────────────────────────────────────────────────
+
+
+class Shard:
+    """
+    One shard file mapped into memory: a header page, then capacity
+    slots of RECORD_SIZE bytes, capacity being a power of two. A slot is
+    empty, used, or deleted (a tombstone that keeps the probe chains of
+    the accounts after it unbroken until the shard is rebuilt).
+    """
+
+    def __init__(self, path, low, high):
+        self.path = path
+        self.low = low
+        self.high = high
+        self._file = open(path, "r+b")
+        self.map = mmap.mmap(self._file.fileno(), 0)
+        magic, version, record_size, self.capacity, _, _ = SHARD_HEADER.unpack_from(self.map)
+        if magic != SHARD_MAGIC or version != FORMAT or record_size != RECORD_SIZE:
+            raise ValueError("Not a shard of this format: " + path)
+        self._mask = self.capacity - 1
+        self._shift = 33 - self.capacity.bit_length()
+
+    @classmethod
+    def create(cls, path, low, high, capacity, records=()):
+        """
+        Writes a new shard file holding the given slot bytes. The file is
+        sparse: the pages of empty slots take no room on disk.
+        """
+        with open(path, "wb") as f:
+            f.truncate(HEADER_SIZE + capacity * RECORD_SIZE)
+            f.write(SHARD_HEADER.pack(SHARD_MAGIC, FORMAT, RECORD_SIZE, capacity, 0, 0))
+        shard = cls(path, low, high)
+        for data in records:
+            key, h = slot_key(data)
+            shard.write(shard.find(key, h)[1], data)
+        shard.sync()
+        return shard
+
+    @property
+    def counts(self):
+        """
+        The number of used and of deleted slots
+        """
+        return struct.unpack_from("<QQ", self.map, COUNTS_OFFSET)
+
+    def full(self):
+        used, deleted = self.counts
+        return used + deleted > self.capacity * MAX_LOAD
+
+    def find(self, key, h):
+        """
+        Looks an account up by its padded account number and its hash.
+        Returns (slot, -1) when found, else (-1, the slot to insert it in).
+        """
+        memory = self.map
+        slot = ((h * FIBONACCI) & 0xFFFFFFFF) >> self._shift
+        free = -1
+        for _ in range(self.capacity):
+            offset = HEADER_SIZE + slot * RECORD_SIZE
+            state = memory[offset]
+            if state == USED:
+                if memory[offset + 5:offset + 5 + NUMBER_WIDTH] == key:
+                    return slot, -1
+            elif state == EMPTY:
+                return -1, slot if free < 0 else free
+            elif free < 0:
+                free = slot
+            slot = (slot + 1) & self._mask
+        return -1, free
+
+    def read(self, slot):
+        """
+        The bytes of a used slot. A slot being written by another process
+        at the same time fails its checksum and is read again.
+        """
+        offset = HEADER_SIZE + slot * RECORD_SIZE
+        for _ in range(READ_RETRIES):
+            data = self.map[offset:offset + RECORD_SIZE]
+            if zlib.crc32(data[5:RECORD.size]) == struct.unpack_from("<I", data, 1)[0]:
+                return data
+        raise IOError("Corrupt record in slot %d of %s" % (slot, self.path))
+
+    def write(self, slot, data):
+        offset = HEADER_SIZE + slot * RECORD_SIZE
+        state = self.map[offset]
+        self.map[offset:offset + RECORD_SIZE] = data
+        if state != USED:
+            used, deleted = self.counts
+            struct.pack_into("<QQ", self.map, COUNTS_OFFSET, used + 1, deleted - (state == DELETED))
+
+    def erase(self, slot):
+        self.map[HEADER_SIZE + slot * RECORD_SIZE] = DELETED
+        used, deleted = self.counts
+        struct.pack_into("<QQ", self.map, COUNTS_OFFSET, used - 1, deleted + 1)
+
+    def records(self):
+        """
+        The bytes of every used slot
+        """
+        states = self.map[HEADER_SIZE::RECORD_SIZE]
+        slot = states.find(USED)
+        while slot >= 0:
+            yield self.read(slot)
+            slot = states.find(USED, slot + 1)
+
+    def sync(self):
+        """
+        Writes the changed pages to disk
+        """
+        self.map.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        self.map.close()
+        self._file.close()
+
+
+# ─── SHARDED STORE ──────────────────────────────────────────────────────────────
+
+
+class ShardedStore(StorageBackend):
+    """
+    Keeps the accounts in memory-mapped shard files, see the top of
+    this file. Point operations (get, transfer, put, delete) cost the
+    same whatever the number of accounts; load() reads every shard and
+    is cached until the accounts change.
+
+    Like the JSON store, writers of every thread and process are
+    serialized with a lock file next to the data (bank.shards.lock).
+    Listeners only see the changes made through this object and the
+    accounts loaded by load().
+    """
+
+    def __init__(self, path, checkpoint_every=CHECKPOINT_EVERY):
+        """
+        Creates the store for a data directory. Nothing is read until
+        the accounts are requested for the first time.
+        """
+        super().__init__()
+        self.path = path
+        self.checkpoint_every = checkpoint_every
+        self.journal = Journal(os.path.join(path, "journal"))
+        self.version = 0
+        self._manifest_path = os.path.join(path, "manifest.json")
+        # the shards and the low end of their ranges, replaced as a whole
+        self._layout = ([], [])
+        self._generation = 0
+        self._checkpoint = 0
+        self._signature = None
+        self._control = None
+        self._recovered = False
+        self._users = None
+        self._users_key = None
+        self._journal_entries = 0
+        self._lock = threading.RLock()
+        self._writer_lock = None
+
+    # ─── MANIFEST ───────────────────────────────────────────────────────────
+
+    def _manifest_signature(self):
+        try:
+            stat = os.stat(self._manifest_path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    @property
+    def _shards(self):
+        return self._layout[0]
+
+    def _open_manifest(self, created=()):
+        """
+        Maps the shards of the current manifest. Shards that are still
+        listed (or were just created) stay mapped; the others are dropped
+        and unmapped once no reader uses them anymore.
+        """
+        try:
+            with open(self._manifest_path, "rb") as f:
+                stat = os.fstat(f.fileno())
+                manifest = json.loads(f.read())
+        except FileNotFoundError:
+            self._layout, self._signature = ([], []), None
+            return
+        mapped = {shard.path: shard for shard in self._shards + list(created)}
+        shards = []
+        for entry in manifest["shards"]:
+            path = os.path.join(self.path, entry["file"])
+            shards.append(mapped.get(path) or Shard(path, entry["low"], entry["high"]))
+        if manifest["checkpoint"] != self._checkpoint:
+            # the journal was replaced, appends must go to the new file
+            self.journal.close()
+        if self._control is None:
+            with open(os.path.join(self.path, "control"), "r+b") as f:
+                self._control = mmap.mmap(f.fileno(), 0)
+        self._layout = (shards, [shard.low for shard in shards])
+        self._generation, self._checkpoint = manifest["generation"], manifest["checkpoint"]
+        self._signature = (stat.st_ino, stat.st_size, stat.st_mtime_ns)
+
+    def _write_manifest(self, shards, generation, checkpoint):
+        """
+        Replaces the manifest atomically; this is the moment a split, a
+        checkpoint or a new set of accounts takes effect
+        """
+        manifest = {
+            "format": FORMAT,
+            "generation": generation,
+            "checkpoint": checkpoint,
+            "shards": [{"low": shard.low, "high": shard.high, "file": os.path.basename(shard.path)}
+                       for shard in shards],
+        }
+        temporary_path = self._manifest_path + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(manifest, f, indent=1)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary_path, self._manifest_path)
+        if hasattr(os, "O_DIRECTORY"):
+            directory = os.open(self.path, os.O_RDONLY | os.O_DIRECTORY)
+            try:
+                os.fsync(directory)
+            finally:
+                os.close(directory)
+        self._open_manifest(shards)
+
+    def _remove_orphans(self):
+        """
+        Deletes the shard files no manifest refers to anymore, left by a
+        split, a save, or a crash in the middle of one
+        """
+        listed = set(shard.path for shard in self._shards)
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            if name.startswith("shard-") and path not in listed:
+                os.remove(path)
+            elif name.startswith("build-"):
+                shutil.rmtree(path, ignore_errors=True)
+
+    def shard_info(self):
+        """
+        The shards as (file, low hash, high hash, capacity, used slots,
+        deleted slots) tuples
+        """
+        self._refresh()
+        return [(os.path.basename(shard.path), shard.low, shard.high, shard.capacity) + tuple(shard.counts)
+                for shard in self._shards]
+
+    # ─── READING ────────────────────────────────────────────────────────────
+
+    def _refresh(self):
+        """
+        Follows a manifest replaced by another process, and the first time
+        applies the journal again in case a crash left something out
+        """
+        if self._manifest_signature() != self._signature:
+            with self._lock:
+                self._open_manifest()
+        if not self._recovered and self._signature is not None:
+            with self._lock, self.writing():
+                self._prepare()
+
+    def _changes(self):
+        return CONTROL.unpack_from(self._control)[3] if self._control is not None else 0
+
+    def _locate(self, account_number):
+        """
+        The shard of an account, its slot (-1 when the account does not
+        exist) and the slot to insert it in
+        """
+        key = account_number.encode("utf-8")
+        h = zlib.crc32(key)
+        shards, lows = self._layout
+        shard = shards[bisect.bisect_right(lows, h) - 1]
+        return (shard,) + shard.find(key.ljust(NUMBER_WIDTH, b"\0"), h)
+
+    def _read(self, account_number):
+        shard, slot, _ = self._locate(account_number)
+        if slot < 0:
+            return None
+        metrics.count("records_read")
+        return unpack_record(shard.read(slot))[1]
+
+    def get(self, account_number):
+        """
+        Returns a single account, or None when it does not exist
+        """
+        self._refresh()
+        if not self._shards or len(account_number.encode("utf-8")) > NUMBER_WIDTH:
+            return None
+        return self._read(account_number)
+
+    def existing(self, account_numbers):
+        """
+        Returns the set of the given account numbers that are taken
+        """
+        return set(number for number in account_numbers if self.get(number) is not None)
+
+    def load(self):
+        """
+        Returns all the accounts, keyed by account number. They are read
+        from every shard, so this is the one operation whose cost grows
+        with the bank; the result is kept until the accounts change.
+        """
+        self._refresh()
+        if self._users is not None and self._users_key == (self._signature, self._changes()):
+            return self._users
+        with self._lock, self.writing():
+            return self._scan()
+
+    @metrics.timed("store.read_snapshot")
+    def _scan(self):
+        self._prepare(create=False)
+        key = (self._signature, self._changes())
+        if self._users is not None and self._users_key == key:
+            return self._users
+        reloaded = self._users is not None
+        users = {}
+        for shard in self._shards:
+            for data in shard.records():
+                number, record = unpack_record(data)
+                users[number] = record
+        metrics.count("records_read", len(users))
+        metrics.count("bytes_read", len(users) * RECORD_SIZE)
+        self._users, self._users_key = users, key
+        self.version += 1
+        if reloaded:
+            self._notify_reset(users)
+        return users
+
+    # ─── WRITING ────────────────────────────────────────────────────────────
+
+    def writing(self):
+        """
+        The lock every writer holds, across threads and processes
+        """
+        with self._lock:
+            if self._writer_lock is None:
+                self._writer_lock = FileLock(self.path + ".lock")
+        return self._writer_lock
+
+    def _prepare(self, create=True):
+        """
+        Brings the mapped shards up to date before a write, with the
+        writer lock held: follows the manifest, creates an empty store
+        when there is none, and applies the journal entries another
+        process wrote but did not apply (all of them, the first time)
+        """
+        if self._manifest_signature() != self._signature:
+            self._open_manifest()
+        if self._signature is None:
+            if not create:
+                return
+            self.bulk_load((), 0)
+        self._recover(from_start=not self._recovered)
+        self._recovered = True
+
+    @metrics.timed("store.replay_journal")
+    def _recover(self, from_start=False):
+        _, checkpoint, applied, changes = CONTROL.unpack_from(self._control)
+        if checkpoint != self._checkpoint or from_start:
+            applied = 0
+        else:
+            try:
+                if os.path.getsize(self.journal.path) == applied:
+                    return
+            except FileNotFoundError:
+                pass
+        transactions, offset = self.journal.read(self._checkpoint, applied)
+        full = set()
+        for ops in transactions:
+            full.update(self._write([(op[1], pack_record(op[1], op[2]) if op[0] == "put" else None)
+                                     for op in ops]))
+        metrics.count("journal_entries_read", len(transactions))
+        if offset == 0:
+            # no journal yet, or a stale one left by an interrupted checkpoint
+            self.journal.reset(self._checkpoint)
+            offset = os.path.getsize(self.journal.path)
+        elif os.path.getsize(self.journal.path) > offset:
+            self.journal.truncate(offset)
+        CONTROL.pack_into(self._control, 0, CONTROL_MAGIC, self._checkpoint, offset, changes + 1)
+        for shard in full:
+            self._split(shard)
+
+    def _write(self, slots):
+        """
+        Writes (account_number, slot bytes or None to delete) pairs into
+        the shards and returns the shards that became too full
+        """
+        full = []
+        for number, data in slots:
+            shard, slot, free = self._locate(number)
+            if data is None:
+                if slot >= 0:
+                    shard.erase(slot)
+            elif slot >= 0:
+                shard.write(slot, data)
+            else:
+                shard.write(free, data)
+                if shard.full() and shard not in full:
+                    full.append(shard)
+        return full
+
+    @metrics.timed("store.commit")
+    def commit_ops(self, ops, durable=True):
+        """
+        Applies a transaction to the accounts: appends the new images of
+        the accounts it changes to the journal, then writes them into the
+        shards. With durable=False the fsync is left to a later commit(),
+        which lets a batch of transactions share one.
+        """
+        with self._lock, self.writing():
+            self._prepare()
+            cached = self._users is not None and self._users_key == (self._signature, self._changes())
+            old = {}
+            new = {}
+            for op in ops:
+                kind, account_number = op[0], op[1]
+                if account_number not in new:
+                    old[account_number] = new[account_number] = self._read(account_number)
+                if kind == "delta":
+                    record = dict(new[account_number])
+                    record["balance"] += op[2]
+                elif kind == "put":
+                    record = op[2]
+                else:
+                    record = None
+                new[account_number] = record
+            # a record that does not fit is refused before anything is written
+            slots = [(number, None if record is None else pack_record(number, record))
+                     for number, record in new.items()]
+            seq, offset = self.journal.append([["put", number, record] if record is not None else ["del", number]
+                                               for number, record in new.items()])
+            if durable:
+                self.journal.commit(seq)
+            full = self._write(slots)
+            changes = CONTROL.unpack_from(self._control)[3] + 1
+            CONTROL.pack_into(self._control, 0, CONTROL_MAGIC, self._checkpoint, offset, changes)
+            changes = [(number, old[number], new[number]) for number in new]
+            if cached:
+                for number, _, record in changes:
+                    if record is None:
+                        self._users.pop(number, None)
+                    else:
+                        self._users[number] = record
+                self._users_key = (self._signature, self._changes())
+            self.version += 1
+            metrics.count("records_written", len(changes))
+            if self._listeners:
+                self._notify(changes)
+            for shard in full:
+                self._split(shard)
+            self._journal_entries += 1
+            if self._journal_entries >= self.checkpoint_every:
+                self.checkpoint()
+
+    def commit(self):
+        """
+        Makes every transaction appended so far durable
+        """
+        self.journal.commit()
+
+    def put(self, account_number, record, durable=True):
+        """
+        Creates or replaces an account
+        """
+        self.commit_ops([["put", account_number, record]], durable)
+
+    def put_many(self, records, durable=True):
+        """
+        Creates or replaces many accounts as one journal transaction
+        """
+        self.commit_ops([["put", number, record] for number, record in records.items()], durable)
+
+    def delete(self, account_number, durable=True):
+        """
+        Removes an account
+        """
+        self.commit_ops([["del", account_number]], durable)
+
+    def transfer(self, sender_number, receiver_number, amount, durable=True):
+        """
+        Moves money between two accounts as one transaction. The checks
+        (existing accounts, enough balance) are up to the caller.
+        """
+        self.commit_ops([["delta", sender_number, -amount], ["delta", receiver_number, amount]], durable)
+
+    def apply_deltas(self, deltas, durable=True):
+        """
+        Adds to the balance of many accounts as one journal transaction
+        """
+        self.commit_ops([["delta", number, amount] for number, amount in deltas.items()], durable)
+
+    def save(self, users):
+        """
+        Replaces all the accounts
+        """
+        self.bulk_load(users.items(), len(users))
+        with self._lock:
+            self._users, self._users_key = users, (self._signature, self._changes())
+            self._notify_reset(users)
+
+    def checkpoint(self):
+        """
+        Flushes the shards to disk and starts an empty journal
+        """
+        with self._lock, self.writing():
+            self._prepare()
+            for shard in self._shards:
+                shard.sync()
+            self._write_manifest(self._shards, self._generation, self._checkpoint + 1)
+            self._recover()
+            self._journal_entries = 0
+
+    # ─── LAYOUT ─────────────────────────────────────────────────────────────
+
+    def _new_shard(self, low, high, records, generation, capacity=None):
+        capacity = capacity or SHARD_CAPACITY
+        while len(records) > capacity * BUILD_LOAD:
+            capacity *= 2
+        path = os.path.join(self.path, "shard-%08x-%d.dat" % (low, generation))
+        return Shard.create(path, low, high, capacity, records)
+
+    @metrics.timed("store.split_shard")
+    def _split(self, shard):
+        """
+        Replaces a shard that got too full by two shards holding the
+        halves of its range, or by a larger one when its range cannot be
+        halved anymore. The other shards are not touched.
+        """
+        if shard not in self._shards:
+            return
+        records = list(shard.records())
+        generation = self._generation + 1
+        if shard.high - shard.low > 1:
+            middle = (shard.low + shard.high) // 2
+            halves = [(shard.low, middle), (middle, shard.high)]
+            replacement = [self._new_shard(low, high, [data for data in records if low <= slot_key(data)[1] < high],
+                                           generation)
+                           for low, high in halves]
+        else:
+            replacement = [self._new_shard(shard.low, shard.high, records, generation, shard.capacity * 2)]
+        index = self._shards.index(shard)
+        self._write_manifest(self._shards[:index] + replacement + self._shards[index + 1:],
+                             generation, self._checkpoint)
+        self._remove_orphans()
+        metrics.count("shards_split")
+
+    @metrics.timed("store.bulk_load")
+    def bulk_load(self, items, count=0):
+        """
+        Replaces all the accounts with the (account_number, record) pairs
+        of an iterable, which is read once and never held in memory: the
+        records are first spread into one file per shard, then each
+        shard is built on its own. count, when known, sizes the shards.
+        """
+        with self._lock, self.writing():
+            if self._manifest_signature() != self._signature:
+                self._open_manifest()
+            shards = max(1, -(-count // int(SHARD_CAPACITY * BUILD_LOAD)))
+            generation = self._generation + 1
+            spill = os.path.join(self.path, "build-%d" % generation)
+            os.makedirs(spill, exist_ok=True)
+            control_path = os.path.join(self.path, "control")
+            if not os.path.exists(control_path):
+                with open(control_path, "wb") as f:
+                    f.write(CONTROL.pack(CONTROL_MAGIC, 0, 0, 0).ljust(HEADER_SIZE, b"\0"))
+            buckets = [open(os.path.join(spill, str(i)), "wb") for i in range(shards)]
+            try:
+                for number, record in items:
+                    buckets[account_hash(number) * shards >> 32].write(pack_record(number, record))
+            except BaseException:
+                for bucket in buckets:
+                    bucket.close()
+                shutil.rmtree(spill, ignore_errors=True)
+                raise
+            replacement = []
+            for i, bucket in enumerate(buckets):
+                bucket.close()
+                with open(bucket.name, "rb") as f:
+                    data = f.read()
+                records = [data[start:start + RECORD_SIZE] for start in range(0, len(data), RECORD_SIZE)]
+                replacement.append(self._new_shard(i * HASH_SPACE // shards, (i + 1) * HASH_SPACE // shards,
+                                                   records, generation))
+                metrics.count("records_written", len(records))
+            shutil.rmtree(spill, ignore_errors=True)
+            self._write_manifest(replacement, generation, self._checkpoint + 1)
+            self._remove_orphans()
+            self._recover()
+            self._recovered = True
+            self._journal_entries = 0
+            self.version += 1
+
+    def close(self):
+        self.journal.close()
+        with self._lock:
+            for shard in self._shards:
+                shard.close()
+            if self._control is not None:
+                self._control.close()
+            self._layout, self._signature, self._control = ([], []), None, None
@@ -0,0 +1,459 @@
+"""
+The binary snapshot format (.snap): the accounts in a file a third the
+size of the same accounts as JSON, that loads about twice as fast (the
+columns alone, several times faster) and that can be read and written
+one chunk of records at a time.
+
+A snapshot file is
+    header      MAGIC, the format VERSION, and a JSON description of the
+                columns (account_number first, then ACCOUNT_FIELDS)
+                followed by its CRC32
+    chunks      up to CHUNK_RECORDS accounts each: the number of
+                records, the length and CRC32 of the payload, then the
+                payload, which holds every column of the chunk one after
+                the other
+    end         a chunk of zero records, so a truncated file is noticed
+
+A column is written in the first encoding that fits its values:
+    DICT        strings with few distinct values (gender, city, country,
+                dates...): the distinct strings once, then a 16-bit code
+                per record
+    TEXT        other strings: NUL separated UTF-8
+    FLOAT       floats (the balances): 64-bit IEEE values
+    JSON        anything else, as a JSON array
+
+Account numbers are always kept as strings, exactly as they were. The
+file is the storage of the "snapshot" backend, and this module also
+converts between it and the bank.json and bank.csv files:
+
+    python snapshot.py bank.json bank.snap
+    python snapshot.py bank.snap bank.csv
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import argparse
+import csv
+import gc
+import io
+import itertools
+import json
+import os
+import re
+import struct
+import sys
+import zlib
+from array import array
+from collections import deque
+from operator import itemgetter, setitem
+from backends import ACCOUNT_FIELDS
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+MAGIC = b"MYBANKSN"
+VERSION = 1
+EXTENSION = ".snap"
+FIELDS = ["account_number"] + ACCOUNT_FIELDS
+CHUNK_RECORDS = 65536
+# magic, version, length of the JSON description of the columns
+HEADER = struct.Struct("<8sHI")
+# records, payload length, CRC32 of the payload
+CHUNK = struct.Struct("<III")
+# encoding, length of the encoded column
+COLUMN = struct.Struct("<BI")
+CRC = struct.Struct("<I")
+
+TEXT, DICT, FLOAT, JSON = 1, 2, 3, 4
+MAX_DISTINCT = 65535
+SAMPLE = 4096
+SWAP = sys.byteorder != "little"
+
+# account numbers written as dates by an old pandas export of bank.csv:
+# the number read as microseconds since the epoch
+TIMESTAMP = re.compile(r"^(\d{4})-(\d\d)-(\d\d)[ T](\d\d):(\d\d):(\d\d)(?:\.(\d{1,6}))?$")
+
+
+# ─── COLUMNS ────────────────────────────────────────────────────────────────────
+
+
+def _packed(values, typecode):
+    packed = array(typecode, values)
+    if SWAP:
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def _unpacked(data, typecode):
+    values = array(typecode)
+    values.frombytes(data)
+    if SWAP:
+        values.byteswap()
+    return values
+
+
+def encode_column(values):
+    """
+    Returns the encoding and the bytes of a column of a chunk
+    """
+    types = set(map(type, values))
+    if types == {str}:
+        text = "\0".join(values)
+        if text.count("\0") == len(values) - 1:
+            # the first values tell the names and phone numbers apart
+            # without going through all their distinct values
+            sample = values[:SAMPLE]
+            if len(set(sample)) <= len(sample) * 3 // 4:
+                distinct = dict.fromkeys(values)
+                if len(distinct) <= min(MAX_DISTINCT, len(values) // 4):
+                    codes = {value: code for code, value in enumerate(distinct)}
+                    strings = "\0".join(distinct).encode("utf-8")
+                    return DICT, CRC.pack(len(strings)) + strings + _packed(map(codes.__getitem__, values), "H")
+            return TEXT, text.encode("utf-8")
+    if types == {float}:
+        return FLOAT, _packed(values, "d")
+    return JSON, json.dumps(values).encode("utf-8")
+
+
+def decode_column(encoding, data, count):
+    """
+    Returns the values of a column of a chunk
+    """
+    if encoding == TEXT:
+        return str(data, "utf-8").split("\0") if count else []
+    if encoding == DICT:
+        length, = CRC.unpack_from(data)
+        strings = str(data[CRC.size:CRC.size + length], "utf-8").split("\0")
+        return list(map(strings.__getitem__, _unpacked(data[CRC.size + length:], "H")))
+    if encoding == FLOAT:
+        return _unpacked(data, "d").tolist()
+    if encoding == JSON:
+        return json.loads(bytes(data))
+    raise ValueError("Unknown column encoding in snapshot: " + str(encoding))
+
+
+# ─── WRITING ────────────────────────────────────────────────────────────────────
+
+
+def _header():
+    description = json.dumps({"fields": FIELDS}).encode("utf-8")
+    return HEADER.pack(MAGIC, VERSION, len(description)) + description + CRC.pack(zlib.crc32(description))
+
+
+def _chunk(records):
+    """
+    Encodes a list of (account_number, record) pairs as one chunk
+    """
+    numbers = [str(number) for number, _ in records]
+    records = [record for _, record in records]
+    try:
+        columns = [list(map(itemgetter(field), records)) for field in ACCOUNT_FIELDS]
+    except KeyError as error:
+        raise ValueError("Account record without the %s field" % error) from None
+    parts = []
+    for values in [numbers] + columns:
+        encoding, data = encode_column(values)
+        parts.append(COLUMN.pack(encoding, len(data)))
+        parts.append(data)
+    payload = b"".join(parts)
+    return CHUNK.pack(len(records), len(payload), zlib.crc32(payload)) + payload
+
+
+def write_records(f, records, chunk_records=CHUNK_RECORDS):
+    """
+    Writes (account_number, record) pairs to a binary file as a snapshot,
+    chunk by chunk, so the records can come from a generator. Returns the
+    number of records written.
+    """
+    f.write(_header())
+    records = iter(records)
+    written = 0
+    while True:
+        chunk = list(itertools.islice(records, chunk_records))
+        if not chunk:
+            break
+        f.write(_chunk(chunk))
+        written += len(chunk)
+    f.write(CHUNK.pack(0, 0, 0))
+    return written
+
+
+def dumps(users):
+    """
+    Returns the accounts, keyed by account number, as snapshot bytes
+    """
+    buffer = io.BytesIO()
+    write_records(buffer, users.items())
+    return buffer.getvalue()
+
+
+def save(path, users):
+    """
+    Writes the accounts into a snapshot file, through a temporary file
+    so a crash never leaves half a file behind
+    """
+    _write_atomically(path, lambda f: write_records(f, users.items()))
+
+
+# ─── READING ────────────────────────────────────────────────────────────────────
+
+
+def _read_header(read):
+    magic, version, length = HEADER.unpack(_exactly(read, HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("Not a snapshot file")
+    if version > VERSION:
+        raise ValueError("Snapshot version %d is newer than this program (%d)" % (version, VERSION))
+    description = _exactly(read, length)
+    if CRC.unpack(_exactly(read, CRC.size))[0] != zlib.crc32(description):
+        raise ValueError("Damaged snapshot header")
+    fields = json.loads(description)["fields"]
+    if not all(type(field) is str for field in fields):
+        raise ValueError("Damaged snapshot header")
+    if fields[0] != "account_number":
+        raise ValueError("Snapshot without account numbers")
+    return fields[1:]
+
+
+def _exactly(read, size):
+    data = read(size)
+    if len(data) != size:
+        raise ValueError("Truncated snapshot")
+    return data
+
+
+def _read_chunk(read, fields):
+    """
+    The account numbers and the list of column values of the next chunk,
+    checked against its CRC32, or None at the end of the file
+    """
+    count, length, crc = CHUNK.unpack(_exactly(read, CHUNK.size))
+    if count == 0:
+        return None
+    payload = _exactly(read, length)
+    if zlib.crc32(payload) != crc:
+        raise ValueError("Damaged snapshot chunk")
+    payload = memoryview(payload)
+    columns = []
+    offset = 0
+    for _ in range(len(fields) + 1):
+        encoding, size = COLUMN.unpack_from(payload, offset)
+        offset += COLUMN.size
+        columns.append(decode_column(encoding, payload[offset:offset + size], count))
+        offset += size
+    if any(len(column) != count for column in columns):
+        raise ValueError("Damaged snapshot chunk")
+    return columns[0], columns[1:]
+
+
+def _read_chunks(read):
+    """
+    Yields the fields, the account numbers and the list of column values
+    of every chunk
+    """
+    fields = _read_header(read)
+    while True:
+        chunk = _read_chunk(read, fields)
+        if chunk is None:
+            return
+        yield fields, chunk[0], chunk[1]
+
+
+def _records(fields, numbers, columns):
+    """
+    The (account_number, record) pairs of a chunk. The records are
+    copies of a dictionary that already has every field, filled column
+    by column with operator.setitem: the loops run in C and the copies
+    never grow, which is about as quick as a dictionary display per row
+    and quicker than dict(zip(fields, row)).
+    """
+    records = list(map(dict.copy, itertools.repeat(dict.fromkeys(fields), len(numbers))))
+    for field, column in zip(fields, columns):
+        deque(map(setitem, records, itertools.repeat(field), column), maxlen=0)
+    return zip(numbers, records)
+
+
+def loads(data):
+    """
+    Returns the accounts of snapshot bytes, keyed by account number.
+    The garbage collector is paused meanwhile: the records are flat
+    dictionaries it has nothing to find in, but while they are created it
+    would go through all of them again and again.
+    """
+    users = {}
+    paused = gc.isenabled()
+    if paused:
+        gc.disable()
+    try:
+        for chunk in _read_chunks(io.BytesIO(data).read):
+            users.update(_records(*chunk))
+    finally:
+        if paused:
+            gc.enable()
+    return users
+
+
+def load(path):
+    """
+    Returns the accounts of a snapshot file, keyed by account number
+    """
+    with open(path, "rb") as f:
+        return loads(f.read())
+
+
+def iter_records(path):
+    """
+    Yields the (account_number, record) pairs of a snapshot file,
+    reading one chunk at a time
+    """
+    with open(path, "rb") as f:
+        for chunk in _read_chunks(f.read):
+            yield from _records(*chunk)
+
+
+def iter_columns(path):
+    """
+    Yields the chunks of a snapshot file as columns: the account numbers
+    of the chunk and a dictionary with the list of values of every
+    field. No record dictionary is built, which makes it the quickest way
+    to read the file when only some fields are needed.
+    """
+    with open(path, "rb") as f:
+        for fields, numbers, columns in _read_chunks(f.read):
+            yield numbers, dict(zip(fields, columns))
+
+
+def chunk_offsets(path):
+    """
+    The offsets of the chunks of a snapshot file, found by going from
+    chunk header to chunk header without reading the payloads, so the
+    chunks can then be read apart (see read_columns_at), e.g. by several
+    processes
+    """
+    with open(path, "rb") as f:
+        _read_header(f.read)
+        offsets = []
+        while True:
+            offset = f.tell()
+            count, length, _ = CHUNK.unpack(_exactly(f.read, CHUNK.size))
+            if count == 0:
+                return offsets
+            offsets.append(offset)
+            f.seek(length, os.SEEK_CUR)
+
+
+def read_columns_at(path, offsets):
+    """
+    Yields the chunks of a snapshot file at the given offsets (from
+    chunk_offsets) as columns, like iter_columns
+    """
+    with open(path, "rb") as f:
+        fields = _read_header(f.read)
+        for offset in offsets:
+            f.seek(offset)
+            chunk = _read_chunk(f.read, fields)
+            if chunk is None:
+                raise ValueError("No snapshot chunk at offset %d" % offset)
+            yield chunk[0], dict(zip(fields, chunk[1]))
+
+
+# ─── CONVERSION ─────────────────────────────────────────────────────────────────
+
+
+def _write_atomically(path, write, mode="wb"):
+    temporary_path = path + ".tmp"
+    options = {} if "b" in mode else {"newline": "", "encoding": "utf-8"}
+    with open(temporary_path, mode, **options) as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, path)
+
+
+def account_number_from_csv(value):
+    """
+    The account number of a bank.csv row. The files written by the old
+    pandas export hold the number as a date (the number read as
+    microseconds since the epoch), which is turned back into the number.
+    """
+    match = TIMESTAMP.match(value)
+    if not match:
+        return value
+    from datetime import datetime, timedelta
+    *fields, fraction = match.groups()
+    moment = datetime(*map(int, fields)) - datetime(1970, 1, 1)
+    return str(moment // timedelta(seconds=1) * 1000000 + int((fraction or "0").ljust(6, "0")))
+
+
+def read_csv(path):
+    """
+    Yields the (account_number, record) pairs of a bank.csv file. The
+    account numbers stay strings and the balances become floats.
+    """
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        key = "account_number" if "account_number" in reader.fieldnames else reader.fieldnames[0]
+        for row in reader:
+            record = {field: row[field] for field in ACCOUNT_FIELDS}
+            record["balance"] = float(record["balance"])
+            yield account_number_from_csv(row[key]), record
+
+
+def write_csv(f, records):
+    """
+    Writes (account_number, record) pairs as CSV, the account number as
+    the first column
+    """
+    writer = csv.writer(f)
+    writer.writerow(FIELDS)
+    for number, record in records:
+        writer.writerow([number] + [record[field] for field in ACCOUNT_FIELDS])
+
+
+def write_json(f, records):
+    """
+    Writes (account_number, record) pairs as the JSON object of bank.json,
+    one account at a time; the text is the same json.dumps() gives
+    """
+    f.write("{")
+    separator = ""
+    for number, record in records:
+        f.write(separator + json.dumps(number) + ": " + json.dumps(record))
+        separator = ", "
+    f.write("}")
+
+
+def read_json(path):
+    with open(path, "rb") as f:
+        return iter(json.loads(f.read()).items())
+
+
+def convert(source, target):
+    """
+    Converts between the .json, .csv and .snap formats, as told by the
+    extensions of the two files. Returns the number of accounts.
+    """
+    readers = {".json": read_json, ".csv": read_csv, EXTENSION: iter_records}
+    writers = {".json": (write_json, "w"), ".csv": (write_csv, "w"), EXTENSION: (write_records, "wb")}
+    source_format = os.path.splitext(source)[1].lower()
+    target_format = os.path.splitext(target)[1].lower()
+    if source_format not in readers or target_format not in writers:
+        raise ValueError("Can only convert between .json, .csv and %s files" % EXTENSION)
+    records = readers[source_format](source)
+    write, mode = writers[target_format]
+    count = 0
+
+    def counted():
+        nonlocal count
+        for record in records:
+            count += 1
+            yield record
+    _write_atomically(target, lambda f: write(f, counted()), mode)
+    return count
+
+
+# ─── MAIN ───────────────────────────────────────────────────────────────────────
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the accounts between bank.json, bank.csv and .snap files.")
+    parser.add_argument("source", help=".json, .csv or .snap file to read")
+    parser.add_argument("target", help=".json, .csv or .snap file to write")
+    arguments = parser.parse_args()
+    print("Converted", convert(arguments.source, arguments.target), "accounts")
@@ -0,0 +1,251 @@
+"""
+Consistent read snapshots of the accounts, so long reads (analyses,
+charts, a listing shown page after page) see the bank as it was at one
+moment while transfers keep committing.
+
+    with bank.snapshot() as users:
+        total = sum(user["balance"] for user in users.values())
+
+A snapshot is a version number, not a copy. The SnapshotManager follows
+the changes of the store as a listener and keeps its own current view
+of the accounts. While some snapshot is held, every change first saves
+the records it replaces in an undo log, tagged with the version of the
+change; a snapshot of version v reads an account from the current view,
+unless the account changed after v: then it reads the record the first
+such change replaced. A transfer is one change, so a snapshot sees it
+either whole or not at all.
+
+Undo records are kept only while a snapshot old enough to need them is
+held: when the oldest snapshot is released (or garbage collected) the
+records no held version needs anymore are dropped, and without
+snapshots nothing is saved at all. When the store reloads all the
+accounts, the manager starts a new view; the snapshots of the old one
+keep it, unchanged, until they are released.
+
+Writers only hold the manager's lock while it applies one change. A
+reader holds it to read one account, or, the first time it goes over
+all the accounts of its snapshot, to copy the references to the
+current records (not the records themselves, about 0.1 s per million
+accounts); after that it reads its copy without the lock. Records are
+shared with the store and must be treated as read-only, like the ones
+load() returns.
+"""
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import threading
+import weakref
+from collections import Counter, deque
+from collections.abc import ItemsView, Mapping, ValuesView
+
+# ─── VIEWS ──────────────────────────────────────────────────────────────────────
+
+
+class View:
+    """
+    The accounts between two reloads of the store: the current records,
+    and the undo log of the changes made while snapshots were held
+    """
+
+    __slots__ = ("current", "chains", "log", "readers")
+
+    def __init__(self, users):
+        self.current = dict(users)
+        # account number -> deque of (version, record the change replaced)
+        self.chains = {}
+        # deque of (version, account numbers), in the order of the changes
+        self.log = deque()
+        # version -> number of snapshots of that version
+        self.readers = Counter()
+
+    def value_at(self, account_number, version):
+        """
+        The record of an account at a version, None when it did not exist
+        """
+        chain = self.chains.get(account_number)
+        if chain:
+            for changed_at, record in chain:
+                if changed_at > version:
+                    return record
+        return self.current.get(account_number)
+
+    def prune(self):
+        """
+        Drops the undo records no held snapshot needs anymore
+        """
+        oldest = min(self.readers) if self.readers else None
+        while self.log and (oldest is None or self.log[0][0] <= oldest):
+            _, numbers = self.log.popleft()
+            for number in numbers:
+                chain = self.chains[number]
+                chain.popleft()
+                if not chain:
+                    del self.chains[number]
+
+
+# ─── SNAPSHOT ───────────────────────────────────────────────────────────────────
+
+
+class _Items(ItemsView):
+    def __iter__(self):
+        return zip(*self._mapping._accounts())
+
+
+class _Values(ValuesView):
+    def __iter__(self):
+        return iter(self._mapping._accounts()[1])
+
+
+class Snapshot(Mapping):
+    """
+    The accounts at one version, keyed by account number. A snapshot also
+    answers the read methods of a storage backend (load, get, find,
+    existing), so it can stand in for the store wherever only reads are
+    made. Release it with close() or a with block when done.
+    """
+
+    def __init__(self, manager, view, version):
+        self.version = version
+        self._manager = manager
+        self._view = view
+        self._accounts_at = None
+        self._release = weakref.finalize(self, manager._release, view, version)
+
+    def close(self):
+        self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    # ─── MAPPING ────────────────────────────────────────────────────────────
+
+    def get(self, account_number, default=None):
+        with self._manager._lock:
+            record = self._view.value_at(account_number, self.version)
+        return default if record is None else record
+
+    def __getitem__(self, account_number):
+        record = self.get(account_number)
+        if record is None:
+            raise KeyError(account_number)
+        return record
+
+    def __contains__(self, account_number):
+        return self.get(account_number) is not None
+
+    def _accounts(self):
+        """
+        The account numbers and records of the version, as two lists made
+        once: the references of the current view are copied (not the
+        records), then the accounts changed since the version are put
+        back as they were, and those created since left out
+        """
+        if self._accounts_at is None:
+            view = self._view
+            with self._manager._lock:
+                numbers = list(view.current)
+                records = list(view.current.values())
+                changed = {number: view.value_at(number, self.version) for number in view.chains}
+                removed = [number for number in changed if number not in view.current]
+            if changed:
+                pairs = [(number, changed.get(number, record)) for number, record in zip(numbers, records)]
+                pairs += [(number, changed[number]) for number in removed]
+                pairs = [pair for pair in pairs if pair[1] is not None]
+                numbers, records = [number for number, _ in pairs], [record for _, record in pairs]
+            self._accounts_at = numbers, records
+        return self._accounts_at
+
+    def __iter__(self):
+        return iter(self._accounts()[0])
+
+    def __len__(self):
+        return len(self._accounts()[0])
+
+    def items(self):
+        return _Items(self)
+
+    def values(self):
+        return _Values(self)
+
+    # ─── READS OF A BACKEND ─────────────────────────────────────────────────
+
+    def load(self):
+        return self
+
+    def find(self, field, value):
+        return {number: user for number, user in self.items() if user[field] == value}
+
+    def existing(self, account_numbers):
+        return set(number for number in account_numbers if number in self)
+
+
+# ─── SNAPSHOT MANAGER ───────────────────────────────────────────────────────────
+
+
+class SnapshotManager:
+    """
+    Hands out snapshots of the accounts of a store it is subscribed to
+    """
+
+    def __init__(self):
+        self.version = 0
+        self._view = View({})
+        # re-entrant: a snapshot garbage collected while the lock is held
+        # is released by the thread holding it
+        self._lock = threading.RLock()
+
+    # ─── LISTENER ───────────────────────────────────────────────────────────
+
+    def reset(self, users):
+        view = View(users)
+        with self._lock:
+            self.version += 1
+            self._view = view
+
+    def apply_changes(self, changes):
+        with self._lock:
+            self.version += 1
+            view = self._view
+            current = view.current
+            if view.readers:
+                numbers = []
+                for number, _, _ in changes:
+                    chain = view.chains.get(number)
+                    if chain is None:
+                        chain = view.chains[number] = deque()
+                    # as it was before this change, even when an account
+                    # changes twice within the change
+                    chain.append((self.version, current.get(number)))
+                    numbers.append(number)
+                view.log.append((self.version, numbers))
+            for number, _, new in changes:
+                if new is None:
+                    current.pop(number, None)
+                else:
+                    current[number] = new
+
+    # ─── SNAPSHOTS ──────────────────────────────────────────────────────────
+
+    def snapshot(self):
+        """
+        The accounts as they are now; nothing is copied
+        """
+        with self._lock:
+            view = self._view
+            view.readers[self.version] += 1
+            return Snapshot(self, view, self.version)
+
+    def _release(self, view, version):
+        with self._lock:
+            view.readers[version] -= 1
+            if not view.readers[version]:
+                del view.readers[version]
+            view.prune()
+
+    def undo_records(self):
+        """
+        The number of undo records kept for the held snapshots
+        """
+        with self._lock:
+            return sum(len(numbers) for _, numbers in self._view.log)
@@ -0,0 +1,102 @@
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import math
+import metrics
+
+
+# ─── SORT KEYS ──────────────────────────────────────────────────────────────────
+
+
+def parse_sort_fields(fields, descending=False):
+    """
+    Turns the different ways of asking for an order into a list of
+    (field, descending) pairs. A field can be given as a plain name,
+    as a list of names, or with a leading "-" to flip that single field
+    ("-balance" means highest balance first).
+    """
+    if isinstance(fields, str):
+        fields = [fields]
+    result = []
+    for field in fields:
+        if isinstance(field, tuple):
+            result.append((field[0], bool(field[1])))
+        elif field.startswith("-"):
+            result.append((field[1:], not descending))
+        else:
+            result.append((field, descending))
+    return result
+
+
+def extract_column(records, field):
+    """
+    Reads the value of one field out of every record, once. Sorting then
+    compares these plain values instead of indexing into the records on
+    every comparison.
+    """
+    return [record[field] for record in records]
+
+
+# ─── SORT ENGINE ────────────────────────────────────────────────────────────────
+
+
+def sort_order(records, fields, descending=False):
+    """
+    Returns the positions of the records in sorted order, without moving
+    the records themselves. The keys of every field are precomputed once,
+    then the positions are sorted one field at a time from the least to
+    the most significant one. Python's sort is stable, so every pass keeps
+    the order of the previous one for equal keys, which is what makes mixing
+    ascending and descending fields possible.
+    """
+    order = list(range(len(records)))
+    for field, field_descending in reversed(parse_sort_fields(fields, descending)):
+        column = extract_column(records, field)
+        order.sort(key=column.__getitem__, reverse=field_descending)
+    return order
+
+
+@metrics.timed("sort")
+def sort_records(records, fields, descending=False):
+    """
+    Sorts a list of account records by one or more fields and returns
+    a new list. The values are compared as they are stored, like the old
+    heap sort did, so distinct values come in the same order. The sort is
+    stable: records with equal values now keep their insertion order,
+    where the heap sort left them in no particular order.
+    """
+    records = list(records)
+    metrics.count("records_sorted", len(records))
+    return [records[i] for i in sort_order(records, fields, descending)]
+
+
+# ─── BINARY SEARCH ──────────────────────────────────────────────────────────────
+
+
+def make_text_searchable(text):
+    """
+    Make the text lowercase the text and removes spaces
+    """
+    return text.lower().replace(" ", "")
+
+
+def text_binary_search(input_list, field, query):
+    """
+    A custom binary search implementation that:
+    (1) Assumes the input_list to have elements of type object
+        and then sorts by a common key in all those objects name
+        "field"
+    (2) Make the text lowercase and trims the text in the fields
+        so for example "foo bar" can match "FooBar"
+    """
+    low = 0
+    high = len(input_list) - 1
+    query = make_text_searchable(query)
+    while low <= high:
+        mid = math.floor((low + high) / 2)
+        value = make_text_searchable(input_list[mid][field])
+        if value > query:
+            high = mid - 1
+        elif value < query:
+            low = mid + 1
+        else:
+            return mid
+    return -1
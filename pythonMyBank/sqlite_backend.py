@@ -0,0 +1,211 @@
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import queue
+import sqlite3
+from contextlib import contextmanager
+import metrics
+from backends import ACCOUNT_FIELDS, StorageBackend
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+POOL_SIZE = 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    account_number TEXT PRIMARY KEY,
+    full_name TEXT,
+    gender TEXT,
+    balance REAL,
+    account_creation_date TEXT,
+    city TEXT,
+    phone_number TEXT,
+    age TEXT,
+    country TEXT
+);
+CREATE INDEX IF NOT EXISTS accounts_full_name ON accounts (full_name);
+CREATE INDEX IF NOT EXISTS accounts_city ON accounts (city);
+CREATE INDEX IF NOT EXISTS accounts_country ON accounts (country);
+"""
+
+COLUMNS = ", ".join(["account_number"] + ACCOUNT_FIELDS)
+PLACEHOLDERS = ", ".join("?" * (len(ACCOUNT_FIELDS) + 1))
+
+
+# ─── CONNECTION POOL ────────────────────────────────────────────────────────────
+
+
+class ConnectionPool:
+    """
+    A fixed number of open connections to one database file that are
+    handed out and taken back, so an operation does not pay for opening
+    the database every time.
+    """
+
+    def __init__(self, path, size=POOL_SIZE):
+        self.path = path
+        self._idle = queue.Queue()
+        for _ in range(size):
+            connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA busy_timeout=5000")
+            self._idle.put(connection)
+        self.size = size
+
+    @contextmanager
+    def connection(self):
+        """
+        Borrows a connection for the duration of a with block
+        """
+        connection = self._idle.get()
+        try:
+            yield connection
+        finally:
+            self._idle.put(connection)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Borrows a connection and runs the with block as one transaction,
+        rolled back if the block fails
+        """
+        with self.connection() as connection:
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            connection.execute("COMMIT")
+
+    def close(self):
+        for _ in range(self.size):
+            self._idle.get().close()
+
+
+# ─── SQLITE BACKEND ─────────────────────────────────────────────────────────────
+
+
+def row_to_account(row):
+    """
+    Turns a table row (without the account number) into the
+    dictionary form used in bank.json
+    """
+    return dict(zip(ACCOUNT_FIELDS, row))
+
+
+class SqliteBackend(StorageBackend):
+    """
+    Keeps the accounts in a SQLite table with the account number as the
+    primary key and indexes on full_name, city and country. Reading or
+    changing a single account is a B-tree lookup, so it does not load the
+    other accounts.
+
+    Listeners only see the changes made through this object, not the ones
+    other processes make to the same database.
+    """
+
+    def __init__(self, path, pool_size=POOL_SIZE):
+        super().__init__()
+        self.path = path
+        self.version = 0
+        self.pool = ConnectionPool(path, pool_size)
+        with self.pool.connection() as connection:
+            connection.executescript(SCHEMA)
+
+    @metrics.timed("store.read_snapshot")
+    def load(self):
+        with self.pool.connection() as connection:
+            rows = connection.execute("SELECT " + COLUMNS + " FROM accounts").fetchall()
+        metrics.count("records_read", len(rows))
+        return {row[0]: row_to_account(row[1:]) for row in rows}
+
+    @staticmethod
+    def _get(connection, account_number):
+        row = connection.execute("SELECT " + COLUMNS + " FROM accounts WHERE account_number = ?",
+                                 (account_number,)).fetchone()
+        return None if row is None else row_to_account(row[1:])
+
+    def get(self, account_number):
+        with self.pool.connection() as connection:
+            return self._get(connection, account_number)
+
+    def find(self, field, value):
+        if field not in ACCOUNT_FIELDS:
+            raise ValueError("Unknown field: " + field)
+        with self.pool.connection() as connection:
+            rows = connection.execute("SELECT " + COLUMNS + " FROM accounts WHERE " + field + " = ?",
+                                      (value,)).fetchall()
+        return {row[0]: row_to_account(row[1:]) for row in rows}
+
+    def existing(self, account_numbers):
+        account_numbers = list(account_numbers)
+        taken = set()
+        with self.pool.connection() as connection:
+            for start in range(0, len(account_numbers), 500):
+                chunk = account_numbers[start:start + 500]
+                rows = connection.execute("SELECT account_number FROM accounts WHERE account_number IN ("
+                                          + ", ".join("?" * len(chunk)) + ")", chunk).fetchall()
+                taken.update(row[0] for row in rows)
+        return taken
+
+    @metrics.timed("store.commit")
+    def _write(self, numbers, statements):
+        """
+        Runs the statements as one transaction. When there are listeners,
+        the given accounts are read before and after it so the change can
+        be reported; the listener lock keeps the reports in commit order.
+        """
+        with self._listener_lock:
+            with self.pool.transaction() as connection:
+                old = [self._get(connection, number) for number in numbers] if self._listeners else None
+                for sql, parameters in statements:
+                    if parameters and isinstance(parameters[0], (list, tuple)):
+                        connection.executemany(sql, parameters)
+                    else:
+                        connection.execute(sql, parameters)
+                new = [self._get(connection, number) for number in numbers] if self._listeners else None
+            self.version += 1
+            metrics.count("records_written", len(numbers))
+            if self._listeners:
+                self._notify(list(zip(numbers, old, new)))
+
+    def put(self, account_number, record, durable=True):
+        values = [account_number] + [record[field] for field in ACCOUNT_FIELDS]
+        self._write([account_number], [
+            ("INSERT OR REPLACE INTO accounts (" + COLUMNS + ") VALUES (" + PLACEHOLDERS + ")", values)])
+
+    def put_many(self, records, durable=True):
+        if not records:
+            return
+        rows = [[number] + [record[field] for field in ACCOUNT_FIELDS] for number, record in records.items()]
+        self._write(list(records), [
+            ("INSERT OR REPLACE INTO accounts (" + COLUMNS + ") VALUES (" + PLACEHOLDERS + ")", rows)])
+
+    def delete(self, account_number, durable=True):
+        self._write([account_number], [("DELETE FROM accounts WHERE account_number = ?", [account_number])])
+
+    def transfer(self, sender_number, receiver_number, amount, durable=True):
+        self._write([sender_number, receiver_number], [
+            ("UPDATE accounts SET balance = balance - ? WHERE account_number = ?", [amount, sender_number]),
+            ("UPDATE accounts SET balance = balance + ? WHERE account_number = ?", [amount, receiver_number])])
+
+    def apply_deltas(self, deltas, durable=True):
+        if not deltas:
+            return
+        self._write(list(deltas), [
+            ("UPDATE accounts SET balance = balance + ? WHERE account_number = ?",
+             [(amount, number) for number, amount in deltas.items()])])
+
+    def save(self, users):
+        rows = [[number] + [user[field] for field in ACCOUNT_FIELDS] for number, user in users.items()]
+        with self._listener_lock:
+            with self.pool.transaction() as connection:
+                connection.execute("DELETE FROM accounts")
+                if rows:
+                    connection.executemany("INSERT INTO accounts (" + COLUMNS + ") VALUES (" + PLACEHOLDERS + ")",
+                                           rows)
+            self.version += 1
+            self._notify_reset(dict(users))
+
+    def close(self):
+        self.pool.close()
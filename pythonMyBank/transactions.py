@@ -0,0 +1,136 @@
+# ─── IMPORTS ────────────────────────────────────────────────────────────────────
+import math
+import metrics
+from locking import LockManager
+
+# ─── CONSTANTS ──────────────────────────────────────────────────────────────────
+
+TRANSFERRED = "transferred"
+UNKNOWN_SENDER = "unknown sender"
+UNKNOWN_RECEIVER = "unknown receiver"
+INSUFFICIENT_BALANCE = "insufficient balance"
+UNKNOWN_ACCOUNT = "unknown account"
+HELD = "held as suspicious"
+INVALID_AMOUNT = "invalid amount"
+SAME_ACCOUNT = "same sender and receiver"
+DONE = "done"
+
+
+# ─── TRANSACTION ENGINE ─────────────────────────────────────────────────────────
+
+
+def valid_amount(amount):
+    """
+    Whether an amount can be transferred: a finite number above zero
+    (so neither negative, nor NaN, nor infinite)
+    """
+    return math.isfinite(amount) and amount > 0
+
+
+class TransactionEngine:
+    """
+    Runs the operations that change accounts so they can be called at
+    the same time from many threads and from several processes working
+    on the same bank.
+
+    Every operation locks the accounts it touches (see LockManager),
+    then reads them fresh from the store, checks them and writes the
+    change. A transfer holds the locks of both accounts, so its balance
+    check and the debit/credit cannot be interleaved with another change
+    of the same accounts. The store writes the debit and the credit as
+    one atomic change.
+
+    With a ledger (see ledger.py), every transfer is also recorded there
+    with the resulting balances, while the locks are still held, so the
+    entries of an account are in the order its balance changed. The
+    entry is written after the store committed the transfer: a crash
+    in between leaves the transfer made but missing from the ledger.
+
+    With a detector (see anomaly.py), every transfer that passes the
+    checks is looked at before it is made; a suspicious one is flagged,
+    or not made at all (HELD) when the rules say to hold it.
+    """
+
+    def __init__(self, store, lock_path=None, ledger=None, detector=None):
+        self.store = store
+        self.ledger = ledger
+        self.detector = detector
+        self.locks = LockManager(lock_path or store.path + ".accounts.lock")
+
+    @metrics.timed("transaction.transfer")
+    def transfer(self, sender_number, receiver_number, amount, durable=True):
+        """
+        Moves money from one account to another. Returns the outcome
+        (TRANSFERRED or the reason of the refusal) with the sender and
+        receiver accounts as they were before the transfer. An amount that
+        is not valid_amount() or a transfer from an account to itself is
+        refused before any lock is taken, with no accounts.
+        """
+        if not valid_amount(amount):
+            return INVALID_AMOUNT, None, None
+        if sender_number == receiver_number:
+            return SAME_ACCOUNT, None, None
+        with self.locks.locked(sender_number, receiver_number):
+            sender = self.store.get(sender_number)
+            receiver = self.store.get(receiver_number)
+            if sender is None:
+                return UNKNOWN_SENDER, sender, receiver
+            if receiver is None:
+                return UNKNOWN_RECEIVER, sender, receiver
+            if sender["balance"] < amount:
+                return INSUFFICIENT_BALANCE, sender, receiver
+            if self.detector is not None:
+                alert = self.detector.inspect(sender_number, receiver_number, amount)
+                if alert is not None and alert["held"]:
+                    return HELD, sender, receiver
+            self.store.transfer(sender_number, receiver_number, amount, durable)
+            if self.ledger is not None:
+                self.ledger.record(sender_number, receiver_number, amount, sender["balance"] - amount,
+                                   receiver["balance"] + amount, durable)
+        return TRANSFERRED, sender, receiver
+
+    @metrics.timed("transaction.create")
+    def create(self, account_number, record):
+        """
+        Opens an account under a new account number
+        """
+        with self.locks.locked(account_number):
+            self.store.put(account_number, record)
+        return DONE
+
+    @metrics.timed("transaction.create_many")
+    def create_many(self, records):
+        """
+        Opens many accounts, under new account numbers, as one atomic
+        change. Nobody else can know the new numbers yet, so no account
+        locks are needed.
+        """
+        self.store.put_many(records)
+        return DONE
+
+    @metrics.timed("transaction.update")
+    def update(self, account_number, changes):
+        """
+        Changes some fields of an account. Only the given fields are
+        written, on top of the account as it is when the lock is held,
+        so a transfer that happened meanwhile is not undone.
+        """
+        with self.locks.locked(account_number):
+            user = self.store.get(account_number)
+            if user is None:
+                return UNKNOWN_ACCOUNT
+            user = dict(user)
+            user.update(changes)
+            self.store.put(account_number, user)
+        return DONE
+
+    @metrics.timed("transaction.delete")
+    def delete(self, account_number):
+        """
+        Removes an account
+        """
+        with self.locks.locked(account_number):
+            if self.store.get(account_number) is None:
+                return UNKNOWN_ACCOUNT
+            self.store.delete(account_number)
+        return DONE